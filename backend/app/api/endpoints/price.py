@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel, Field
+import inspect
 import logging
+import os
 from app.services.price_service.price_manager import PriceManager
+from app.services.price_service.remote_price_manager import RemotePriceManager
 from app.services.price_service.exchange_info import exchange_info_service
 
 logger = logging.getLogger(__name__)
@@ -10,17 +13,72 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # 創建一個全局的PriceManager實例
-price_manager = PriceManager()
+# PRICE_INGEST_MODE=shared 時行情由獨立進程（ingest_service）接入，本進程從共享內存讀取價格
+if os.environ.get("PRICE_INGEST_MODE", "local").lower() == "shared":
+    price_manager = RemotePriceManager()
+else:
+    price_manager = PriceManager()
+
+async def _resolve(result: Any) -> Any:
+    """
+    取得 price_manager 查詢方法的結果：RemotePriceManager 的查詢是協程（遠程調用在線程中執行，不阻塞事件循環），
+    PriceManager 的查詢直接返回結果
+    
+    Args:
+        result: 查詢方法的返回值
+    
+    Returns:
+        查詢結果
+    """
+    if inspect.isawaitable(result):
+        return await result
+    return result
 
 # 請求和響應模型
 class SymbolSubscribeRequest(BaseModel):
     symbol: str = Field(..., description="交易對符號，例如 'BTC/USDT'")
     exchanges: List[str] = Field(..., description="交易所ID列表，例如 ['binance', 'okx']")
     marketType: str = Field("spot", description="市場類型，例如 'spot'、'futures'、'swap'")
+    consumer: Optional[str] = Field(None, description="使用者ID（例如前端分頁或策略ID），同一交易對在所有使用者都取消後才會取消訂閱")
 
 class SymbolUnsubscribeRequest(BaseModel):
     symbol: str = Field(..., description="交易對符號，例如 'BTC/USDT'")
     exchanges: Optional[List[str]] = Field(None, description="交易所ID列表，如果為空則取消所有交易所的訂閱")
+    consumer: Optional[str] = Field(None, description="使用者ID（例如前端分頁或策略ID），同一交易對在所有使用者都取消後才會取消訂閱")
+    force: bool = Field(False, description="是否忽略其他使用者立即取消訂閱")
+
+class BatchSubscribeRequest(BaseModel):
+    symbols: List[str] = Field(..., description="交易對符號列表，例如 ['BTC/USDT', 'ETH/USDT']")
+    exchanges: List[str] = Field(..., description="交易所ID列表，例如 ['binance', 'okx']")
+    marketType: str = Field("spot", description="市場類型，例如 'spot'、'futures'、'swap'")
+    consumer: Optional[str] = Field(None, description="使用者ID（例如前端分頁或策略ID），同一交易對在所有使用者都取消後才會取消訂閱")
+
+class BatchUnsubscribeRequest(BaseModel):
+    symbols: List[str] = Field(..., description="交易對符號列表，例如 ['BTC/USDT', 'ETH/USDT']")
+    exchanges: Optional[List[str]] = Field(None, description="交易所ID列表，如果為空則取消所有交易所的訂閱")
+    consumer: Optional[str] = Field(None, description="使用者ID（例如前端分頁或策略ID），同一交易對在所有使用者都取消後才會取消訂閱")
+    force: bool = Field(False, description="是否忽略其他使用者立即取消訂閱")
+
+class OrderBookSubscribeRequest(BaseModel):
+    symbol: str = Field(..., description="交易對符號，例如 'BTC/USDT'")
+    exchange: str = Field(..., description="交易所ID，例如 'binance'")
+    marketType: str = Field("spot", description="市場類型，例如 'spot'、'futures'、'swap'")
+
+class AlertCreateRequest(BaseModel):
+    symbol: str = Field(..., description="交易對符號，例如 'BTC/USDT'")
+    exchange: str = Field(..., description="交易所ID，例如 'binance'")
+    direction: str = Field(..., description="觸發方向：'above'（向上穿越）或 'below'（向下穿越）")
+    threshold: float = Field(..., description="閾值價格")
+    mode: str = Field("once", description="'once'（觸發一次）或 'repeat'（重複觸發）")
+    hysteresis: Optional[float] = Field(None, description="重複警報觸發後價格需要反向越過的回差，默認為閾值的0.1%")
+    note: Optional[str] = Field(None, description="備註")
+
+class AlertUpdateRequest(BaseModel):
+    direction: Optional[str] = Field(None, description="觸發方向：'above' 或 'below'")
+    threshold: Optional[float] = Field(None, description="閾值價格")
+    mode: Optional[str] = Field(None, description="'once' 或 'repeat'")
+    hysteresis: Optional[float] = Field(None, description="回差，不提供時按新的閾值和模式使用默認值")
+    note: Optional[str] = Field(None, description="備註")
 
 class PriceResponse(BaseModel):
     symbol: str
@@ -30,8 +88,10 @@ class PriceResponse(BaseModel):
 # 啟動和關閉事件
 @router.on_event("startup")
 async def startup_price_service():
-    """啟動價格服務"""
+    """啟動價格服務，本地接入行情時從快照恢復訂閱和價格"""
     logger.info("正在初始化價格服務...")
+    if isinstance(price_manager, PriceManager):
+        price_manager.restore_snapshot()
 
 @router.on_event("shutdown")
 async def shutdown_price_service():
@@ -48,7 +108,8 @@ async def subscribe_symbol(request: SymbolSubscribeRequest):
         results = await price_manager.subscribe_symbol(
             request.symbol, 
             request.exchanges,
-            market_type=request.marketType
+            market_type=request.marketType,
+            consumer=request.consumer
         )
         
         # 檢查是否全部成功
@@ -78,7 +139,12 @@ async def unsubscribe_symbol(request: SymbolUnsubscribeRequest):
     """取消訂閱交易對價格"""
     try:
         logger.info(f"取消訂閱交易對: {request.symbol}，交易所: {request.exchanges or '所有交易所'}")
-        results = await price_manager.unsubscribe_symbol(request.symbol, request.exchanges)
+        results = await price_manager.unsubscribe_symbol(
+            request.symbol,
+            request.exchanges,
+            consumer=request.consumer,
+            force=request.force
+        )
         
         return {
             "success": True,
@@ -92,9 +158,384 @@ async def unsubscribe_symbol(request: SymbolUnsubscribeRequest):
             detail=str(e)
         )
 
+@router.post("/subscribe/batch", status_code=status.HTTP_200_OK)
+async def subscribe_symbols(request: BatchSubscribeRequest):
+    """批量訂閱交易對價格，所有交易對在一次請求中完成"""
+    try:
+        logger.info(f"批量訂閱{len(request.symbols)}個交易對，交易所: {request.exchanges}，市場類型: {request.marketType}")
+        results = await price_manager.subscribe_symbols(
+            request.symbols,
+            request.exchanges,
+            market_type=request.marketType,
+            consumer=request.consumer
+        )
+        
+        failed = [symbol for symbol, details in results.items() if not all(details.values())]
+        return {
+            "success": not failed,
+            "message": f"成功訂閱 {len(results) - len(failed)}/{len(results)} 個交易對",
+            "failed": failed,
+            "details": results
+        }
+    except Exception as e:
+        logger.error(f"批量訂閱交易對失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/unsubscribe/batch", status_code=status.HTTP_200_OK)
+async def unsubscribe_symbols(request: BatchUnsubscribeRequest):
+    """批量取消訂閱交易對價格"""
+    try:
+        logger.info(f"批量取消訂閱{len(request.symbols)}個交易對，交易所: {request.exchanges or '所有交易所'}")
+        results = await price_manager.unsubscribe_symbols(
+            request.symbols,
+            request.exchanges,
+            consumer=request.consumer,
+            force=request.force
+        )
+        
+        failed = [symbol for symbol, details in results.items() if not all(details.values())]
+        return {
+            "success": not failed,
+            "message": f"成功取消訂閱 {len(results) - len(failed)}/{len(results)} 個交易對",
+            "failed": failed,
+            "details": results
+        }
+    except Exception as e:
+        logger.error(f"批量取消訂閱交易對失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/orderbook/subscribe", status_code=status.HTTP_200_OK)
+async def subscribe_order_book(request: OrderBookSubscribeRequest):
+    """訂閱交易對的本地訂單簿"""
+    try:
+        logger.info(f"訂閱訂單簿: {request.symbol}，交易所: {request.exchange}，市場類型: {request.marketType}")
+        success = await price_manager.subscribe_order_book(
+            request.symbol,
+            request.exchange,
+            market_type=request.marketType
+        )
+        
+        return {
+            "success": success,
+            "message": f"成功訂閱訂單簿 {request.symbol}" if success else f"訂閱訂單簿 {request.symbol} 失敗"
+        }
+    except Exception as e:
+        logger.error(f"訂閱訂單簿失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/orderbook/unsubscribe", status_code=status.HTTP_200_OK)
+async def unsubscribe_order_book(request: OrderBookSubscribeRequest):
+    """取消訂閱交易對的本地訂單簿"""
+    try:
+        logger.info(f"取消訂閱訂單簿: {request.symbol}，交易所: {request.exchange}")
+        success = await price_manager.unsubscribe_order_book(
+            request.symbol,
+            request.exchange,
+            market_type=request.marketType
+        )
+        
+        return {
+            "success": success,
+            "message": f"成功取消訂閱訂單簿 {request.symbol}" if success else f"取消訂閱訂單簿 {request.symbol} 失敗"
+        }
+    except Exception as e:
+        logger.error(f"取消訂閱訂單簿失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/orderbook/{symbol_base}/{symbol_quote}", status_code=status.HTTP_200_OK)
+async def get_order_book(symbol_base: str, symbol_quote: str, exchange: str,
+                         marketType: str = "spot", depth: int = 10):
+    """獲取交易對本地訂單簿的最優買賣價和前N檔"""
+    try:
+        symbol = f"{symbol_base}/{symbol_quote}"
+        book = await _resolve(price_manager.get_order_book(symbol, exchange, market_type=marketType, depth=depth))
+        
+        if book is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到交易對 {symbol} 的訂單簿，請先訂閱"
+            )
+        
+        return {
+            "success": True,
+            "orderBook": book
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"獲取訂單簿失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/candles/{symbol_base}/{symbol_quote}", status_code=status.HTTP_200_OK)
+async def get_candles(symbol_base: str, symbol_quote: str, exchange: str,
+                      interval: str = "1m", limit: int = 100):
+    """獲取由實時價格生成的最近K線（1s/1m/5m/1h）"""
+    try:
+        symbol = f"{symbol_base}/{symbol_quote}"
+        candles = await _resolve(price_manager.get_candles(symbol, exchange, interval=interval, limit=limit))
+        
+        if candles is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到交易對 {symbol} 的K線數據，請先訂閱"
+            )
+        
+        return {
+            "success": True,
+            "symbol": symbol,
+            "exchange": exchange,
+            "interval": interval,
+            "candles": candles
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"獲取K線失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/history/{symbol_base}/{symbol_quote}", status_code=status.HTTP_200_OK)
+async def get_price_history(symbol_base: str, symbol_quote: str, exchange: str,
+                            limit: Optional[int] = None, start: Optional[int] = None, end: Optional[int] = None):
+    """獲取交易對最近的價格歷史（最近N個tick，或 start/end 毫秒時間窗口內的tick）"""
+    try:
+        symbol = f"{symbol_base}/{symbol_quote}"
+        if limit is not None and limit < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="limit 不能小於0"
+            )
+        
+        history = await _resolve(price_manager.get_price_history(symbol, exchange, limit=limit, start_ms=start, end_ms=end))
+        
+        if history is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到交易對 {symbol} 的價格歷史，請先訂閱"
+            )
+        
+        return {
+            "success": True,
+            "symbol": symbol,
+            "exchange": exchange,
+            "count": len(history),
+            "timestamps": history.timestamps.tolist(),
+            "prices": history.prices.tolist()
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"獲取價格歷史失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/spreads", status_code=status.HTTP_200_OK)
+async def get_top_spreads(limit: Optional[int] = None):
+    """獲取跨交易所價差（基點）最大的交易對"""
+    try:
+        return {
+            "success": True,
+            "spreads": await _resolve(price_manager.get_top_spreads(limit))
+        }
+    except Exception as e:
+        logger.error(f"獲取價差排行失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/spreads/{symbol_base}/{symbol_quote}", status_code=status.HTTP_200_OK)
+async def get_spread(symbol_base: str, symbol_quote: str):
+    """獲取交易對在各交易所之間的價差"""
+    try:
+        symbol = f"{symbol_base}/{symbol_quote}"
+        spread = await _resolve(price_manager.get_spread(symbol))
+        
+        if spread is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到交易對 {symbol} 的價差，需要在至少兩個交易所訂閱"
+            )
+        
+        return {
+            "success": True,
+            "spread": spread
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"獲取價差失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/alerts", status_code=status.HTTP_200_OK)
+async def create_alert(request: AlertCreateRequest):
+    """創建價格警報，警報只在價格穿越閾值時觸發（交易對需要另外訂閱）"""
+    try:
+        alert = await _resolve(price_manager.add_alert(
+            request.symbol, request.exchange, request.direction, request.threshold,
+            mode=request.mode, hysteresis=request.hysteresis, note=request.note
+        ))
+        return {
+            "success": True,
+            "alert": alert
+        }
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"創建價格警報失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/alerts", status_code=status.HTTP_200_OK)
+async def get_alerts(symbol: Optional[str] = None, exchange: Optional[str] = None):
+    """列出價格警報，可按交易對和交易所過濾"""
+    try:
+        alerts = await _resolve(price_manager.get_alerts(symbol=symbol, exchange_id=exchange))
+        return {
+            "success": True,
+            "count": len(alerts),
+            "alerts": alerts
+        }
+    except Exception as e:
+        logger.error(f"獲取價格警報失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/alerts/events", status_code=status.HTTP_200_OK)
+async def get_alert_events(limit: int = 100):
+    """獲取最近的警報觸發記錄（從新到舊）"""
+    try:
+        return {
+            "success": True,
+            "events": await _resolve(price_manager.get_alert_events(limit)),
+            "stats": await _resolve(price_manager.get_alert_stats())
+        }
+    except Exception as e:
+        logger.error(f"獲取警報觸發記錄失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/alerts/{alert_id}", status_code=status.HTTP_200_OK)
+async def get_alert(alert_id: int):
+    """獲取價格警報"""
+    try:
+        alert = await _resolve(price_manager.get_alert(alert_id))
+        
+        if alert is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到價格警報 {alert_id}"
+            )
+        
+        return {
+            "success": True,
+            "alert": alert
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"獲取價格警報失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.patch("/alerts/{alert_id}", status_code=status.HTTP_200_OK)
+async def update_alert(alert_id: int, request: AlertUpdateRequest):
+    """修改價格警報，修改後按當前價格重新生效（已觸發的一次性警報也會重新生效）"""
+    try:
+        # direction/threshold/mode 為null時視為不修改，hysteresis/note 為null時分別恢復默認值和清空
+        changes = {key: value for key, value in request.model_dump(exclude_unset=True).items()
+                   if value is not None or key in ("hysteresis", "note")}
+        alert = await _resolve(price_manager.update_alert(alert_id, **changes))
+        
+        if alert is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到價格警報 {alert_id}"
+            )
+        
+        return {
+            "success": True,
+            "alert": alert
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"修改價格警報失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.delete("/alerts/{alert_id}", status_code=status.HTTP_200_OK)
+async def delete_alert(alert_id: int):
+    """刪除價格警報"""
+    try:
+        if not await _resolve(price_manager.remove_alert(alert_id)):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到價格警報 {alert_id}"
+            )
+        
+        return {
+            "success": True,
+            "message": f"已刪除價格警報 {alert_id}"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"刪除價格警報失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.get("/latest/{symbol_base}/{symbol_quote}", status_code=status.HTTP_200_OK)
-async def get_latest_price(symbol_base: str, symbol_quote: str, exchange: Optional[str] = None):
-    """獲取交易對的最新價格"""
+async def get_latest_price(symbol_base: str, symbol_quote: str, exchange: Optional[str] = None,
+                           stats: bool = False):
+    """獲取交易對的最新價格，stats=true 時同時返回各窗口的EMA、收益率波動率和z分數"""
     try:
         symbol = f"{symbol_base}/{symbol_quote}"
         prices = price_manager.get_latest_price(symbol, exchange)
@@ -106,15 +547,20 @@ async def get_latest_price(symbol_base: str, symbol_quote: str, exchange: Option
             )
         
         # 獲取市場類型
-        market_types = price_manager.get_symbol_market_types(symbol)
+        market_types = await _resolve(price_manager.get_symbol_market_types(symbol))
         
         import time
-        return {
+        response = {
             "symbol": symbol,
             "prices": prices,
             "marketTypes": market_types,
+            # 從快照恢復、尚未收到新價格的交易所
+            "stale": price_manager.get_restored_exchanges(symbol),
             "timestamp": int(time.time())
         }
+        if stats:
+            response["stats"] = await _resolve(price_manager.get_price_stats(symbol, exchange))
+        return response
     except HTTPException:
         raise
     except Exception as e:
@@ -128,7 +574,7 @@ async def get_latest_price(symbol_base: str, symbol_quote: str, exchange: Option
 async def get_subscriptions():
     """獲取所有已訂閱的交易對"""
     try:
-        subscriptions = price_manager.get_subscribed_symbols()
+        subscriptions = await _resolve(price_manager.get_subscribed_symbols())
         return {
             "success": True,
             "subscriptions": subscriptions
@@ -144,10 +590,19 @@ async def get_subscriptions():
 async def get_price_service_status():
     """獲取價格服務狀態"""
     try:
-        status = price_manager.get_exchange_status()
+        status = await _resolve(price_manager.get_exchange_status())
         return {
             "success": True,
-            "status": status
+            "status": status,
+            "connections": await _resolve(price_manager.get_connection_load()),
+            "endpoints": await _resolve(price_manager.get_endpoint_stats()),
+            "staleness": await _resolve(price_manager.get_staleness()),
+            "publish": await _resolve(price_manager.get_publish_stats()),
+            "subscriptions": await _resolve(price_manager.get_subscription_stats()),
+            "history": await _resolve(price_manager.get_history_stats()),
+            "rollingStats": await _resolve(price_manager.get_rolling_stats_usage()),
+            "subscribers": await _resolve(price_manager.get_subscriber_stats()),
+            "alerts": await _resolve(price_manager.get_alert_stats())
         }
     except Exception as e:
         logger.error(f"獲取服務狀態失敗: {e}")
@@ -156,6 +611,21 @@ async def get_price_service_status():
             detail=str(e)
         )
 
+@router.get("/latency", status_code=status.HTTP_200_OK)
+async def get_latency_stats(reset: bool = False):
+    """獲取各交易所的行情延遲分佈：網絡（交易所→收到）、處理（收到→回調完成）及總延遲"""
+    try:
+        return {
+            "success": True,
+            "latency": await _resolve(price_manager.get_latency_stats(reset=reset))
+        }
+    except Exception as e:
+        logger.error(f"獲取延遲統計失敗: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.get("/symbols/{market_type}", status_code=status.HTTP_200_OK)
 async def get_available_symbols(market_type: str, force_refresh: bool = False):
     """
@@ -0,0 +1,474 @@
+"""
+價格警報引擎
+
+每個(交易所, 交易對)的警報按觸發價位存放在排序數組中，每個tick只需比較數組末端的一個價位，
+有警報被穿越時再二分查找穿越的位置並整段取出，不會逐個檢查所有警報，
+因此每個tick的成本與警報數量無關（只與實際觸發的數量有關）。
+
+警報只在價格「穿越」閾值時觸發：向上警報（above）在價格從閾值下方升到閾值或以上時觸發，
+向下警報（below）相反。創建時價格已經在閾值另一側（或正好在閾值上）的警報，
+要等價格先嚴格回到閾值這一側才會生效，價格停在閾值上不算穿越。
+
+一次性警報（once）觸發後不再觸發；重複警報（repeat）觸發後需要價格反向嚴格越過 閾值 ± 回差（hysteresis）
+才重新生效，避免價格在閾值附近來回波動時反覆觸發。
+"""
+
+import itertools
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Deque, Dict, List, Optional, Any, Tuple
+
+# 警報方向
+ABOVE = "above"
+BELOW = "below"
+
+# 警報模式
+ONCE = "once"
+REPEAT = "repeat"
+
+# 警報狀態
+ARMED = "armed"          # 等待價格穿越閾值
+WAITING = "waiting"      # 等待價格回到閾值這一側（創建時已在另一側，或重複警報觸發後）
+TRIGGERED = "triggered"  # 一次性警報已觸發
+
+# 重複警報沒有指定回差時使用閾值的 0.1%
+DEFAULT_HYSTERESIS_RATIO = 0.001
+
+_EMPTY: List[int] = []
+
+
+class _Levels:
+    """
+    按價位排序的警報ID數組，所有價位都在同一方向被穿越時觸發
+    
+    rising 為True時價格升到價位或以上時觸發，否則價格跌到價位或以下時觸發；
+    strict 為True時價格需要嚴格越過價位（高於或低於），到達價位不算。
+    排序鍵取 價位 或 -價位，使已被穿越的警報總是位於數組末端，取出時只需截斷。
+    """
+    
+    __slots__ = ("rising", "strict", "keys", "ids")
+    
+    def __init__(self, rising: bool, strict: bool = False):
+        self.rising = rising
+        self.strict = strict
+        self.keys: List[float] = []
+        self.ids: List[int] = []
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def add(self, level: float, alert_id: int) -> None:
+        """加入警報"""
+        key = -level if self.rising else level
+        index = bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.ids.insert(index, alert_id)
+    
+    def remove(self, level: float, alert_id: int) -> bool:
+        """移除警報，返回是否找到"""
+        key = -level if self.rising else level
+        keys = self.keys
+        ids = self.ids
+        for index in range(bisect_left(keys, key), bisect_right(keys, key)):
+            if ids[index] == alert_id:
+                del keys[index]
+                del ids[index]
+                return True
+        return False
+    
+    def pop_crossed(self, price: float) -> List[int]:
+        """取出所有被價格穿越的警報"""
+        keys = self.keys
+        key = -price if self.rising else price
+        if self.strict:
+            if not keys or keys[-1] <= key:
+                return _EMPTY
+            index = bisect_right(keys, key)
+        else:
+            if not keys or keys[-1] < key:
+                return _EMPTY
+            index = bisect_left(keys, key)
+        
+        crossed = self.ids[index:]
+        del keys[index:]
+        del self.ids[index:]
+        return crossed
+
+
+class Alert:
+    """
+    單個價格警報
+    """
+    
+    __slots__ = ("id", "exchange_id", "symbol", "direction", "threshold", "mode", "hysteresis", "note",
+                 "state", "created_at", "trigger_count", "last_triggered_at", "last_trigger_price")
+    
+    def __init__(self, alert_id: int, exchange_id: str, symbol: str, direction: str, threshold: float,
+                 mode: str, hysteresis: float, note: Optional[str]):
+        self.id = alert_id
+        self.exchange_id = exchange_id
+        self.symbol = symbol
+        self.direction = direction
+        self.threshold = threshold
+        self.mode = mode
+        self.hysteresis = hysteresis
+        self.note = note
+        self.state = ARMED
+        self.created_at = int(time.time() * 1000)
+        self.trigger_count = 0
+        self.last_triggered_at: Optional[int] = None
+        self.last_trigger_price: Optional[float] = None
+    
+    @property
+    def rearm_level(self) -> float:
+        """觸發後價格需要回到的價位"""
+        if self.direction == ABOVE:
+            return self.threshold - self.hysteresis
+        return self.threshold + self.hysteresis
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為API返回的字典"""
+        return {
+            "id": self.id,
+            "exchange": self.exchange_id,
+            "symbol": self.symbol,
+            "direction": self.direction,
+            "threshold": self.threshold,
+            "mode": self.mode,
+            "hysteresis": self.hysteresis,
+            "note": self.note,
+            "state": self.state,
+            "createdAt": self.created_at,
+            "triggerCount": self.trigger_count,
+            "lastTriggeredAt": self.last_triggered_at,
+            "lastTriggerPrice": self.last_trigger_price
+        }
+
+
+class _AlertBook:
+    """單個(交易所, 交易對)的警報"""
+    
+    __slots__ = ("above", "below", "rearm_falling", "rearm_rising")
+    
+    def __init__(self):
+        # 等待向上 / 向下穿越閾值的警報
+        self.above = _Levels(rising=True)
+        self.below = _Levels(rising=False)
+        # 觸發後等待價格回落 / 回升到 閾值 ∓ 回差 以外的警報（到達價位不算，
+        # 否則回差為0的警報在價格停在閾值上時會重新生效並再次觸發）
+        self.rearm_falling = _Levels(rising=False, strict=True)
+        self.rearm_rising = _Levels(rising=True, strict=True)
+    
+    def __len__(self) -> int:
+        return len(self.above) + len(self.below) + len(self.rearm_falling) + len(self.rearm_rising)
+
+
+class AlertEngine:
+    """
+    價格警報引擎
+    """
+    
+    def __init__(self, event_history: int = 1000):
+        """
+        初始化警報引擎
+        
+        Args:
+            event_history: 保留的最近觸發記錄數量
+        """
+        self.alerts: Dict[int, Alert] = {}
+        self._books: Dict[Tuple[str, str], _AlertBook] = {}
+        self._ids = itertools.count(1)
+        
+        # 最近的觸發記錄
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=event_history)
+        
+        # 統計
+        self.triggered = 0
+    
+    def __len__(self) -> int:
+        return len(self.alerts)
+    
+    @staticmethod
+    def _validate(direction: str, threshold: float, mode: str, hysteresis: Optional[float]) -> float:
+        """
+        檢查警報參數
+        
+        Returns:
+            實際使用的回差
+        
+        Raises:
+            ValueError: 參數無效
+        """
+        if direction not in (ABOVE, BELOW):
+            raise ValueError(f"不支持的警報方向: {direction}（可用: {ABOVE}, {BELOW}）")
+        if mode not in (ONCE, REPEAT):
+            raise ValueError(f"不支持的警報模式: {mode}（可用: {ONCE}, {REPEAT}）")
+        if not threshold > 0:
+            raise ValueError("threshold 必須大於0")
+        
+        if hysteresis is None:
+            return threshold * DEFAULT_HYSTERESIS_RATIO if mode == REPEAT else 0.0
+        if hysteresis < 0:
+            raise ValueError("hysteresis 不能小於0")
+        if mode == REPEAT and hysteresis == 0:
+            raise ValueError("重複警報的 hysteresis 必須大於0，否則價格停在閾值上時會反覆觸發")
+        return hysteresis
+    
+    def _attach(self, alert: Alert, last_price: Optional[float]) -> None:
+        """按當前價格將警報放入對應的數組"""
+        book = self._books.get((alert.exchange_id, alert.symbol))
+        if book is None:
+            book = self._books[(alert.exchange_id, alert.symbol)] = _AlertBook()
+        
+        if alert.direction == ABOVE:
+            if last_price is None or last_price < alert.threshold:
+                alert.state = ARMED
+                book.above.add(alert.threshold, alert.id)
+            else:
+                alert.state = WAITING
+                book.rearm_falling.add(alert.rearm_level, alert.id)
+        else:
+            if last_price is None or last_price > alert.threshold:
+                alert.state = ARMED
+                book.below.add(alert.threshold, alert.id)
+            else:
+                alert.state = WAITING
+                book.rearm_rising.add(alert.rearm_level, alert.id)
+    
+    def _detach(self, alert: Alert) -> None:
+        """將警報從數組中移除"""
+        key = (alert.exchange_id, alert.symbol)
+        book = self._books.get(key)
+        if book is None or alert.state == TRIGGERED:
+            return
+        
+        if alert.state == ARMED:
+            levels = book.above if alert.direction == ABOVE else book.below
+            levels.remove(alert.threshold, alert.id)
+        else:
+            levels = book.rearm_falling if alert.direction == ABOVE else book.rearm_rising
+            levels.remove(alert.rearm_level, alert.id)
+        
+        if not book:
+            del self._books[key]
+    
+    def add(self, exchange_id: str, symbol: str, direction: str, threshold: float, mode: str = ONCE,
+            hysteresis: Optional[float] = None, note: Optional[str] = None,
+            last_price: Optional[float] = None) -> Alert:
+        """
+        添加警報
+        
+        Args:
+            exchange_id: 交易所ID，例如 "binance"
+            symbol: 交易對，例如 "BTC/USDT"
+            direction: "above"（向上穿越）或 "below"（向下穿越）
+            threshold: 閾值價格
+            mode: "once"（一次性）或 "repeat"（重複）
+            hysteresis: 回差（價格），重複警報觸發後價格需要反向越過 閾值 ± 回差 才重新生效；
+                None表示重複警報使用閾值的0.1%，一次性警報為0
+            note: 備註
+            last_price: 當前價格，用於判斷警報是否立即生效，None表示未知
+        
+        Returns:
+            新的警報
+        
+        Raises:
+            ValueError: 參數無效
+        """
+        hysteresis = self._validate(direction, threshold, mode, hysteresis)
+        alert = Alert(next(self._ids), exchange_id, symbol, direction, float(threshold), mode, hysteresis, note)
+        self.alerts[alert.id] = alert
+        self._attach(alert, last_price)
+        return alert
+    
+    def update(self, alert_id: int, last_price: Optional[float] = None, **changes: Any) -> Optional[Alert]:
+        """
+        修改警報，修改後按當前價格重新生效（一次性警報已觸發的也會重新生效）
+        
+        Args:
+            alert_id: 警報ID
+            last_price: 當前價格，None表示未知
+            **changes: 要修改的欄位，可以是 direction、threshold、mode、hysteresis、note
+        
+        Returns:
+            修改後的警報，找不到時返回None
+        
+        Raises:
+            ValueError: 參數無效
+        """
+        alert = self.alerts.get(alert_id)
+        if alert is None:
+            return None
+        
+        unknown = set(changes) - {"direction", "threshold", "mode", "hysteresis", "note"}
+        if unknown:
+            raise ValueError(f"不能修改的欄位: {', '.join(sorted(unknown))}")
+        
+        direction = changes.get("direction", alert.direction)
+        threshold = float(changes.get("threshold", alert.threshold))
+        mode = changes.get("mode", alert.mode)
+        # 沒有指定回差但修改了閾值或模式時，按新參數重新計算默認回差
+        if "hysteresis" in changes:
+            hysteresis = changes["hysteresis"]
+        elif "threshold" in changes or "mode" in changes:
+            hysteresis = None
+        else:
+            hysteresis = alert.hysteresis
+        hysteresis = self._validate(direction, threshold, mode, hysteresis)
+        
+        self._detach(alert)
+        alert.direction = direction
+        alert.threshold = threshold
+        alert.mode = mode
+        alert.hysteresis = hysteresis
+        if "note" in changes:
+            alert.note = changes["note"]
+        self._attach(alert, last_price)
+        return alert
+    
+    def remove(self, alert_id: int) -> bool:
+        """
+        刪除警報
+        
+        Args:
+            alert_id: 警報ID
+        
+        Returns:
+            是否找到並刪除
+        """
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return False
+        self._detach(alert)
+        return True
+    
+    def get(self, alert_id: int) -> Optional[Alert]:
+        """
+        獲取警報
+        
+        Args:
+            alert_id: 警報ID
+        
+        Returns:
+            警報，找不到時返回None
+        """
+        return self.alerts.get(alert_id)
+    
+    def list(self, symbol: Optional[str] = None, exchange_id: Optional[str] = None) -> List[Alert]:
+        """
+        列出警報
+        
+        Args:
+            symbol: 只列出該交易對的警報，None表示全部
+            exchange_id: 只列出該交易所的警報，None表示全部
+        
+        Returns:
+            按ID排列的警報列表
+        """
+        return [alert for alert in self.alerts.values()
+                if (symbol is None or alert.symbol == symbol)
+                and (exchange_id is None or alert.exchange_id == exchange_id)]
+    
+    def check(self, exchange_id: str, symbol: str, price: float) -> List[Dict[str, Any]]:
+        """
+        用最新價格檢查警報（每個tick調用）
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            price: 最新價格
+        
+        Returns:
+            本次觸發的警報記錄，例如 [{"id": 1, "symbol": "BTC/USDT", "direction": "above", "price": 50001.0, ...}]
+        """
+        book = self._books.get((exchange_id, symbol))
+        if book is None:
+            return _EMPTY
+        
+        crossed_above = book.above.pop_crossed(price)
+        crossed_below = book.below.pop_crossed(price)
+        rearmed_above = book.rearm_falling.pop_crossed(price)
+        rearmed_below = book.rearm_rising.pop_crossed(price)
+        if not (crossed_above or crossed_below or rearmed_above or rearmed_below):
+            return _EMPTY
+        
+        # 價格回到閾值這一側的警報重新生效（從下一個tick開始檢查）
+        alerts = self.alerts
+        for alert_id in rearmed_above:
+            alert = alerts[alert_id]
+            alert.state = ARMED
+            book.above.add(alert.threshold, alert_id)
+        for alert_id in rearmed_below:
+            alert = alerts[alert_id]
+            alert.state = ARMED
+            book.below.add(alert.threshold, alert_id)
+        
+        if not (crossed_above or crossed_below):
+            return _EMPTY
+        
+        now = int(time.time() * 1000)
+        events = []
+        for crossed, rearm in ((crossed_above, book.rearm_falling), (crossed_below, book.rearm_rising)):
+            for alert_id in crossed:
+                alert = alerts[alert_id]
+                alert.trigger_count += 1
+                alert.last_triggered_at = now
+                alert.last_trigger_price = price
+                if alert.mode == REPEAT:
+                    alert.state = WAITING
+                    rearm.add(alert.rearm_level, alert_id)
+                else:
+                    alert.state = TRIGGERED
+                
+                event = {
+                    "id": alert_id,
+                    "exchange": exchange_id,
+                    "symbol": symbol,
+                    "direction": alert.direction,
+                    "threshold": alert.threshold,
+                    "price": price,
+                    "mode": alert.mode,
+                    "note": alert.note,
+                    "timestamp": now
+                }
+                events.append(event)
+                self.events.append(event)
+        
+        self.triggered += len(events)
+        if not book:
+            del self._books[(exchange_id, symbol)]
+        return events
+    
+    def get_events(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        獲取最近的觸發記錄
+        
+        Args:
+            limit: 返回數量
+        
+        Returns:
+            按時間從新到舊排列的觸發記錄
+        """
+        events = self.events
+        limit = max(0, min(limit, len(events)))
+        return [events[-i] for i in range(1, limit + 1)]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取警報引擎的統計信息
+        
+        Returns:
+            統計信息，例如 {"alerts": 100, "armed": 90, "waiting": 5, "triggered": 5, "books": 20, "fired": 42}
+        """
+        states = {ARMED: 0, WAITING: 0, TRIGGERED: 0}
+        for alert in self.alerts.values():
+            states[alert.state] += 1
+        return {
+            "alerts": len(self.alerts),
+            "armed": states[ARMED],
+            "waiting": states[WAITING],
+            "triggered": states[TRIGGERED],
+            "books": len(self._books),
+            "fired": self.triggered
+        }
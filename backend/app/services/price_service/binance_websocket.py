@@ -5,12 +5,20 @@
 支持現貨和合約市場。
 """
 
+import asyncio
 import json
 import logging
 import time
-from typing import Dict, List, Optional, Any
+from collections import deque
+from typing import Deque, Dict, List, Optional, Any, Set, Tuple
 
-from app.services.price_service.websocket_base import WebSocketBase
+import aiohttp
+
+from app.services.price_service.decoders import TickerDecoder, create_ticker_decoder
+from app.services.price_service.order_book import OrderBook
+from app.services.price_service.symbol_registry import symbol_registry
+from app.services.price_service.trade_buffer import BUY, SELL
+from app.services.price_service.websocket_base import WebSocketBase, OverflowPolicy
 
 logger = logging.getLogger(__name__)
 
@@ -23,42 +31,136 @@ class BinanceWebSocket(WebSocketBase):
     SPOT_WS_URL = "wss://stream.binance.com:9443/ws"
     FUTURES_WS_URL = "wss://fstream.binance.com/ws"
     
+    # 備用端點，與默認端點一起按握手延遲排序，默認端點不可用時自動切換
+    SPOT_FALLBACK_WS_URLS = ["wss://stream.binance.com:443/ws", "wss://data-stream.binance.vision/ws"]
+    FUTURES_FALLBACK_WS_URLS: List[str] = []
+    
+    # 幣安訂單簿快照 REST URLs
+    SPOT_DEPTH_URL = "https://api.binance.com/api/v3/depth"
+    FUTURES_DEPTH_URL = "https://fapi.binance.com/fapi/v1/depth"
+    
+    # 訂單簿增量stream及快照檔位數
+    DEPTH_STREAM = "depth@100ms"
+    DEPTH_SNAPSHOT_LIMIT = 1000
+    
+    # 歸集成交stream
+    TRADE_STREAM = "aggTrade"
+    
+    # 訂單簿同步任務的最大重試次數（任務結束後，下一個增量事件會重新啟動同步）
+    DEPTH_SYNC_RETRIES = 5
+    
+    # 訂單簿同步連續失敗後的最長等待時間（秒），等待時間按失敗次數指數增長，不隨同步任務重啟而重置
+    DEPTH_SYNC_BACKOFF_MAX = 60
+    
+    # 等待快照期間每個交易對最多緩存的增量事件數，超出時丟棄最舊的事件（快照與剩餘事件不銜接時重新同步）
+    DEPTH_BUFFER_LIMIT = 1000
+    
+    # 快照請求觸發頻率限制（429）或IP封禁（418）後暫停請求的截止時間 {市場類型: time.monotonic()}，
+    # 幣安按IP限制請求權重，同一進程的所有連接共享
+    _depth_rest_paused_until: Dict[str, float] = {}
+    
+    # 每個連接每秒可接收的控制消息數量上限（SUBSCRIBE/UNSUBSCRIBE/LIST_SUBSCRIPTIONS等）
+    SPOT_CONTROL_MESSAGE_RATE = 5
+    FUTURES_CONTROL_MESSAGE_RATE = 10
+    
+    # 單個SUBSCRIBE/UNSUBSCRIBE請求中打包的stream數量上限
+    MAX_STREAMS_PER_REQUEST = 200
+    
+    # 等待控制消息確認的超時時間（秒）
+    CONTROL_ACK_TIMEOUT = 10
+    
+    # 交易對映射表未載入時用於推測報價貨幣的主要穩定幣
+    STABLECOINS = ("USDT", "BUSD", "USDC", "TUSD", "USDP", "DAI", "FDUSD")
+    
     def __init__(self, 
                  market_type: str = "spot",
                  ping_interval: int = 30,
                  reconnect_delay: int = 5,
-                 max_reconnect_attempts: int = 10):
+                 max_reconnect_attempts: int = 10,
+                 decoder: Optional[TickerDecoder] = None,
+                 queue_size: int = 10000,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 trade_buffer_size: int = 10000,
+                 compress: bool = False,
+                 measure_wire: bool = False,
+                 record_dir: Optional[str] = None,
+                 track_latency: bool = True):
         """
         初始化幣安WebSocket客戶端
         
         Args:
             market_type: 市場類型，"spot"(現貨) 或 "futures"(合約)
             ping_interval: 心跳間隔（秒）
-            reconnect_delay: 重連延遲（秒）
-            max_reconnect_attempts: 最大重連嘗試次數
+            reconnect_delay: 重連退避的基礎延遲（秒）
+            max_reconnect_attempts: 連續重連失敗多少次後打開熔斷器暫停重連
+            decoder: 行情消息解碼器，None表示使用最快的可用解碼器
+            queue_size: 待處理消息隊列的容量
+            overflow_policy: 隊列已滿時的處理策略
+            trade_buffer_size: 每個交易對保留的成交筆數
+            compress: 是否協商 permessage-deflate 壓縮
+            measure_wire: 是否統計線上字節數和解壓耗時
+            record_dir: 錄製目錄，設置時錄製收到的所有原始消息
+            track_latency: 是否統計行情延遲
         """
         self.market_type = market_type.lower()
         
         # 選擇正確的WebSocket URL
         if self.market_type == "futures":
             ws_url = self.FUTURES_WS_URL
+            fallback_urls = self.FUTURES_FALLBACK_WS_URLS
+            self.control_message_rate = self.FUTURES_CONTROL_MESSAGE_RATE
         else:  # 默認為現貨
             ws_url = self.SPOT_WS_URL
+            fallback_urls = self.SPOT_FALLBACK_WS_URLS
+            self.control_message_rate = self.SPOT_CONTROL_MESSAGE_RATE
         
         super().__init__(
             exchange_name="Binance",
             ws_url=ws_url,
+            fallback_urls=fallback_urls,
             ping_interval=ping_interval,
             reconnect_delay=reconnect_delay,
-            max_reconnect_attempts=max_reconnect_attempts
+            max_reconnect_attempts=max_reconnect_attempts,
+            queue_size=queue_size,
+            overflow_policy=overflow_policy,
+            trade_buffer_size=trade_buffer_size,
+            compress=compress,
+            measure_wire=measure_wire,
+            record_dir=record_dir,
+            track_latency=track_latency
         )
         
         # 為每個交易對維護最新價格
         self.latest_prices: Dict[str, float] = {}
         
+        # 行情消息解碼器
+        self.decoder = decoder or create_ticker_decoder("binance")
+        
+        # 交易對映射表（所有幣安連接共享）
+        self.symbols = symbol_registry.table("binance", self.market_type)
+        
+        # 本地訂單簿 {"BTC/USDT": OrderBook}
+        self.order_books: Dict[str, OrderBook] = {}
+        
+        # 訂單簿同步前緩存的增量事件，以及正在進行的同步任務
+        self._depth_buffers: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._depth_sync_tasks: Dict[str, asyncio.Task] = {}
+        
+        # 訂單簿同步的退避狀態 {交易對: (連續失敗次數, 下次允許請求快照的時間)}，同步成功後清除
+        self._depth_sync_backoff: Dict[str, Tuple[int, float]] = {}
+        
+        # 已應用快照、等待第一個銜接事件的交易對
+        self._depth_awaiting_first: Set[str] = set()
+        
         # 跟踪訂閱ID和交易對的映射
         self.stream_ids: Dict[str, int] = {}
         self.next_id = 1
+        
+        # 控制消息隊列，由控制消息任務按頻率限制依次發送
+        self._control_queue: asyncio.Queue = asyncio.Queue()
+        
+        # 等待確認的控制請求 {請求ID: Future}
+        self._pending_requests: Dict[int, asyncio.Future] = {}
     
     def _normalize_symbol(self, symbol: str) -> str:
         """
@@ -70,43 +172,175 @@ class BinanceWebSocket(WebSocketBase):
         Returns:
             幣安格式的交易對，例如 "btcusdt"
         """
-        # 移除斜線，轉為小寫
-        binance_symbol = symbol.replace("/", "").lower()
-        return binance_symbol
+        binance_symbol = self.symbols.to_native(symbol)
+        if binance_symbol is None:
+            # 映射表中沒有時移除斜線
+            binance_symbol = symbol.replace("/", "")
+        return binance_symbol.lower()
     
     def _denormalize_symbol(self, binance_symbol: str) -> str:
         """
         將幣安格式的交易對轉換回標準格式
         
         Args:
-            binance_symbol: 幣安格式的交易對，例如 "btcusdt"
+            binance_symbol: 幣安格式的交易對，例如 "BTCUSDT"
             
         Returns:
             標準格式的交易對，例如 "BTC/USDT"
         """
-        # 幣安的主要穩定幣
-        stablecoins = ["usdt", "busd", "usdc", "tusd", "usdp", "dai", "fdusd"]
+        standard_symbol = self.symbols.to_standard(binance_symbol)
+        if standard_symbol is None:
+            standard_symbol = self._guess_standard_symbol(binance_symbol)
+            self.symbols.remember(binance_symbol, standard_symbol)
+        return standard_symbol
+    
+    def _guess_standard_symbol(self, binance_symbol: str) -> str:
+        """
+        在交易對映射表未載入時推測標準格式
+        
+        Args:
+            binance_symbol: 幣安格式的交易對，例如 "BTCUSDT"
+            
+        Returns:
+            標準格式的交易對，例如 "BTC/USDT"
+        """
+        symbol = binance_symbol.upper()
         
         # 尋找交易對中的穩定幣
-        symbol = binance_symbol.lower()
-        for coin in stablecoins:
+        for coin in self.STABLECOINS:
             if symbol.endswith(coin):
-                base = symbol[:-len(coin)].upper()
-                quote = coin.upper()
-                return f"{base}/{quote}"
+                return f"{symbol[:-len(coin)]}/{coin}"
         
         # 如果找不到穩定幣，假設最後4個字符是報價貨幣
-        base = symbol[:-4].upper()
-        quote = symbol[-4:].upper()
-        return f"{base}/{quote}"
+        return f"{symbol[:-4]}/{symbol[-4:]}"
+    
+    def _start_tasks(self) -> None:
+        """啟動WebSocket相關任務，額外啟動控制消息發送任務"""
+        # 舊連接上未發送或未確認的請求已無效
+        self._reset_control_channel()
+        super()._start_tasks()
+        self.tasks.append(asyncio.create_task(self._control_sender()))
+    
+    async def disconnect(self) -> None:
+        """關閉WebSocket連接"""
+        self._reset_control_channel()
+        self._reset_order_books()
+        await super().disconnect()
+    
+    def _reset_control_channel(self) -> None:
+        """清空控制消息隊列，並將所有等待確認的請求標記為失敗"""
+        while not self._control_queue.empty():
+            self._control_queue.get_nowait()
+        
+        for future in self._pending_requests.values():
+            if not future.done():
+                future.set_result(False)
+        self._pending_requests.clear()
+    
+    async def _control_sender(self) -> None:
+        """控制消息發送任務，按交易所的頻率限制依次發送隊列中的請求"""
+        interval = 1.0 / self.control_message_rate
+        last_sent = 0.0
+        
+        while True:
+            request = await self._control_queue.get()
+            
+            # 控制發送間隔，避免超過交易所的控制消息頻率限制
+            wait = last_sent + interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            
+            try:
+                if not self.ws or self.ws.closed:
+                    raise ConnectionError("WebSocket未連接")
+                if request is None:
+                    # 心跳ping幀
+                    self._mark_ping_sent()
+                    await self.ws.ping()
+                else:
+                    await self.ws.send_str(json.dumps(request))
+            except Exception as e:
+                logger.error(f"發送{self.exchange_name}控制消息失敗: {e}")
+                if request is None:
+                    continue
+                future = self._pending_requests.pop(request["id"], None)
+                if future and not future.done():
+                    future.set_result(False)
+            finally:
+                last_sent = time.monotonic()
+    
+    def _enqueue_request(self, method: str, params: Optional[List[str]] = None) -> Tuple[int, asyncio.Future]:
+        """
+        將控制請求加入發送隊列
+        
+        Args:
+            method: 請求方法，例如 "SUBSCRIBE"、"UNSUBSCRIBE"
+            params: 請求參數，例如 ["btcusdt@ticker"]
+        
+        Returns:
+            (請求ID, 確認結果的Future)
+        """
+        request_id = self.next_id
+        self.next_id += 1
+        
+        request: Dict[str, Any] = {"method": method, "id": request_id}
+        if params is not None:
+            request["params"] = params
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending_requests[request_id] = future
+        self._control_queue.put_nowait(request)
+        return request_id, future
+    
+    async def _send_stream_requests(self,
+                                    method: str,
+                                    symbols: List[str],
+                                    stream: str = "ticker") -> List[Tuple[List[str], int, bool]]:
+        """
+        將交易對的stream分批打包發送，並等待所有批次的確認
+        
+        Args:
+            method: 請求方法，"SUBSCRIBE" 或 "UNSUBSCRIBE"
+            symbols: 標準格式的交易對列表
+            stream: stream類型，例如 "ticker"、"depth@100ms"
+        
+        Returns:
+            每個批次的結果列表 [(交易對列表, 請求ID, 是否成功)]
+        """
+        batches = []
+        for i in range(0, len(symbols), self.MAX_STREAMS_PER_REQUEST):
+            batch = symbols[i:i + self.MAX_STREAMS_PER_REQUEST]
+            params = [f"{self._normalize_symbol(s)}@{stream}" for s in batch]
+            request_id, future = self._enqueue_request(method, params)
+            batches.append((batch, request_id, future))
+        
+        logger.info(f"已排隊{self.exchange_name} {method} {stream}請求: {len(symbols)}個交易對，共{len(batches)}個批次")
+        
+        # 等待時間需覆蓋排隊發送所需的時間
+        timeout = self.CONTROL_ACK_TIMEOUT + self._control_queue.qsize() / self.control_message_rate
+        done, _ = await asyncio.wait([future for _, _, future in batches], timeout=timeout)
+        
+        results = []
+        for batch, request_id, future in batches:
+            if future in done:
+                success = future.result()
+            else:
+                logger.warning(f"{self.exchange_name} {method}請求 {request_id} 等待確認超時")
+                self._pending_requests.pop(request_id, None)
+                future.cancel()
+                success = False
+            results.append((batch, request_id, success))
+        return results
     
     async def subscribe_symbols(self, symbols: List[str]) -> bool:
         """
         訂閱交易對的ticker數據
         
+        多個交易對會被打包成少量的SUBSCRIBE請求，按頻率限制發送並等待確認。
+        
         Args:
             symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
-            
+        
         Returns:
             訂閱是否成功
         """
@@ -115,37 +349,25 @@ class BinanceWebSocket(WebSocketBase):
             if not await self.connect():
                 return False
         
-        binance_symbols = [self._normalize_symbol(s) for s in symbols]
+        # 如果已經訂閱，則跳過
+        new_symbols = [s for s in dict.fromkeys(symbols) if s not in self.subscribed_symbols]
+        if not new_symbols:
+            return True
         
         try:
-            # 針對每個交易對建立訂閱
-            for idx, binance_symbol in enumerate(binance_symbols):
-                standard_symbol = symbols[idx]
-                
-                # 如果已經訂閱，則跳過
-                if standard_symbol in self.subscribed_symbols:
+            all_success = True
+            for batch, request_id, success in await self._send_stream_requests("SUBSCRIBE", new_symbols):
+                if not success:
+                    logger.error(f"訂閱{self.exchange_name}交易對失敗: {batch}")
+                    all_success = False
                     continue
                 
-                # 創建訂閱ID
-                stream_id = self.next_id
-                self.next_id += 1
-                
-                # 創建訂閱消息
-                subscribe_msg = {
-                    "method": "SUBSCRIBE",
-                    "params": [f"{binance_symbol}@ticker"],
-                    "id": stream_id
-                }
-                
-                # 發送訂閱請求
-                await self.ws.send_str(json.dumps(subscribe_msg))
-                logger.info(f"已發送{self.exchange_name}訂閱請求: {standard_symbol}")
-                
                 # 記錄訂閱信息
-                self.stream_ids[standard_symbol] = stream_id
-                self.subscribed_symbols.add(standard_symbol)
+                for symbol in batch:
+                    self.stream_ids[symbol] = request_id
+                    self.subscribed_symbols.add(symbol)
             
-            return True
+            return all_success
         except Exception as e:
             logger.error(f"訂閱{self.exchange_name}交易對失敗: {e}")
             return False
@@ -156,7 +378,7 @@ class BinanceWebSocket(WebSocketBase):
         
         Args:
             symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
-            
+        
         Returns:
             取消訂閱是否成功
         """
@@ -164,44 +386,428 @@ class BinanceWebSocket(WebSocketBase):
             logger.warning("WebSocket未連接，無需取消訂閱")
             return False
         
+        subscribed = [s for s in dict.fromkeys(symbols) if s in self.subscribed_symbols]
+        if not subscribed:
+            return True
+        
         try:
+            all_success = True
+            for batch, _, success in await self._send_stream_requests("UNSUBSCRIBE", subscribed):
+                if not success:
+                    logger.error(f"取消訂閱{self.exchange_name}交易對失敗: {batch}")
+                    all_success = False
+                    continue
+                
+                # 更新記錄
+                for symbol in batch:
+                    self.stream_ids.pop(symbol, None)
+                    self.subscribed_symbols.discard(symbol)
+                    self.latest_prices.pop(symbol, None)
+                    self.last_update.pop(symbol, None)
+            
+            return all_success
+        except Exception as e:
+            logger.error(f"取消訂閱{self.exchange_name}交易對失敗: {e}")
+            return False
+    
+    async def _resubscribe(self) -> None:
+        """重新訂閱之前訂閱的交易對（重連後需要重新發送所有stream）"""
+        if self.subscribed_symbols:
+            symbols = list(self.subscribed_symbols)
+            logger.info(f"重新訂閱{self.exchange_name}交易對: {len(symbols)}個")
+            
+            try:
+                for batch, request_id, success in await self._send_stream_requests("SUBSCRIBE", symbols):
+                    if success:
+                        for symbol in batch:
+                            self.stream_ids[symbol] = request_id
+                    else:
+                        logger.error(f"重新訂閱{self.exchange_name}交易對失敗: {batch}")
+            except Exception as e:
+                logger.error(f"重新訂閱{self.exchange_name}交易對失敗: {e}")
+        
+        if self.depth_symbols:
+            # 斷線期間遺漏了增量事件，訂單簿需要重新同步
+            symbols = list(self.depth_symbols)
+            self._reset_order_books()
             for symbol in symbols:
-                if symbol not in self.subscribed_symbols:
+                self.order_books[symbol] = OrderBook(symbol)
+                self._depth_buffers[symbol] = self._new_depth_buffer()
+            
+            try:
+                for batch, _, success in await self._send_stream_requests("SUBSCRIBE", symbols, self.DEPTH_STREAM):
+                    if not success:
+                        logger.error(f"重新訂閱{self.exchange_name}訂單簿失敗: {batch}")
+            except Exception as e:
+                logger.error(f"重新訂閱{self.exchange_name}訂單簿失敗: {e}")
+        
+        if self.trade_symbols:
+            try:
+                for batch, _, success in await self._send_stream_requests("SUBSCRIBE", list(self.trade_symbols),
+                                                                          self.TRADE_STREAM):
+                    if not success:
+                        logger.error(f"重新訂閱{self.exchange_name}成交數據失敗: {batch}")
+            except Exception as e:
+                logger.error(f"重新訂閱{self.exchange_name}成交數據失敗: {e}")
+    
+    async def subscribe_depth(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對的訂單簿增量數據，並在收到事件後以REST快照同步本地訂單簿
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            訂閱是否成功
+        """
+        if not self.ws or self.ws.closed:
+            logger.warning("嘗試在WebSocket關閉狀態下訂閱訂單簿，先嘗試連接")
+            if not await self.connect():
+                return False
+        
+        new_symbols = [s for s in dict.fromkeys(symbols) if s not in self.depth_symbols]
+        if not new_symbols:
+            return True
+        
+        # 先建立訂單簿，確保訂閱確認前到達的事件也會被緩存
+        for symbol in new_symbols:
+            self.order_books[symbol] = OrderBook(symbol)
+            self._depth_buffers[symbol] = self._new_depth_buffer()
+        
+        try:
+            all_success = True
+            for batch, _, success in await self._send_stream_requests("SUBSCRIBE", new_symbols, self.DEPTH_STREAM):
+                if success:
+                    self.depth_symbols.update(batch)
                     continue
                 
-                binance_symbol = self._normalize_symbol(symbol)
+                logger.error(f"訂閱{self.exchange_name}訂單簿失敗: {batch}")
+                all_success = False
+                for symbol in batch:
+                    self._drop_order_book(symbol)
+            
+            return all_success
+        except Exception as e:
+            logger.error(f"訂閱{self.exchange_name}訂單簿失敗: {e}")
+            for symbol in new_symbols:
+                if symbol not in self.depth_symbols:
+                    self._drop_order_book(symbol)
+            return False
+    
+    async def unsubscribe_depth(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對的訂單簿數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            取消訂閱是否成功
+        """
+        subscribed = [s for s in dict.fromkeys(symbols) if s in self.depth_symbols]
+        if not subscribed:
+            return True
+        
+        if not self.ws or self.ws.closed:
+            logger.warning("WebSocket未連接，無需取消訂閱")
+            return False
+        
+        try:
+            all_success = True
+            for batch, _, success in await self._send_stream_requests("UNSUBSCRIBE", subscribed, self.DEPTH_STREAM):
+                if not success:
+                    logger.error(f"取消訂閱{self.exchange_name}訂單簿失敗: {batch}")
+                    all_success = False
+                    continue
                 
-                # 創建取消訂閱消息
-                unsubscribe_msg = {
-                    "method": "UNSUBSCRIBE",
-                    "params": [f"{binance_symbol}@ticker"],
-                    "id": self.stream_ids.get(symbol, 0)
-                }
+                for symbol in batch:
+                    self.depth_symbols.discard(symbol)
+                    self._drop_order_book(symbol)
+            
+            return all_success
+        except Exception as e:
+            logger.error(f"取消訂閱{self.exchange_name}訂單簿失敗: {e}")
+            return False
+    
+    def get_order_book(self, symbol: str) -> Optional[OrderBook]:
+        """
+        獲取交易對的本地訂單簿
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            訂單簿，如果沒有則返回None
+        """
+        return self.order_books.get(symbol)
+    
+    def _drop_order_book(self, symbol: str) -> None:
+        """移除交易對的訂單簿及其同步狀態"""
+        self.order_books.pop(symbol, None)
+        self._depth_buffers.pop(symbol, None)
+        self._depth_awaiting_first.discard(symbol)
+        task = self._depth_sync_tasks.pop(symbol, None)
+        if task and not task.done():
+            task.cancel()
+    
+    def _reset_order_books(self) -> None:
+        """取消所有同步任務並清空訂單簿"""
+        for task in self._depth_sync_tasks.values():
+            if not task.done():
+                task.cancel()
+        self._depth_sync_tasks.clear()
+        self._depth_buffers.clear()
+        self._depth_awaiting_first.clear()
+        self.order_books.clear()
+    
+    def _process_depth_update(self, data: Dict[str, Any]) -> None:
+        """
+        處理訂單簿增量事件
+        
+        Args:
+            data: depthUpdate 消息
+        """
+        symbol = self._denormalize_symbol(data["s"])
+        book = self.order_books.get(symbol)
+        if book is None:
+            return
+        
+        # 未同步時緩存事件，等待快照
+        if not book.synced:
+            buffer = self._depth_buffers.get(symbol)
+            if buffer is None:
+                buffer = self._depth_buffers[symbol] = self._new_depth_buffer()
+            buffer.append(data)
+            self._start_depth_sync(symbol)
+            return
+        
+        if not self._apply_depth_event(book, data):
+            logger.warning(f"{self.exchange_name}訂單簿更新ID不連續，重新同步: {symbol}")
+            book.reset()
+            self._depth_awaiting_first.discard(symbol)
+            self._depth_buffers[symbol] = self._new_depth_buffer()
+            self._depth_buffers[symbol].append(data)
+            self._start_depth_sync(symbol)
+    
+    def _apply_depth_event(self, book: OrderBook, data: Dict[str, Any]) -> bool:
+        """
+        按更新ID規則將增量事件應用到訂單簿
+        
+        現貨：第一個事件需滿足 U <= lastUpdateId+1 <= u，之後每個事件的 U 等於上一個事件的 u+1。
+        合約：第一個事件需滿足 U <= lastUpdateId <= u，之後每個事件的 pu 等於上一個事件的 u。
+        
+        Args:
+            book: 訂單簿
+            data: depthUpdate 消息
+            
+        Returns:
+            False表示更新ID出現缺口，需要重新同步
+        """
+        first_id = data["U"]
+        final_id = data["u"]
+        is_futures = "pu" in data
+        
+        # 丟棄快照之前的舊事件
+        if final_id < book.last_update_id or (final_id == book.last_update_id and not is_futures):
+            return True
+        
+        if book.symbol in self._depth_awaiting_first:
+            expected = first_id <= book.last_update_id + (0 if is_futures else 1)
+        elif is_futures:
+            expected = data["pu"] == book.last_update_id
+        else:
+            expected = first_id == book.last_update_id + 1
+        if not expected:
+            return False
+        
+        book.apply_levels(data["b"], data["a"])
+        book.last_update_id = final_id
+        book.timestamp = data.get("E", 0)
+        self._depth_awaiting_first.discard(book.symbol)
+        return True
+    
+    def _new_depth_buffer(self) -> Deque[Dict[str, Any]]:
+        """創建等待快照期間的增量事件緩存（超出上限時丟棄最舊的事件）"""
+        return deque(maxlen=self.DEPTH_BUFFER_LIMIT)
+    
+    def _depth_sync_delay(self, symbol: str) -> float:
+        """距離允許請求交易對快照還需等待的時間（秒）"""
+        now = time.monotonic()
+        _, not_before = self._depth_sync_backoff.get(symbol, (0, now))
+        paused_until = self._depth_rest_paused_until.get(self.market_type, now)
+        return max(not_before, paused_until) - now
+    
+    def _record_depth_sync_failure(self, symbol: str) -> None:
+        """記錄一次同步失敗，下次請求快照前按指數退避等待"""
+        failures = self._depth_sync_backoff.get(symbol, (0, 0.0))[0] + 1
+        delay = min(2 ** (failures - 1), self.DEPTH_SYNC_BACKOFF_MAX)
+        self._depth_sync_backoff[symbol] = (failures, time.monotonic() + delay)
+    
+    def _start_depth_sync(self, symbol: str) -> None:
+        """啟動訂單簿同步任務（已在同步中則跳過）"""
+        task = self._depth_sync_tasks.get(symbol)
+        if task is None or task.done():
+            self._depth_sync_tasks[symbol] = asyncio.create_task(self._sync_order_book(symbol))
+    
+    async def _fetch_depth_snapshot(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """
+        通過REST獲取訂單簿快照
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            快照數據，包含 lastUpdateId、bids、asks，失敗時返回None
+        """
+        url = self.FUTURES_DEPTH_URL if self.market_type == "futures" else self.SPOT_DEPTH_URL
+        params = {"symbol": self._normalize_symbol(symbol).upper(), "limit": self.DEPTH_SNAPSHOT_LIMIT}
+        
+        try:
+            if self.ws_session is None or self.ws_session.closed:
+                self.ws_session = aiohttp.ClientSession()
+            timeout = aiohttp.ClientTimeout(total=10)
+            async with self.ws_session.get(url, params=params, timeout=timeout) as response:
+                if response.status == 200:
+                    return await response.json()
+                if response.status in (418, 429):
+                    # 觸發頻率限制後繼續請求會升級為IP封禁，按 Retry-After 暫停所有交易對的快照請求
+                    try:
+                        retry_after = float(response.headers.get("Retry-After", self.DEPTH_SYNC_BACKOFF_MAX))
+                    except ValueError:
+                        retry_after = self.DEPTH_SYNC_BACKOFF_MAX
+                    paused_until = time.monotonic() + retry_after
+                    if paused_until > self._depth_rest_paused_until.get(self.market_type, 0.0):
+                        self._depth_rest_paused_until[self.market_type] = paused_until
+                logger.error(f"獲取{self.exchange_name}訂單簿快照失敗: {symbol}, 狀態碼: {response.status}")
+        except Exception as e:
+            logger.error(f"獲取{self.exchange_name}訂單簿快照失敗: {symbol}, 錯誤: {e}")
+        return None
+    
+    async def _sync_order_book(self, symbol: str) -> None:
+        """
+        以REST快照同步訂單簿，並依序應用快照之後緩存的增量事件
+        
+        請求快照前按該交易對的退避狀態等待，任務重啟（例如重試次數用完後由新的增量事件觸發）不會重置等待時間。
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+        """
+        for attempt in range(1, self.DEPTH_SYNC_RETRIES + 1):
+            delay = self._depth_sync_delay(symbol)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            snapshot = await self._fetch_depth_snapshot(symbol)
+            book = self.order_books.get(symbol)
+            if book is None:
+                return
+            
+            if snapshot is not None:
+                book.apply_snapshot(snapshot["bids"], snapshot["asks"], snapshot["lastUpdateId"])
+                self._depth_awaiting_first.add(symbol)
                 
-                # 發送取消訂閱請求
-                await self.ws.send_str(json.dumps(unsubscribe_msg))
-                logger.info(f"已發送{self.exchange_name}取消訂閱請求: {symbol}")
+                # 從獲取快照到此處之間沒有await，緩存的事件不會再增加
+                buffered = self._depth_buffers.get(symbol, ())
+                self._depth_buffers[symbol] = self._new_depth_buffer()
+                if all(self._apply_depth_event(book, event) for event in buffered):
+                    # 快照之後還沒有新事件時，以快照為準，由第一個事件按銜接規則校驗
+                    book.synced = True
+                    self._depth_sync_backoff.pop(symbol, None)
+                    logger.info(f"{self.exchange_name}訂單簿同步完成: {symbol} (lastUpdateId={book.last_update_id})")
+                    return
                 
-                # 更新記錄
-                if symbol in self.stream_ids:
-                    del self.stream_ids[symbol]
-                if symbol in self.subscribed_symbols:
-                    self.subscribed_symbols.remove(symbol)
-                if symbol in self.latest_prices:
-                    del self.latest_prices[symbol]
+                logger.warning(f"{self.exchange_name}訂單簿快照與增量事件不連續，重試({attempt}): {symbol}")
+                book.reset()
+                self._depth_awaiting_first.discard(symbol)
             
+            self._record_depth_sync_failure(symbol)
+        
+        logger.error(f"{self.exchange_name}訂單簿同步失敗，已達最大重試次數: {symbol}")
+    
+    async def subscribe_trades(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對的歸集成交數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            訂閱是否成功
+        """
+        if not self.ws or self.ws.closed:
+            logger.warning("嘗試在WebSocket關閉狀態下訂閱成交數據，先嘗試連接")
+            if not await self.connect():
+                return False
+        
+        new_symbols = [s for s in dict.fromkeys(symbols) if s not in self.trade_symbols]
+        if not new_symbols:
             return True
+        
+        self._add_trade_buffers(new_symbols)
+        
+        try:
+            all_success = True
+            for batch, _, success in await self._send_stream_requests("SUBSCRIBE", new_symbols, self.TRADE_STREAM):
+                if success:
+                    self.trade_symbols.update(batch)
+                else:
+                    logger.error(f"訂閱{self.exchange_name}成交數據失敗: {batch}")
+                    all_success = False
+                    self._remove_trade_symbols(batch)
+            return all_success
         except Exception as e:
-            logger.error(f"取消訂閱{self.exchange_name}交易對失敗: {e}")
+            logger.error(f"訂閱{self.exchange_name}成交數據失敗: {e}")
+            self._remove_trade_symbols([s for s in new_symbols if s not in self.trade_symbols])
             return False
     
+    async def unsubscribe_trades(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對的歸集成交數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            取消訂閱是否成功
+        """
+        subscribed = [s for s in dict.fromkeys(symbols) if s in self.trade_symbols]
+        if not subscribed:
+            return True
+        
+        if not self.ws or self.ws.closed:
+            logger.warning("WebSocket未連接，無需取消訂閱")
+            return False
+        
+        try:
+            all_success = True
+            for batch, _, success in await self._send_stream_requests("UNSUBSCRIBE", subscribed, self.TRADE_STREAM):
+                if success:
+                    self._remove_trade_symbols(batch)
+                else:
+                    logger.error(f"取消訂閱{self.exchange_name}成交數據失敗: {batch}")
+                    all_success = False
+            return all_success
+        except Exception as e:
+            logger.error(f"取消訂閱{self.exchange_name}成交數據失敗: {e}")
+            return False
+    
+    def _process_agg_trade(self, data: Dict[str, Any]) -> None:
+        """
+        將歸集成交寫入交易對的成交記錄緩衝區
+        
+        Args:
+            data: aggTrade 消息，m為true表示買方是掛單方，即主動賣出
+        """
+        buffer = self.trade_buffers.get(self._denormalize_symbol(data["s"]))
+        if buffer is not None:
+            buffer.append(data["T"], float(data["p"]), float(data["q"]), SELL if data["m"] else BUY)
+    
     async def _send_ping(self) -> None:
         """發送心跳包"""
         if self.ws and not self.ws.closed:
-            # 幣安WebSocket需要使用正確的心跳格式，不能簡單地發送 "ping"
-            # 使用空的LIST_SUBSCRIPTIONS作為心跳
-            ping_msg = {"method": "LIST_SUBSCRIPTIONS", "id": 0}
-            await self.ws.send_str(json.dumps(ping_msg))
+            # 幣安支持標準的WebSocket ping幀，伺服器直接回覆pong幀，不經過JSON處理
+            # ping幀同樣計入控制消息頻率限制，因此經由控制消息隊列發送（None表示ping幀）
+            self._control_queue.put_nowait(None)
     
     async def _process_message(self, message: str) -> None:
         """
@@ -211,41 +817,57 @@ class BinanceWebSocket(WebSocketBase):
             message: WebSocket消息
         """
         try:
-            data = json.loads(message)
-            
-            # 處理心跳回應
-            if "result" in data and data.get("id") == 0:
-                logger.debug(f"{self.exchange_name}心跳回應: {data}")
-                return
-            
-            # 處理訂閱確認消息
-            if "result" in data and data.get("id") in [v for v in self.stream_ids.values()]:
-                logger.info(f"{self.exchange_name}訂閱確認: {data}")
-                return
-            
-            # 處理錯誤消息
-            if "error" in data:
-                logger.error(f"{self.exchange_name}錯誤消息: {data}")
-                return
+            frame = self.decoder.decode(message)
             
             # 處理ticker數據
-            if "e" in data and data["e"] == "24hrTicker":
-                symbol = data["s"]
-                
+            for binance_symbol, price, event_time in frame.ticks:
                 # 將幣安格式轉換回標準格式
-                standard_symbol = self._denormalize_symbol(symbol)
-                
-                # 最新價格
-                price = float(data["c"])
+                standard_symbol = self._denormalize_symbol(binance_symbol)
                 
                 # 更新最新價格
                 self.latest_prices[standard_symbol] = price
                 
                 # 打印日誌
-                logger.debug(f"{self.exchange_name}價格更新: {standard_symbol} = {price}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{self.exchange_name}價格更新: {standard_symbol} = {price}")
                 
                 # 通知回調
-                self._notify_price_update(standard_symbol, price)
+                self._notify_price_update(standard_symbol, price, event_time)
+            
+            data = frame.control
+            if data is None:
+                return
+            
+            # 處理控制請求的回應
+            if "id" in data:
+                request_id = data["id"]
+                success = "error" not in data
+                if success:
+                    logger.debug(f"{self.exchange_name}請求確認: {data}")
+                else:
+                    logger.error(f"{self.exchange_name}錯誤消息: {data}")
+                
+                future = self._pending_requests.pop(request_id, None)
+                if future and not future.done():
+                    future.set_result(success)
+                return
+            
+            # 處理錯誤消息
+            if "error" in data:
+                logger.error(f"{self.exchange_name}錯誤消息: {data}")
+                return
+            
+            event_type = data.get("e")
+            
+            # 處理成交數據
+            if event_type == "aggTrade":
+                self._process_agg_trade(data)
+                return
+            
+            # 處理訂單簿增量數據
+            if event_type == "depthUpdate":
+                self._process_depth_update(data)
+                return
         except json.JSONDecodeError:
             logger.error(f"{self.exchange_name}無法解析JSON消息: {message}")
         except KeyError as e:
@@ -273,7 +895,7 @@ class BinanceWebSocket(WebSocketBase):
         
         Args:
             symbol: 交易對，例如 "BTC/USDT"
-            
+        
         Returns:
             最新價格，如果沒有則返回None
         """
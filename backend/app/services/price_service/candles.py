@@ -0,0 +1,221 @@
+"""
+K線聚合器
+
+根據實時價格增量生成多週期（1s/1m/5m/1h）K線，每個tick只更新各週期的當前K線，開銷固定。
+K線按時間同步後的牆鐘時間劃分，到達週期邊界後自動收盤，即使該週期內沒有新的tick。
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Any, Tuple
+
+from app.utils.time_sync import time_sync
+
+logger = logging.getLogger(__name__)
+
+# 支持的K線週期（秒）
+INTERVALS: Dict[str, int] = {"1s": 1, "1m": 60, "5m": 300, "1h": 3600}
+
+# 已收盤的K線：(開盤時間(毫秒), 開, 高, 低, 收, tick數)
+Candle = Tuple[int, float, float, float, float, int]
+
+
+class CandleSeries:
+    """
+    單個交易對單個週期的K線序列
+    """
+    
+    __slots__ = ("interval_ms", "closed", "open_time", "open", "high", "low", "close", "ticks")
+    
+    def __init__(self, interval: int, history: int):
+        """
+        初始化K線序列
+        
+        Args:
+            interval: 週期（秒）
+            history: 保留的已收盤K線數量
+        """
+        self.interval_ms = interval * 1000
+        self.closed: Deque[Candle] = deque(maxlen=history)
+        
+        # 當前K線，open_time為-1表示還沒有K線
+        self.open_time = -1
+        self.open = self.high = self.low = self.close = 0.0
+        self.ticks = 0
+    
+    def roll(self, now_ms: int) -> None:
+        """
+        當前K線已經過了週期邊界時將其收盤
+        
+        Args:
+            now_ms: 當前時間（毫秒）
+        """
+        if self.open_time >= 0 and now_ms >= self.open_time + self.interval_ms:
+            self.closed.append((self.open_time, self.open, self.high, self.low, self.close, self.ticks))
+            self.open_time = -1
+    
+    def update(self, now_ms: int, price: float) -> None:
+        """
+        將價格合併到當前K線
+        
+        Args:
+            now_ms: 當前時間（毫秒）
+            price: 最新價格
+        """
+        self.roll(now_ms)
+        
+        if self.open_time < 0:
+            self.open_time = now_ms - now_ms % self.interval_ms
+            self.open = self.high = self.low = self.close = price
+            self.ticks = 1
+            return
+        
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.ticks += 1
+    
+    def recent(self, limit: int, include_open: bool = True) -> List[Dict[str, Any]]:
+        """
+        獲取最近的K線，按時間從舊到新排列
+        
+        Args:
+            limit: K線數量
+            include_open: 是否包含尚未收盤的當前K線
+        
+        Returns:
+            K線列表
+        """
+        if limit <= 0:
+            return []
+        
+        candles = [_candle_dict(candle, self.interval_ms, True) for candle in list(self.closed)[-limit:]]
+        if include_open and self.open_time >= 0:
+            candles.append(_candle_dict(
+                (self.open_time, self.open, self.high, self.low, self.close, self.ticks), self.interval_ms, False
+            ))
+            del candles[:-limit]
+        return candles
+
+
+def _candle_dict(candle: Candle, interval_ms: int, closed: bool) -> Dict[str, Any]:
+    """將K線轉換為API使用的字典"""
+    open_time, open_, high, low, close, ticks = candle
+    return {
+        "openTime": open_time,
+        "closeTime": open_time + interval_ms - 1,
+        "open": open_,
+        "high": high,
+        "low": low,
+        "close": close,
+        "ticks": ticks,
+        "closed": closed
+    }
+
+
+class CandleBuilder:
+    """
+    多交易所、多交易對的K線聚合器
+    """
+    
+    # 重新讀取時間偏移的間隔（秒）
+    CLOCK_REFRESH_INTERVAL = 60
+    
+    def __init__(self, intervals: Optional[List[str]] = None, history: int = 500):
+        """
+        初始化K線聚合器
+        
+        Args:
+            intervals: 生成的週期列表，例如 ["1s", "1m"]，None表示所有支持的週期
+            history: 每個週期保留的已收盤K線數量
+        """
+        intervals = intervals or list(INTERVALS)
+        for interval in intervals:
+            if interval not in INTERVALS:
+                raise ValueError(f"不支持的K線週期: {interval}")
+        
+        self.intervals = intervals
+        self.history = history
+        
+        # {("binance", "BTC/USDT"): [CandleSeries(1s), CandleSeries(1m), ...]}，順序與 intervals 相同
+        self.series: Dict[Tuple[str, str], List[CandleSeries]] = {}
+        
+        # 本地時間與時間同步服務的偏移（秒）
+        self._clock_offset = 0.0
+        self._clock_checked_at = 0.0
+    
+    def now_ms(self) -> int:
+        """
+        獲取時間同步後的當前時間（毫秒）
+        
+        偏移量每分鐘從 time_sync 讀取一次，避免每個tick都查詢。
+        優先使用幣安時間：Google時間的偏移包含了台北時區的8小時，不是Unix時間戳。
+        """
+        local = time.time()
+        if local - self._clock_checked_at >= self.CLOCK_REFRESH_INTERVAL:
+            self._clock_checked_at = local
+            if "binance" in time_sync.time_offsets:
+                self._clock_offset = time_sync.get_adjusted_time("binance") - local
+        return int((local + self._clock_offset) * 1000)
+    
+    def update(self, exchange_id: str, symbol: str, price: float) -> None:
+        """
+        將價格合併到交易對各週期的當前K線
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            price: 最新價格
+        """
+        key = (exchange_id, symbol)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [CandleSeries(INTERVALS[i], self.history) for i in self.intervals]
+        
+        now_ms = self.now_ms()
+        for candles in series:
+            candles.update(now_ms, price)
+    
+    def get_candles(self, exchange_id: str, symbol: str, interval: str = "1m",
+                    limit: int = 100, include_open: bool = True) -> Optional[List[Dict[str, Any]]]:
+        """
+        獲取交易對最近的K線
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            interval: 週期，例如 "1m"
+            limit: K線數量
+            include_open: 是否包含尚未收盤的當前K線
+        
+        Returns:
+            K線列表，例如 [{"openTime": 1700000000000, "open": 50000.0, ..., "closed": True}]，
+            沒有該交易對的數據時返回None
+        """
+        if interval not in self.intervals:
+            raise ValueError(f"不支持的K線週期: {interval}")
+        
+        series = self.series.get((exchange_id, symbol))
+        if series is None:
+            return None
+        
+        candles = series[self.intervals.index(interval)]
+        candles.roll(self.now_ms())
+        return candles.recent(limit, include_open)
+    
+    def remove(self, exchange_id: str, symbol: str) -> None:
+        """
+        移除交易對的K線數據
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        """
+        self.series.pop((exchange_id, symbol), None)
+    
+    def clear(self) -> None:
+        """清空所有K線數據"""
+        self.series.clear()
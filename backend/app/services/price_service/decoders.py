@@ -0,0 +1,224 @@
+"""
+行情消息解碼器
+
+將交易所WebSocket的原始消息直接解碼為固定結構的ticker數據，跳過未使用的字段。
+優先使用 msgspec 或 orjson 的快速解碼器（requirements.txt 中已包含），未安裝時退回標準庫 json。
+可以通過環境變數 PRICE_DECODER_BACKEND 指定使用的後端（msgspec / orjson / json）。
+"""
+
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Any, Callable, NamedTuple, Tuple, Union
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - 可選依賴
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可選依賴
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# ticker數據：(交易所原生交易對, 最新價格, 交易所事件時間(毫秒))
+Tick = Tuple[str, float, int]
+
+
+class DecodedFrame(NamedTuple):
+    """解碼後的消息"""
+    # ticker數據列表
+    ticks: List[Tick]
+    # 非ticker消息（訂閱確認、錯誤、其他頻道等）解析成的通用字典
+    control: Optional[Dict[str, Any]] = None
+
+
+class TickerDecoder(ABC):
+    """
+    行情消息解碼器基礎類
+    """
+    
+    # 解碼後端名稱
+    backend = "json"
+    
+    def __init__(self, loads: Optional[Callable[[Union[str, bytes]], Any]] = None):
+        """
+        初始化解碼器
+        
+        Args:
+            loads: 通用JSON解析函數，用於非ticker消息
+        """
+        self.loads = loads or json.loads
+    
+    @abstractmethod
+    def decode(self, message: Union[str, bytes]) -> DecodedFrame:
+        """
+        解碼WebSocket消息
+        
+        Args:
+            message: WebSocket原始消息
+        
+        Returns:
+            解碼後的消息
+        
+        Raises:
+            ValueError: 消息不是合法的JSON
+        """
+        pass
+
+
+class BinanceJsonDecoder(TickerDecoder):
+    """使用通用JSON解析的幣安24hrTicker解碼器（json / orjson）"""
+    
+    def decode(self, message: Union[str, bytes]) -> DecodedFrame:
+        data = self.loads(message)
+        if data.get("e") == "24hrTicker":
+            return DecodedFrame([(data["s"], float(data["c"]), data.get("E", 0))])
+        return DecodedFrame([], data)
+
+
+class OkxJsonDecoder(TickerDecoder):
+    """使用通用JSON解析的OKX tickers頻道解碼器（json / orjson）"""
+    
+    def decode(self, message: Union[str, bytes]) -> DecodedFrame:
+        data = self.loads(message)
+        arg = data.get("arg")
+        if arg and arg.get("channel") == "tickers" and "data" in data:
+            return DecodedFrame([
+                (ticker["instId"], float(ticker["last"]), int(ticker.get("ts", 0)))
+                for ticker in data["data"]
+            ])
+        return DecodedFrame([], data)
+
+
+if msgspec is not None:
+    class _BinanceTicker(msgspec.Struct):
+        """幣安消息中解碼器關心的字段，其他字段直接跳過"""
+        e: str = ""
+        s: str = ""
+        c: str = ""
+        E: int = 0
+    
+    class _OkxArg(msgspec.Struct):
+        channel: str = ""
+    
+    class _OkxTicker(msgspec.Struct):
+        instId: str
+        last: str
+        ts: str = "0"
+    
+    class _OkxFrame(msgspec.Struct):
+        arg: Optional[_OkxArg] = None
+        # 其他頻道的數據結構不同，解碼失敗時退回通用解析
+        data: Optional[List[_OkxTicker]] = None
+
+
+class BinanceMsgspecDecoder(TickerDecoder):
+    """使用 msgspec 固定結構解碼的幣安24hrTicker解碼器"""
+    
+    backend = "msgspec"
+    
+    def __init__(self, loads: Optional[Callable[[Union[str, bytes]], Any]] = None):
+        super().__init__(loads)
+        self._decoder = msgspec.json.Decoder(_BinanceTicker)
+    
+    def decode(self, message: Union[str, bytes]) -> DecodedFrame:
+        # 不含事件類型的消息（深度、成交等）不可能是ticker，直接通用解析，避免解析兩次
+        if ("24hrTicker" if isinstance(message, str) else b"24hrTicker") not in message:
+            return DecodedFrame([], self.loads(message))
+        
+        try:
+            ticker = self._decoder.decode(message)
+        except msgspec.DecodeError:
+            # 結構不符時退回通用解析
+            return DecodedFrame([], self.loads(message))
+        
+        if ticker.e == "24hrTicker":
+            return DecodedFrame([(ticker.s, float(ticker.c), ticker.E)])
+        return DecodedFrame([], self.loads(message))
+
+
+class OkxMsgspecDecoder(TickerDecoder):
+    """使用 msgspec 固定結構解碼的OKX tickers頻道解碼器"""
+    
+    backend = "msgspec"
+    
+    def __init__(self, loads: Optional[Callable[[Union[str, bytes]], Any]] = None):
+        super().__init__(loads)
+        self._decoder = msgspec.json.Decoder(_OkxFrame)
+    
+    def decode(self, message: Union[str, bytes]) -> DecodedFrame:
+        # 不含頻道名的消息（深度、成交等）不可能是ticker，直接通用解析，避免解析兩次
+        if ("\"tickers\"" if isinstance(message, str) else b'"tickers"') not in message:
+            return DecodedFrame([], self.loads(message))
+        
+        try:
+            frame = self._decoder.decode(message)
+            if frame.arg is not None and frame.arg.channel == "tickers" and frame.data is not None:
+                return DecodedFrame([
+                    (ticker.instId, float(ticker.last), int(ticker.ts))
+                    for ticker in frame.data
+                ])
+        except msgspec.DecodeError:
+            pass
+        
+        # 非ticker消息或結構不符時退回通用解析
+        return DecodedFrame([], self.loads(message))
+
+
+# 各後端對應的解碼器類
+_DECODERS = {
+    "binance": {"msgspec": BinanceMsgspecDecoder, "json": BinanceJsonDecoder},
+    "okx": {"msgspec": OkxMsgspecDecoder, "json": OkxJsonDecoder},
+}
+
+
+def available_backends() -> List[str]:
+    """
+    獲取當前環境可用的解碼後端，按速度從快到慢排列
+    
+    Returns:
+        後端名稱列表，例如 ["msgspec", "orjson", "json"]
+    """
+    backends = []
+    if msgspec is not None:
+        backends.append("msgspec")
+    if orjson is not None:
+        backends.append("orjson")
+    backends.append("json")
+    return backends
+
+
+def create_ticker_decoder(exchange: str, backend: Optional[str] = None) -> TickerDecoder:
+    """
+    創建交易所的行情解碼器
+    
+    Args:
+        exchange: 交易所ID，"binance" 或 "okx"
+        backend: 解碼後端，None表示使用環境變數 PRICE_DECODER_BACKEND 或最快的可用後端
+    
+    Returns:
+        行情解碼器
+    """
+    exchange = exchange.lower()
+    if exchange not in _DECODERS:
+        raise ValueError(f"不支持的交易所: {exchange}")
+    
+    available = available_backends()
+    backend = (backend or os.environ.get("PRICE_DECODER_BACKEND") or available[0]).lower()
+    if backend not in available:
+        logger.warning(f"解碼後端 {backend} 不可用，使用 {available[0]}")
+        backend = available[0]
+    
+    # 非ticker消息使用最快的通用JSON解析
+    loads = orjson.loads if orjson is not None else json.loads
+    
+    if backend == "msgspec":
+        return _DECODERS[exchange]["msgspec"](loads)
+    
+    decoder = _DECODERS[exchange]["json"](orjson.loads if backend == "orjson" else json.loads)
+    decoder.backend = backend
+    return decoder
@@ -0,0 +1,279 @@
+"""
+WebSocket端點池
+
+管理同一交易所市場的多個備用WebSocket端點：按握手延遲排序、記錄連接失敗，
+並通過熔斷器限制連續失敗後的重連頻率，避免交易所故障時所有連接同時反覆重連。
+同一交易所市場的所有連接（分片）共享一個端點池。
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Any
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    重連熔斷器
+    
+    連續失敗達到閾值後打開，在冷卻時間內拒絕連接嘗試；冷卻結束後進入半開狀態，
+    只允許一個嘗試通過，成功則關閉，失敗則重新打開並加倍冷卻時間。
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 30, max_reset_timeout: float = 300):
+        """
+        初始化熔斷器
+        
+        Args:
+            failure_threshold: 打開熔斷器的連續失敗次數
+            reset_timeout: 首次打開後的冷卻時間（秒）
+            max_reset_timeout: 冷卻時間上限（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._current_timeout = reset_timeout
+        self._half_open_in_flight = False
+        
+        # 熔斷器打開的次數
+        self.trips = 0
+    
+    def retry_after(self) -> float:
+        """
+        距離允許下一次嘗試的秒數
+        
+        Returns:
+            需要等待的秒數，0表示現在可以嘗試
+        """
+        if self.state == self.OPEN:
+            return max(0.0, self.opened_at + self._current_timeout - time.monotonic())
+        if self.state == self.HALF_OPEN and self._half_open_in_flight:
+            # 等待半開狀態下的試探結果
+            return 1.0
+        return 0.0
+    
+    def try_acquire(self) -> bool:
+        """
+        申請一次連接嘗試
+        
+        Returns:
+            是否允許嘗試
+        """
+        if self.state == self.CLOSED:
+            return True
+        
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                return False
+            self.state = self.HALF_OPEN
+        
+        if self._half_open_in_flight:
+            return False
+        self._half_open_in_flight = True
+        return True
+    
+    def release(self) -> None:
+        """嘗試被取消、沒有結果時釋放半開狀態的試探名額"""
+        self._half_open_in_flight = False
+    
+    def record_success(self) -> None:
+        """記錄連接成功，關閉熔斷器"""
+        if self.state != self.CLOSED:
+            logger.info("重連熔斷器已關閉")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._current_timeout = self.reset_timeout
+        self._half_open_in_flight = False
+    
+    def record_failure(self) -> None:
+        """記錄連接失敗，達到閾值或半開試探失敗時打開熔斷器"""
+        self.failures += 1
+        
+        if self.state == self.HALF_OPEN:
+            self._current_timeout = min(self._current_timeout * 2, self.max_reset_timeout)
+            self._trip()
+        elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._trip()
+    
+    def _trip(self) -> None:
+        """打開熔斷器"""
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._half_open_in_flight = False
+        self.trips += 1
+        logger.warning(f"重連熔斷器已打開: 連續失敗{self.failures}次，{self._current_timeout:.0f}秒內暫停重連")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """導出熔斷器狀態"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "retry_after": round(self.retry_after(), 3)
+        }
+
+
+class EndpointPool:
+    """
+    交易所市場的WebSocket端點池
+    """
+    
+    # 重新探測端點延遲的間隔（秒）
+    PROBE_INTERVAL = 300
+    
+    # 握手超時時間（秒）
+    CONNECT_TIMEOUT = 10
+    
+    def __init__(self, name: str, urls: List[str], failure_threshold: int = 10):
+        """
+        初始化端點池
+        
+        Args:
+            name: 端點池名稱，例如 "Binance spot"
+            urls: 端點URL列表，第一個為默認端點
+            failure_threshold: 打開熔斷器的連續失敗次數
+        """
+        if not urls:
+            raise ValueError("urls 不能為空")
+        
+        self.name = name
+        self.urls = list(dict.fromkeys(urls))
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold)
+        
+        # 最近一次握手延遲（毫秒）和連續失敗次數
+        self.latencies: Dict[str, float] = {}
+        self.failures: Dict[str, int] = {url: 0 for url in self.urls}
+        
+        self.last_probe = 0.0
+        self._probe_lock = asyncio.Lock()
+    
+    def ranked(self) -> List[str]:
+        """
+        按優先順序排列的端點：沒有連續失敗的優先，其次按握手延遲，未測量的按配置順序排在已測量的之後
+        
+        Returns:
+            端點URL列表
+        """
+        order = {url: index for index, url in enumerate(self.urls)}
+        return sorted(self.urls, key=lambda url: (
+            self.failures[url],
+            self.latencies.get(url, float("inf")),
+            order[url]
+        ))
+    
+    def record_success(self, url: str, latency_ms: float) -> None:
+        """
+        記錄端點連接成功
+        
+        Args:
+            url: 端點URL
+            latency_ms: 握手延遲（毫秒）
+        """
+        self.latencies[url] = latency_ms
+        self.failures[url] = 0
+    
+    def record_failure(self, url: str) -> None:
+        """
+        記錄端點連接失敗
+        
+        Args:
+            url: 端點URL
+        """
+        self.failures[url] += 1
+    
+    def needs_probe(self) -> bool:
+        """是否需要重新探測端點延遲（只有一個端點時不需要）"""
+        return len(self.urls) > 1 and time.monotonic() - self.last_probe >= self.PROBE_INTERVAL
+    
+    async def probe(self, session: aiohttp.ClientSession) -> None:
+        """
+        並發與所有端點握手並立即關閉，按握手延遲更新排序（其他連接正在探測時等待其結果）
+        
+        Args:
+            session: 用於握手的HTTP會話
+        """
+        async with self._probe_lock:
+            if not self.needs_probe():
+                return
+            
+            async def handshake(url: str) -> None:
+                start = time.perf_counter()
+                try:
+                    ws = await asyncio.wait_for(session.ws_connect(url), self.CONNECT_TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"{self.name}端點探測失敗: {url}, 錯誤: {e}")
+                    self.record_failure(url)
+                    return
+                self.record_success(url, (time.perf_counter() - start) * 1000)
+                await ws.close()
+            
+            await asyncio.gather(*(handshake(url) for url in self.urls))
+            self.last_probe = time.monotonic()
+            logger.info(f"{self.name}端點延遲排序: "
+                        + ", ".join(f"{url} ({self.latencies.get(url, float('inf')):.0f}ms)" for url in self.ranked()))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """導出端點池狀態"""
+        return {
+            "endpoints": [
+                {
+                    "url": url,
+                    "latency_ms": round(self.latencies[url], 3) if url in self.latencies else None,
+                    "failures": self.failures[url]
+                }
+                for url in self.ranked()
+            ],
+            "breaker": self.breaker.to_dict()
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    帶隨機抖動的指數退避延遲，避免大量連接在同一時刻重連
+    
+    Args:
+        attempt: 第幾次重試（從1開始）
+        base: 基礎延遲（秒）
+        cap: 延遲上限（秒）
+    
+    Returns:
+        延遲秒數，介於上限值的一半到上限值之間
+    """
+    delay = min(cap, base * (2 ** min(attempt - 1, 16)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+# 所有連接共享的端點池 {("Binance", ("wss://...", ...)): EndpointPool}
+_pools: Dict[Any, EndpointPool] = {}
+
+
+def get_endpoint_pool(name: str, urls: List[str], failure_threshold: int = 10) -> EndpointPool:
+    """
+    獲取端點池，相同名稱和端點列表的連接共享同一個端點池
+    
+    Args:
+        name: 端點池名稱
+        urls: 端點URL列表
+        failure_threshold: 打開熔斷器的連續失敗次數
+    
+    Returns:
+        端點池
+    """
+    key = (name, tuple(urls))
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = EndpointPool(name, urls, failure_threshold)
+    return pool
@@ -177,6 +177,82 @@ class ExchangeInfoService:
         # 返回空列表，如果請求失敗
         return []
     
+    async def get_binance_instruments(self, market_type: str = "spot", force_refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        獲取幣安交易對的原始信息（exchangeInfo 中的 symbols）
+        
+        Args:
+            market_type: 市場類型，"spot"(現貨) 或 "futures"(合約)
+            force_refresh: 是否強制刷新緩存
+            
+        Returns:
+            交易對信息列表，包含 symbol、baseAsset、quoteAsset、status 等字段
+        """
+        cache_key = f"binance_{market_type}_instruments"
+        
+        # 檢查緩存
+        if not force_refresh and cache_key in self.cache and (
+                asyncio.get_event_loop().time() - self.cache_timestamp.get(cache_key, 0) < self.cache_ttl):
+            return self.cache[cache_key]
+        
+        url = self.BINANCE_FUTURES_API if market_type == "futures" else self.BINANCE_SPOT_API
+        
+        # 發送請求
+        try:
+            response = await self._make_request(url)
+            
+            if response and "symbols" in response:
+                instruments = [symbol for symbol in response["symbols"] if symbol.get("status") == "TRADING"]
+                
+                # 更新緩存
+                self.cache[cache_key] = instruments
+                self.cache_timestamp[cache_key] = asyncio.get_event_loop().time()
+                
+                logger.info(f"已獲取幣安{market_type}交易對信息，共 {len(instruments)} 個交易對")
+                return instruments
+        except Exception as e:
+            logger.error(f"獲取幣安{market_type}交易對信息失敗: {e}")
+        
+        # 返回空列表，如果請求失敗
+        return []
+    
+    async def get_okx_instruments(self, inst_type: str = "SPOT", force_refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        獲取OKX產品的原始信息（instruments）
+        
+        Args:
+            inst_type: 產品類型，"SPOT"(現貨), "SWAP"(永續合約), "FUTURES"(交割合約)
+            force_refresh: 是否強制刷新緩存
+            
+        Returns:
+            產品信息列表，包含 instId、baseCcy、quoteCcy、uly、expTime 等字段
+        """
+        cache_key = f"okx_{inst_type.lower()}_instruments"
+        
+        # 檢查緩存
+        if not force_refresh and cache_key in self.cache and (
+                asyncio.get_event_loop().time() - self.cache_timestamp.get(cache_key, 0) < self.cache_ttl):
+            return self.cache[cache_key]
+        
+        # 發送請求
+        try:
+            response = await self._make_request(self.OKX_API, {"instType": inst_type})
+            
+            if response and "data" in response:
+                instruments = [instrument for instrument in response["data"] if instrument.get("state") == "live"]
+                
+                # 更新緩存
+                self.cache[cache_key] = instruments
+                self.cache_timestamp[cache_key] = asyncio.get_event_loop().time()
+                
+                logger.info(f"已獲取OKX {inst_type} 產品信息，共 {len(instruments)} 個產品")
+                return instruments
+        except Exception as e:
+            logger.error(f"獲取OKX {inst_type} 產品信息失敗: {e}")
+        
+        # 返回空列表，如果請求失敗
+        return []
+    
     async def get_all_symbols(self, market_type: str) -> Dict[str, List[str]]:
         """
         獲取所有交易所的交易對列表
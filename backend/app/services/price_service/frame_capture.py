@@ -0,0 +1,253 @@
+"""
+原始消息錄製與回放
+
+錄製器將WebSocket收到的每個原始數據消息及其接收時間追加寫入緊湊的二進制文件，
+讀取器以mmap映射文件逐條讀取，回放驅動按原速、N倍速或最快速度將消息送入WebSocket客戶端的
+消息處理流程，不需要網絡連接，可用於離線重現線上問題；以最快速度回放時即為消息處理吞吐量基準測試。
+
+文件格式（小端序）:
+    文件頭: MAGIC(8字節) + 元數據長度(uint32) + 元數據(UTF-8 JSON)
+    每條記錄: 接收時間(int64，Unix納秒) + 類型(uint8，1為文本，2為二進制) + 長度(uint32) + 消息內容
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterator, Optional, Any, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PXFRAME1"
+
+# 消息類型
+TEXT = 1
+BINARY = 2
+
+_META_LENGTH = struct.Struct("<I")
+_RECORD = struct.Struct("<qBI")
+
+# 回放的消息：(接收時間(納秒), 是否為二進制, 消息內容)
+Frame = Tuple[int, bool, Union[str, bytes]]
+
+
+class FrameRecorder:
+    """
+    原始消息錄製器，以追加方式寫入文件
+    
+    寫入經過緩衝，緩衝區滿或調用 flush/close 時才寫入磁盤。
+    """
+    
+    def __init__(self, path: str, metadata: Optional[Dict[str, Any]] = None, buffer_size: int = 1 << 20):
+        """
+        初始化錄製器，文件已存在時在末尾繼續追加
+        
+        Args:
+            path: 錄製文件路徑
+            metadata: 寫入文件頭的元數據，例如 {"exchange": "Binance", "url": "wss://..."}
+            buffer_size: 寫入緩衝區大小（字節）
+        """
+        self.path = path
+        self._file = open(path, "ab", buffering=buffer_size)
+        
+        if self._file.tell() == 0:
+            meta = json.dumps(metadata or {}, ensure_ascii=False).encode("utf-8")
+            self._file.write(MAGIC + _META_LENGTH.pack(len(meta)) + meta)
+        else:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise ValueError(f"不是有效的錄製文件: {path}")
+        
+        # 統計
+        self.frames = 0
+        self.bytes = 0
+    
+    @property
+    def closed(self) -> bool:
+        """錄製器是否已關閉"""
+        return self._file.closed
+    
+    def write(self, binary: bool, data: Union[str, bytes], timestamp_ns: Optional[int] = None) -> None:
+        """
+        追加一條消息
+        
+        Args:
+            binary: 是否為二進制消息
+            data: 消息內容
+            timestamp_ns: 接收時間（Unix納秒），None表示現在
+        """
+        payload = data if binary else data.encode("utf-8")
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        
+        self._file.write(_RECORD.pack(timestamp_ns, BINARY if binary else TEXT, len(payload)))
+        self._file.write(payload)
+        self.frames += 1
+        self.bytes += len(payload)
+    
+    def flush(self) -> None:
+        """將緩衝區寫入磁盤"""
+        if not self._file.closed:
+            self._file.flush()
+    
+    def close(self) -> None:
+        """關閉錄製文件"""
+        if not self._file.closed:
+            self._file.close()
+
+
+class FrameReader:
+    """
+    錄製文件讀取器，以mmap映射文件按順序讀取消息
+    """
+    
+    def __init__(self, path: str):
+        """
+        打開錄製文件
+        
+        Args:
+            path: 錄製文件路徑
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"不是有效的錄製文件: {path}")
+        
+        header_size = len(MAGIC) + _META_LENGTH.size
+        if len(self._map) < header_size or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的錄製文件: {path}")
+        
+        meta_length, = _META_LENGTH.unpack_from(self._map, len(MAGIC))
+        self.metadata: Dict[str, Any] = json.loads(bytes(self._map[header_size:header_size + meta_length]))
+        self._start = header_size + meta_length
+    
+    def __enter__(self) -> "FrameReader":
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+    
+    def __iter__(self) -> Iterator[Frame]:
+        """
+        按錄製順序讀取消息，寫入中斷造成的不完整記錄會被忽略
+        
+        Returns:
+            消息迭代器，每條消息為 (接收時間(納秒), 是否為二進制, 消息內容)
+        """
+        buffer = self._map
+        end = len(buffer)
+        offset = self._start
+        record_size = _RECORD.size
+        unpack_from = _RECORD.unpack_from
+        
+        while offset + record_size <= end:
+            timestamp_ns, frame_type, length = unpack_from(buffer, offset)
+            offset += record_size
+            if offset + length > end:
+                break
+            payload = buffer[offset:offset + length]
+            offset += length
+            
+            if frame_type == BINARY:
+                yield timestamp_ns, True, payload
+            else:
+                yield timestamp_ns, False, payload.decode("utf-8")
+    
+    def close(self) -> None:
+        """關閉文件映射"""
+        if hasattr(self, "_map") and not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+
+async def replay_capture(client: Any, path: str, speed: float = 0.0, yield_every: int = 100) -> Dict[str, Any]:
+    """
+    將錄製文件中的消息按順序送入WebSocket客戶端的消息處理流程，不需要網絡連接
+    
+    消息直接交給客戶端的 _process_message / _process_binary_message 逐條處理，不經過待處理隊列，
+    結果與消息順序一一對應。訂單簿的REST快照不在錄製範圍內，回放時需要自行準備。
+    
+    Args:
+        client: WebSocket客戶端，例如 BinanceWebSocket 或 OkxWebSocket 實例
+        path: 錄製文件路徑
+        speed: 回放速度，1為原速，N為N倍速，0表示以最快速度回放
+        yield_every: 最快速度回放時每處理多少條消息讓出一次事件循環
+    
+    Returns:
+        回放統計，例如 {"frames": 100000, "ticks": 98000, "elapsed": 1.2, "frames_per_sec": 83333.3, ...}
+    """
+    ticks = 0
+    
+    def count_tick(symbol: str, price: float) -> None:
+        nonlocal ticks
+        ticks += 1
+    
+    client.add_price_callback(count_tick)
+    frames = 0
+    total_bytes = 0
+    errors = 0
+    first_ts: Optional[int] = None
+    
+    try:
+        with FrameReader(path) as reader:
+            start = time.perf_counter()
+            for timestamp_ns, binary, data in reader:
+                if speed > 0:
+                    if first_ts is None:
+                        first_ts = timestamp_ns
+                    delay = (timestamp_ns - first_ts) / 1e9 / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                elif frames % yield_every == 0:
+                    await asyncio.sleep(0)
+                
+                # 以回放時間作為接收時間，處理延遲統計與線上一致
+                client._frame_received_ns = time.time_ns()
+                try:
+                    if binary:
+                        await client._process_binary_message(data)
+                    else:
+                        await client._process_message(data)
+                except Exception as e:
+                    errors += 1
+                    logger.error(f"回放消息時發生錯誤: {e}")
+                
+                frames += 1
+                total_bytes += len(data)
+            elapsed = time.perf_counter() - start
+    finally:
+        client.remove_price_callback(count_tick)
+    
+    return {
+        "frames": frames,
+        "ticks": ticks,
+        "bytes": total_bytes,
+        "errors": errors,
+        "elapsed": round(elapsed, 6),
+        "frames_per_sec": round(frames / elapsed, 1) if elapsed > 0 else None,
+        "ticks_per_sec": round(ticks / elapsed, 1) if elapsed > 0 else None
+    }
+
+
+def capture_path(record_dir: str, exchange_name: str) -> str:
+    """
+    為新的錄製文件生成路徑，例如 "captures/binance_20240101-120000_7f3a2c.frames"
+    
+    Args:
+        record_dir: 錄製目錄，不存在時自動創建
+        exchange_name: 交易所名稱
+    
+    Returns:
+        錄製文件路徑
+    """
+    os.makedirs(record_dir, exist_ok=True)
+    name = f"{exchange_name.lower()}_{time.strftime('%Y%m%d-%H%M%S')}_{os.urandom(3).hex()}.frames"
+    return os.path.join(record_dir, name)
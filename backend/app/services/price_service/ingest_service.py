@@ -0,0 +1,248 @@
+"""
+獨立的行情接入進程
+
+在單獨的進程中運行 PriceManager 並維護所有交易所WebSocket連接，將每個tick寫入共享內存價格表，
+API進程（可以有多個uvicorn worker）通過 RemotePriceManager 讀取價格，交易所連接不會因worker數量而重複，
+API請求和行情處理也不會互相阻塞事件循環。
+
+訂閱、訂單簿查詢、狀態查詢等請求通過本地控制連接（multiprocessing.connection）轉發到本進程執行。
+
+用法（在 backend 目錄下）:
+    python -m app.services.price_service.ingest_service
+
+環境變數:
+    PRICE_SHM_NAME: 共享內存價格表名稱，默認 "crypto_monitor_prices"
+    PRICE_SHM_SLOTS: 價格表槽位數量（交易所 × 交易對），默認 4096
+    PRICE_INGEST_ADDRESS: 控制連接監聽地址，默認 "127.0.0.1:8790"，非本機地址需要設置 PRICE_INGEST_ALLOW_REMOTE=true
+    PRICE_INGEST_AUTHKEY: 控制連接的認證密鑰，API進程必須使用相同的值；
+        未設置時行情接入進程生成隨機密鑰寫入 PRICE_INGEST_AUTHKEY_FILE（默認 "config/ingest.key"，權限0600），
+        API進程從同一文件讀取
+
+控制連接的消息以pickle傳輸，能通過認證的進程可以在本進程中執行任意代碼，因此不提供固定的默認密鑰，
+並且默認只允許監聽本機地址。
+"""
+
+import asyncio
+import concurrent.futures
+import ipaddress
+import logging
+import os
+import secrets
+import signal
+import threading
+from multiprocessing.connection import Connection, Listener
+from typing import Any, Dict, Tuple
+
+from app.services.price_service.price_manager import PriceManager
+from app.services.price_service.shared_prices import SharedPriceTable
+
+logger = logging.getLogger(__name__)
+
+# API進程可以遠程調用的 PriceManager 方法
+REMOTE_METHODS = {
+    "subscribe_symbol", "unsubscribe_symbol", "subscribe_symbols", "unsubscribe_symbols",
+    "subscribe_order_book", "unsubscribe_order_book", "get_order_book", "get_best_bid_ask",
+    "subscribe_trades", "unsubscribe_trades", "get_recent_trades", "get_trades_between",
+    "get_candles", "get_price_history", "get_history_stats", "get_top_spreads", "get_spread",
+    "add_alert", "update_alert", "remove_alert", "get_alert", "get_alerts", "get_alert_events", "get_alert_stats",
+    "get_price_stats", "get_rolling_stats_usage",
+    "get_subscribed_symbols", "get_symbol_market_types",
+    "get_exchange_status", "get_connection_load", "get_endpoint_stats", "get_publish_stats",
+    "get_subscriber_stats", "get_subscription_stats", "get_staleness", "get_latency_stats"
+}
+
+# 遠程調用的超時時間（秒）
+CALL_TIMEOUT = 60
+
+
+def shm_name() -> str:
+    """共享內存價格表名稱"""
+    return os.environ.get("PRICE_SHM_NAME", "crypto_monitor_prices")
+
+
+def ingest_address() -> Tuple[str, int]:
+    """
+    控制連接地址
+    
+    Raises:
+        ValueError: 地址不是本機地址且沒有設置 PRICE_INGEST_ALLOW_REMOTE=true
+    """
+    host, _, port = os.environ.get("PRICE_INGEST_ADDRESS", "127.0.0.1:8790").rpartition(":")
+    host = host.strip("[]") or "127.0.0.1"
+    
+    if host != "localhost" and os.environ.get("PRICE_INGEST_ALLOW_REMOTE", "false").lower() != "true":
+        try:
+            loopback = ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback:
+            raise ValueError(f"控制連接地址 {host} 不是本機地址；控制連接可以執行任意代碼，"
+                             f"確實需要跨主機訪問時請設置 PRICE_INGEST_ALLOW_REMOTE=true")
+    return host, int(port)
+
+
+def ingest_authkey(create: bool = False) -> bytes:
+    """
+    控制連接的認證密鑰：優先使用 PRICE_INGEST_AUTHKEY，否則讀取密鑰文件
+    
+    Args:
+        create: 密鑰文件不存在時是否生成隨機密鑰（行情接入進程）
+    
+    Returns:
+        認證密鑰
+    
+    Raises:
+        RuntimeError: 沒有設置密鑰且密鑰文件不存在
+    """
+    authkey = os.environ.get("PRICE_INGEST_AUTHKEY")
+    if authkey:
+        return authkey.encode("utf-8")
+    
+    path = os.environ.get("PRICE_INGEST_AUTHKEY_FILE", "config/ingest.key")
+    if create and not os.path.exists(path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            logger.info(f"已生成控制連接密鑰: {path}")
+    
+    try:
+        with open(path, "r") as f:
+            authkey = f.read().strip()
+    except FileNotFoundError:
+        authkey = ""
+    if not authkey:
+        raise RuntimeError(f"沒有設置 PRICE_INGEST_AUTHKEY，密鑰文件 {path} 也不存在或為空，請先啟動行情接入進程")
+    return authkey.encode("utf-8")
+
+
+class IngestControlServer:
+    """
+    控制連接伺服器，在後台線程中接受API進程的請求並交給事件循環中的 PriceManager 執行
+    """
+    
+    def __init__(self, manager: PriceManager, loop: asyncio.AbstractEventLoop):
+        """
+        初始化控制伺服器
+        
+        Args:
+            manager: 價格管理器
+            loop: PriceManager 所在的事件循環
+        """
+        self.manager = manager
+        self.loop = loop
+        self.listener = Listener(ingest_address(), authkey=ingest_authkey(create=True))
+        self._closed = False
+    
+    def start(self) -> None:
+        """啟動接受連接的後台線程"""
+        threading.Thread(target=self._accept_loop, name="ingest-control", daemon=True).start()
+        logger.info(f"行情接入控制連接已監聽: {self.listener.address}")
+    
+    def close(self) -> None:
+        """停止接受連接"""
+        self._closed = True
+        self.listener.close()
+    
+    def _accept_loop(self) -> None:
+        """接受連接，每個API進程的連接由單獨的線程處理"""
+        while not self._closed:
+            try:
+                connection = self.listener.accept()
+            except (EOFError, OSError) as e:
+                # 端口探測等在握手前斷開的連接
+                if not self._closed:
+                    logger.debug(f"控制連接在握手時斷開: {e}")
+                continue
+            except Exception as e:
+                if not self._closed:
+                    logger.error(f"接受控制連接失敗: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+    
+    def _serve(self, connection: Connection) -> None:
+        """處理單個連接上的請求：(方法名, 位置參數, 關鍵字參數) → (是否成功, 結果或錯誤信息)"""
+        with connection:
+            while not self._closed:
+                try:
+                    method, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    return
+                
+                try:
+                    future = asyncio.run_coroutine_threadsafe(self._invoke(method, args, kwargs), self.loop)
+                    try:
+                        result = future.result(CALL_TIMEOUT)
+                    except concurrent.futures.TimeoutError:
+                        # 超時後取消協程，不讓它在事件循環中繼續執行
+                        future.cancel()
+                        raise
+                    response = (True, result)
+                except Exception as e:
+                    response = (False, f"{type(e).__name__}: {e}")
+                
+                try:
+                    connection.send(response)
+                except (EOFError, OSError):
+                    return
+    
+    async def _invoke(self, method: str, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        """在事件循環中執行 PriceManager 方法"""
+        if method not in REMOTE_METHODS:
+            raise ValueError(f"不支持遠程調用的方法: {method}")
+        
+        result = getattr(self.manager, method)(*args, **kwargs)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+
+async def run_ingest_service() -> None:
+    """運行行情接入進程，直到收到 SIGINT / SIGTERM"""
+    manager = PriceManager()
+    table = SharedPriceTable.create(shm_name(), int(os.environ.get("PRICE_SHM_SLOTS", "4096")))
+    manager.add_price_callback(table.write, raw=True)
+    # 向交易所取消訂閱後（可能在寬限期之後）清除共享內存中的價格
+    manager.add_unsubscribe_callback(table.remove)
+    # API進程從共享內存讀取價格時記錄的讀取時間，超出訂閱預算時用於淘汰最久未讀取的訂閱
+    manager.add_read_time_source(table.read_times)
+    
+    # 從快照恢復的價格以快照時間寫入共享內存，讀取進程據此將其標記為過期
+    manager.restore_snapshot()
+    if manager.restored_at is not None:
+        for exchange_id, symbol in manager.restored_prices:
+            table.write(exchange_id, symbol, manager.latest_prices[symbol][exchange_id], manager.restored_at)
+        table.mark_restored(manager.restored_at)
+    
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # pragma: no cover - Windows
+            pass
+    
+    server = IngestControlServer(manager, loop)
+    server.start()
+    logger.info(f"行情接入進程已啟動，共享內存價格表: {shm_name()}（{table.capacity}個槽位）")
+    
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await manager.close_all()
+        table.close()
+        logger.info("行情接入進程已關閉")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(run_ingest_service())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+行情延遲統計
+
+為每個tick記錄三個時間點：交易所事件時間、本地收到消息的時間、價格回調執行完成的時間，
+分別統計網絡延遲（交易所 → 收到）、處理延遲（收到 → 回調完成）和總延遲（交易所 → 回調完成），
+用於判斷延遲來自網絡還是本地處理。
+
+本地時間按 time_sync 的幣安時間偏移校正到交易所時鐘；OKX沒有單獨的時間同步，同樣使用幣安偏移
+（兩者都以UTC為準）。延遲分佈使用HDR風格的對數-線性直方圖，記錄和合併都是O(1)，記憶體固定。
+"""
+
+from typing import Dict, List, Optional, Any
+
+from app.utils.time_sync import time_sync
+
+# 每個2的冪區間內的線性子桶數量，決定相對精度（約1.6%）
+_SUB_BUCKETS = 64
+_SUB_BITS = 7
+
+# 統計的延遲階段
+STAGES = ("network", "processing", "total")
+
+
+class LatencyHistogram:
+    """
+    HDR風格的延遲直方圖（微秒）
+    
+    小於128微秒的值精確記錄，更大的值在每個2的冪區間內分為64個線性子桶。
+    """
+    
+    __slots__ = ("max_value", "counts", "count", "total", "min", "max", "negative")
+    
+    def __init__(self, max_value: int = 3600 * 1000000):
+        """
+        初始化直方圖
+        
+        Args:
+            max_value: 可記錄的最大值（微秒），超過時按最大值記錄
+        """
+        self.max_value = max_value
+        self.counts: List[int] = [0] * (self._index(max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        
+        # 因時鐘誤差出現的負延遲次數（按0記錄）
+        self.negative = 0
+    
+    @staticmethod
+    def _index(value: int) -> int:
+        """值所在的桶"""
+        shift = value.bit_length() - _SUB_BITS
+        if shift <= 0:
+            return value
+        return _SUB_BUCKETS * shift + (value >> shift)
+    
+    @staticmethod
+    def _upper_bound(index: int) -> int:
+        """桶內的最大值"""
+        if index < _SUB_BUCKETS * 2:
+            return index
+        shift = index // _SUB_BUCKETS - 1
+        return ((index - _SUB_BUCKETS * shift) << shift) + (1 << shift) - 1
+    
+    def record(self, value: int) -> None:
+        """
+        記錄一個延遲值
+        
+        Args:
+            value: 延遲（微秒）
+        """
+        if value < 0:
+            self.negative += 1
+            value = 0
+        elif value > self.max_value:
+            value = self.max_value
+        
+        self.counts[self._index(value)] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+    
+    def merge(self, other: "LatencyHistogram") -> None:
+        """
+        將另一個直方圖合併到本直方圖（兩者的 max_value 必須相同）
+        
+        Args:
+            other: 要合併的直方圖
+        """
+        if other.count == 0:
+            return
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.min = other.min if self.count == 0 else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+        self.negative += other.negative
+    
+    def percentile(self, q: float) -> int:
+        """
+        計算百分位數
+        
+        Args:
+            q: 百分位，例如 99.9
+        
+        Returns:
+            延遲（微秒），沒有數據時返回0
+        """
+        if self.count == 0:
+            return 0
+        target = max(1, int(round(self.count * q / 100)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+    
+    def reset(self) -> None:
+        """清空直方圖"""
+        self.counts = [0] * len(self.counts)
+        self.count = self.total = self.min = self.max = self.negative = 0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        導出統計（毫秒）
+        
+        Returns:
+            例如 {"count": 1000, "mean": 12.3, "p50": 10.1, "p99": 40.2, "p999": 80.5, "max": 95.0, ...}
+        """
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count / 1000, 3),
+            "min": round(self.min / 1000, 3),
+            "p50": round(self.percentile(50) / 1000, 3),
+            "p90": round(self.percentile(90) / 1000, 3),
+            "p99": round(self.percentile(99) / 1000, 3),
+            "p999": round(self.percentile(99.9) / 1000, 3),
+            "max": round(self.max / 1000, 3),
+            "negative": self.negative
+        }
+
+
+class LatencyTracker:
+    """
+    單個連接的行情延遲統計
+    """
+    
+    # 重新讀取時間偏移的間隔（納秒）
+    CLOCK_REFRESH_NS = 60 * 1000000000
+    
+    def __init__(self):
+        """初始化延遲統計"""
+        self.histograms: Dict[str, LatencyHistogram] = {stage: LatencyHistogram() for stage in STAGES}
+        
+        # 本地時間校正到交易所時鐘的偏移（納秒）
+        self.clock_offset_ns = 0
+        self._clock_checked_ns = 0
+    
+    def record(self, event_time_ms: int, received_ns: int, done_ns: int) -> None:
+        """
+        記錄一個tick的延遲
+        
+        Args:
+            event_time_ms: 交易所事件時間（Unix毫秒），0表示消息沒有事件時間
+            received_ns: 本地收到消息的時間（time.time_ns()）
+            done_ns: 價格回調執行完成的時間（time.time_ns()）
+        """
+        histograms = self.histograms
+        histograms["processing"].record((done_ns - received_ns) // 1000)
+        
+        if not event_time_ms:
+            return
+        
+        if done_ns - self._clock_checked_ns >= self.CLOCK_REFRESH_NS:
+            self._refresh_clock_offset(done_ns)
+        
+        event_ns = event_time_ms * 1000000 - self.clock_offset_ns
+        histograms["network"].record((received_ns - event_ns) // 1000)
+        histograms["total"].record((done_ns - event_ns) // 1000)
+    
+    def _refresh_clock_offset(self, now_ns: int) -> None:
+        """從 time_sync 讀取時間偏移（Google時間包含台北時區的8小時，不能使用）"""
+        self._clock_checked_ns = now_ns
+        offset = time_sync.time_offsets.get("binance")
+        if offset is not None:
+            self.clock_offset_ns = int(offset * 1e9)
+    
+    def reset(self) -> None:
+        """清空所有直方圖"""
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+
+def merge_trackers(trackers: List[LatencyTracker]) -> Optional[Dict[str, Any]]:
+    """
+    合併多個連接的延遲統計
+    
+    Args:
+        trackers: 延遲統計列表
+    
+    Returns:
+        各階段的延遲統計（毫秒），例如 {"network": {...}, "processing": {...}, "total": {...}, "clock_offset_ms": 1.2}，
+        沒有連接時返回None
+    """
+    if not trackers:
+        return None
+    
+    stats: Dict[str, Any] = {}
+    for stage in STAGES:
+        merged = LatencyHistogram()
+        for tracker in trackers:
+            merged.merge(tracker.histograms[stage])
+        stats[stage] = merged.to_dict()
+    stats["clock_offset_ms"] = round(trackers[0].clock_offset_ns / 1e6, 3)
+    return stats
@@ -5,12 +5,17 @@ OKX WebSocket 連接類
 支持現貨、交割和永續合約市場。
 """
 
+import asyncio
 import json
 import logging
-import time
+import zlib
 from typing import Dict, List, Optional, Any
 
-from app.services.price_service.websocket_base import WebSocketBase
+from app.services.price_service.decoders import TickerDecoder, create_ticker_decoder
+from app.services.price_service.order_book import OrderBook
+from app.services.price_service.symbol_registry import symbol_registry
+from app.services.price_service.trade_buffer import BUY, SELL
+from app.services.price_service.websocket_base import WebSocketBase, OverflowPolicy
 
 logger = logging.getLogger(__name__)
 
@@ -22,35 +27,92 @@ class OkxWebSocket(WebSocketBase):
     # OKX WebSocket URL
     WS_URL = "wss://ws.okx.com:8443/ws/v5/public"
     
+    # 備用端點，與默認端點一起按握手延遲排序，默認端點不可用時自動切換
+    FALLBACK_WS_URLS = ["wss://wsaws.okx.com:8443/ws/v5/public"]
+    
+    # 訂單簿頻道及本地維護的檔位數
+    # books: 首次推送400檔全量，之後推送增量，每次推送都帶有校驗和
+    # books5: 每次推送5檔全量
+    BOOK_CHANNEL_DEPTHS = {"books": 400, "books5": 5}
+    
+    # 計算校驗和使用的檔位數
+    CHECKSUM_LEVELS = 25
+    
+    # OKX使用文本 "ping"/"pong" 作為心跳，不保證回應標準的ping幀
+    HEARTBEAT_REPLY = "pong"
+    
     def __init__(self, 
                  market_type: str = "spot",  # spot, swap, futures
                  ping_interval: int = 15,  # OKX建議15-30秒發送一次心跳
                  reconnect_delay: int = 5,
-                 max_reconnect_attempts: int = 10):
+                 max_reconnect_attempts: int = 10,
+                 decoder: Optional[TickerDecoder] = None,
+                 queue_size: int = 10000,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 book_channel: str = "books",
+                 trade_buffer_size: int = 10000,
+                 compress: bool = False,
+                 measure_wire: bool = False,
+                 record_dir: Optional[str] = None,
+                 track_latency: bool = True):
         """
         初始化OKX WebSocket客戶端
         
         Args:
             market_type: 市場類型，"spot"(現貨), "swap"(永續合約) 或 "futures"(交割合約)
             ping_interval: 心跳間隔（秒）
-            reconnect_delay: 重連延遲（秒）
-            max_reconnect_attempts: 最大重連嘗試次數
+            reconnect_delay: 重連退避的基礎延遲（秒）
+            max_reconnect_attempts: 連續重連失敗多少次後打開熔斷器暫停重連
+            decoder: 行情消息解碼器，None表示使用最快的可用解碼器
+            queue_size: 待處理消息隊列的容量
+            overflow_policy: 隊列已滿時的處理策略
+            book_channel: 訂單簿頻道，"books" 或 "books5"
+            trade_buffer_size: 每個交易對保留的成交筆數
+            compress: 是否協商 permessage-deflate 壓縮
+            measure_wire: 是否統計線上字節數和解壓耗時
+            record_dir: 錄製目錄，設置時錄製收到的所有原始消息
+            track_latency: 是否統計行情延遲
         """
         self.market_type = market_type.lower()
         
+        if book_channel not in self.BOOK_CHANNEL_DEPTHS:
+            raise ValueError(f"不支持的OKX訂單簿頻道: {book_channel}")
+        self.book_channel = book_channel
+        self.book_depth = self.BOOK_CHANNEL_DEPTHS[book_channel]
+        
         super().__init__(
             exchange_name="OKX",
             ws_url=self.WS_URL,
+            fallback_urls=self.FALLBACK_WS_URLS,
             ping_interval=ping_interval,
             reconnect_delay=reconnect_delay,
-            max_reconnect_attempts=max_reconnect_attempts
+            max_reconnect_attempts=max_reconnect_attempts,
+            queue_size=queue_size,
+            overflow_policy=overflow_policy,
+            trade_buffer_size=trade_buffer_size,
+            compress=compress,
+            measure_wire=measure_wire,
+            record_dir=record_dir,
+            track_latency=track_latency
         )
         
         # 為每個交易對維護最新價格
         self.latest_prices: Dict[str, float] = {}
         
-        # OKX的心跳回應時間監控
-        self.last_pong_time = 0
+        # 行情消息解碼器
+        self.decoder = decoder or create_ticker_decoder("okx")
+        
+        # 交易對映射表（所有OKX連接共享），包含 -SWAP 和交割合約ID
+        self.symbols = symbol_registry.table("okx", self.market_type)
+        
+        # 本地訂單簿 {"BTC/USDT": OrderBook}
+        self.order_books: Dict[str, OrderBook] = {}
+        
+        # 校驗失敗後正在重新訂閱的訂單簿任務
+        self._book_resync_tasks: Dict[str, asyncio.Task] = {}
+        
+        # 訂單簿校驗和或序號不一致的次數
+        self.book_checksum_failures = 0
     
     def _normalize_symbol(self, symbol: str) -> str:
         """
@@ -64,7 +126,12 @@ class OkxWebSocket(WebSocketBase):
         """
         if "/" not in symbol:
             return symbol  # 假設已經是OKX格式
-            
+        
+        okx_symbol = self.symbols.to_native(symbol)
+        if okx_symbol is not None:
+            return okx_symbol
+        
+        # 映射表中沒有時按市場類型拼接
         base, quote = symbol.split("/")
         
         if self.market_type == "swap":
@@ -84,11 +151,15 @@ class OkxWebSocket(WebSocketBase):
         Returns:
             標準格式的交易對，例如 "BTC/USDT"
         """
+        standard_symbol = self.symbols.to_standard(okx_symbol)
+        if standard_symbol is not None:
+            return standard_symbol
+        
         parts = okx_symbol.split("-")
         if len(parts) >= 2:
-            base = parts[0]
-            quote = parts[1]
-            return f"{base}/{quote}"
+            standard_symbol = f"{parts[0]}/{parts[1]}"
+            self.symbols.remember(okx_symbol, standard_symbol)
+            return standard_symbol
         return okx_symbol  # 如果無法解析，返回原始字符串
     
     def _get_instid(self, symbol: str) -> str:
@@ -215,16 +286,352 @@ class OkxWebSocket(WebSocketBase):
                     self.subscribed_symbols.remove(symbol)
                 if symbol in self.latest_prices:
                     del self.latest_prices[symbol]
+                self.last_update.pop(symbol, None)
             
             return True
         except Exception as e:
             logger.error(f"取消訂閱{self.exchange_name}交易對失敗: {e}")
             return False
     
+    async def disconnect(self) -> None:
+        """關閉WebSocket連接"""
+        self._reset_order_books()
+        await super().disconnect()
+    
+    async def _send_request(self, op: str, args: List[Dict[str, str]]) -> None:
+        """
+        發送訂閱類請求
+        
+        Args:
+            op: 操作，"subscribe" 或 "unsubscribe"
+            args: 頻道參數列表，例如 [{"channel": "tickers", "instId": "BTC-USDT"}]
+        """
+        await self.ws.send_str(json.dumps({"op": op, "args": args}))
+    
+    def _book_args(self, symbols: List[str]) -> List[Dict[str, str]]:
+        """生成訂單簿頻道的訂閱參數"""
+        return [{"channel": self.book_channel, "instId": self._get_instid(symbol)} for symbol in symbols]
+    
+    def _trade_args(self, symbols: List[str]) -> List[Dict[str, str]]:
+        """生成成交頻道的訂閱參數"""
+        return [{"channel": "trades", "instId": self._get_instid(symbol)} for symbol in symbols]
+    
+    async def _resubscribe(self) -> None:
+        """重新訂閱之前訂閱的交易對（重連後需要重新發送所有頻道）"""
+        if self.subscribed_symbols:
+            symbols = list(self.subscribed_symbols)
+            logger.info(f"重新訂閱{self.exchange_name}交易對: {len(symbols)}個")
+            
+            try:
+                await self._send_request("subscribe", [
+                    {"channel": "tickers", "instId": self._get_instid(symbol)} for symbol in symbols
+                ])
+            except Exception as e:
+                logger.error(f"重新訂閱{self.exchange_name}交易對失敗: {e}")
+        
+        if self.depth_symbols:
+            # 斷線期間遺漏了增量數據，訂單簿需要等待新的全量快照
+            symbols = list(self.depth_symbols)
+            self._reset_order_books()
+            for symbol in symbols:
+                self.order_books[symbol] = OrderBook(symbol)
+            
+            try:
+                await self._send_request("subscribe", self._book_args(symbols))
+            except Exception as e:
+                logger.error(f"重新訂閱{self.exchange_name}訂單簿失敗: {e}")
+        
+        if self.trade_symbols:
+            try:
+                await self._send_request("subscribe", self._trade_args(list(self.trade_symbols)))
+            except Exception as e:
+                logger.error(f"重新訂閱{self.exchange_name}成交數據失敗: {e}")
+    
+    async def subscribe_depth(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對的訂單簿數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            訂閱是否成功
+        """
+        if not self.ws or self.ws.closed:
+            logger.warning("嘗試在WebSocket關閉狀態下訂閱訂單簿，先嘗試連接")
+            if not await self.connect():
+                return False
+        
+        new_symbols = [s for s in dict.fromkeys(symbols) if s not in self.depth_symbols]
+        if not new_symbols:
+            return True
+        
+        # 先建立訂單簿，確保訂閱後推送的第一個快照不會被丟棄
+        for symbol in new_symbols:
+            self.order_books[symbol] = OrderBook(symbol)
+        
+        try:
+            await self._send_request("subscribe", self._book_args(new_symbols))
+            logger.info(f"已發送{self.exchange_name}訂單簿訂閱請求: {new_symbols}")
+            self.depth_symbols.update(new_symbols)
+            return True
+        except Exception as e:
+            logger.error(f"訂閱{self.exchange_name}訂單簿失敗: {e}")
+            for symbol in new_symbols:
+                self._drop_order_book(symbol)
+            return False
+    
+    async def unsubscribe_depth(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對的訂單簿數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            取消訂閱是否成功
+        """
+        subscribed = [s for s in dict.fromkeys(symbols) if s in self.depth_symbols]
+        if not subscribed:
+            return True
+        
+        if not self.ws or self.ws.closed:
+            logger.warning("WebSocket未連接，無需取消訂閱")
+            return False
+        
+        try:
+            await self._send_request("unsubscribe", self._book_args(subscribed))
+            logger.info(f"已發送{self.exchange_name}取消訂單簿訂閱請求: {subscribed}")
+            for symbol in subscribed:
+                self.depth_symbols.discard(symbol)
+                self._drop_order_book(symbol)
+            return True
+        except Exception as e:
+            logger.error(f"取消訂閱{self.exchange_name}訂單簿失敗: {e}")
+            return False
+    
+    def get_order_book(self, symbol: str) -> Optional[OrderBook]:
+        """
+        獲取交易對的本地訂單簿
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            訂單簿，如果沒有則返回None
+        """
+        return self.order_books.get(symbol)
+    
+    def _drop_order_book(self, symbol: str) -> None:
+        """移除交易對的訂單簿及其重新訂閱任務"""
+        self.order_books.pop(symbol, None)
+        task = self._book_resync_tasks.pop(symbol, None)
+        if task and not task.done():
+            task.cancel()
+    
+    def _reset_order_books(self) -> None:
+        """取消所有重新訂閱任務並清空訂單簿"""
+        for task in self._book_resync_tasks.values():
+            if not task.done():
+                task.cancel()
+        self._book_resync_tasks.clear()
+        self.order_books.clear()
+    
+    def _process_book_message(self, data: Dict[str, Any]) -> None:
+        """
+        處理訂單簿頻道消息
+        
+        Args:
+            data: books / books5 頻道消息
+        """
+        symbol = self._denormalize_symbol(data["arg"]["instId"])
+        book = self.order_books.get(symbol)
+        if book is None:
+            return
+        
+        # books5 沒有 action 字段，每次推送都是全量
+        action = data.get("action", "snapshot")
+        for entry in data["data"]:
+            if not self._apply_book_entry(book, action, entry):
+                self._resync_order_book(symbol)
+                return
+    
+    def _apply_book_entry(self, book: OrderBook, action: str, entry: Dict[str, Any]) -> bool:
+        """
+        將全量或增量數據合併到訂單簿，並用校驗和驗證合併結果
+        
+        增量數據的 prevSeqId 必須等於上一次推送的 seqId。
+        
+        Args:
+            book: 訂單簿
+            action: "snapshot" 或 "update"
+            entry: 推送數據，包含 bids、asks、ts、seqId、prevSeqId、checksum
+            
+        Returns:
+            False表示序號不連續或校驗和不一致，需要重新訂閱
+        """
+        seq_id = int(entry.get("seqId", 0))
+        
+        if action == "snapshot":
+            book.apply_snapshot(entry["bids"], entry["asks"], seq_id)
+        elif not book.synced:
+            # 等待重新訂閱後的全量快照
+            return True
+        elif int(entry.get("prevSeqId", -1)) != book.last_update_id:
+            logger.warning(f"{self.exchange_name}訂單簿序號不連續: {book.symbol}, "
+                           f"prevSeqId={entry.get('prevSeqId')}, 本地seqId={book.last_update_id}")
+            self.book_checksum_failures += 1
+            return False
+        else:
+            book.apply_levels(entry["bids"], entry["asks"])
+            book.last_update_id = seq_id
+        
+        book.bids.truncate(self.book_depth)
+        book.asks.truncate(self.book_depth)
+        book.timestamp = int(entry.get("ts", 0))
+        
+        checksum = entry.get("checksum")
+        if checksum is not None and self._book_checksum(book) != int(checksum):
+            logger.warning(f"{self.exchange_name}訂單簿校驗和不一致: {book.symbol}, seqId={seq_id}")
+            self.book_checksum_failures += 1
+            return False
+        
+        book.synced = True
+        return True
+    
+    @classmethod
+    def _book_checksum(cls, book: OrderBook) -> int:
+        """
+        計算訂單簿的OKX校驗和
+        
+        取前25檔，按 買1價:買1量:賣1價:賣1量:買2價:... 交替拼接交易所原始字符串，
+        某一側檔位不足時跳過該側，結果為有符號32位CRC32。
+        
+        Args:
+            book: 訂單簿
+            
+        Returns:
+            校驗和
+        """
+        bids = book.bids.top_raw(cls.CHECKSUM_LEVELS)
+        asks = book.asks.top_raw(cls.CHECKSUM_LEVELS)
+        
+        parts = []
+        for i in range(max(len(bids), len(asks))):
+            if i < len(bids):
+                parts.extend(bids[i])
+            if i < len(asks):
+                parts.extend(asks[i])
+        
+        checksum = zlib.crc32(":".join(parts).encode())
+        return checksum - (1 << 32) if checksum >= (1 << 31) else checksum
+    
+    def _resync_order_book(self, symbol: str) -> None:
+        """清空訂單簿並重新訂閱，等待交易所推送新的全量快照（已在進行中則跳過）"""
+        book = self.order_books.get(symbol)
+        if book is not None:
+            book.reset()
+        
+        task = self._book_resync_tasks.get(symbol)
+        if task is None or task.done():
+            self._book_resync_tasks[symbol] = asyncio.create_task(self._resubscribe_book(symbol))
+    
+    async def _resubscribe_book(self, symbol: str) -> None:
+        """
+        重新訂閱單個交易對的訂單簿頻道
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+        """
+        if not self.ws or self.ws.closed:
+            return
+        
+        args = self._book_args([symbol])
+        try:
+            await self._send_request("unsubscribe", args)
+            await self._send_request("subscribe", args)
+            logger.info(f"已重新訂閱{self.exchange_name}訂單簿: {symbol}")
+        except Exception as e:
+            logger.error(f"重新訂閱{self.exchange_name}訂單簿失敗: {symbol}, 錯誤: {e}")
+    
+    async def subscribe_trades(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對的成交數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            訂閱是否成功
+        """
+        if not self.ws or self.ws.closed:
+            logger.warning("嘗試在WebSocket關閉狀態下訂閱成交數據，先嘗試連接")
+            if not await self.connect():
+                return False
+        
+        new_symbols = [s for s in dict.fromkeys(symbols) if s not in self.trade_symbols]
+        if not new_symbols:
+            return True
+        
+        self._add_trade_buffers(new_symbols)
+        
+        try:
+            await self._send_request("subscribe", self._trade_args(new_symbols))
+            logger.info(f"已發送{self.exchange_name}成交數據訂閱請求: {new_symbols}")
+            self.trade_symbols.update(new_symbols)
+            return True
+        except Exception as e:
+            logger.error(f"訂閱{self.exchange_name}成交數據失敗: {e}")
+            self._remove_trade_symbols(new_symbols)
+            return False
+    
+    async def unsubscribe_trades(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對的成交數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            取消訂閱是否成功
+        """
+        subscribed = [s for s in dict.fromkeys(symbols) if s in self.trade_symbols]
+        if not subscribed:
+            return True
+        
+        if not self.ws or self.ws.closed:
+            logger.warning("WebSocket未連接，無需取消訂閱")
+            return False
+        
+        try:
+            await self._send_request("unsubscribe", self._trade_args(subscribed))
+            logger.info(f"已發送{self.exchange_name}取消成交數據訂閱請求: {subscribed}")
+            self._remove_trade_symbols(subscribed)
+            return True
+        except Exception as e:
+            logger.error(f"取消訂閱{self.exchange_name}成交數據失敗: {e}")
+            return False
+    
+    def _process_trades_message(self, data: Dict[str, Any]) -> None:
+        """
+        將成交寫入交易對的成交記錄緩衝區
+        
+        Args:
+            data: trades 頻道消息
+        """
+        buffer = self.trade_buffers.get(self._denormalize_symbol(data["arg"]["instId"]))
+        if buffer is None:
+            return
+        
+        for trade in data["data"]:
+            buffer.append(int(trade["ts"]), float(trade["px"]), float(trade["sz"]),
+                          BUY if trade["side"] == "buy" else SELL)
+    
     async def _send_ping(self) -> None:
         """發送心跳包"""
         if self.ws and not self.ws.closed:
             ping_msg = "ping"
+            self._mark_ping_sent()
             await self.ws.send_str(ping_msg)
     
     async def _process_message(self, message: str) -> None:
@@ -235,13 +642,40 @@ class OkxWebSocket(WebSocketBase):
             message: WebSocket消息
         """
         try:
-            # 處理心跳回應
-            if message == "pong":
-                self.last_pong_time = time.time()
-                logger.debug(f"{self.exchange_name}收到心跳回應")
+            frame = self.decoder.decode(message)
+            
+            # 處理ticker數據
+            for okx_symbol, price, event_time in frame.ticks:
+                # 將OKX格式轉換回標準格式
+                standard_symbol = self._denormalize_symbol(okx_symbol.replace("-SPOT", ""))
+                
+                # 更新最新價格
+                self.latest_prices[standard_symbol] = price
+                
+                # 打印日誌
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{self.exchange_name}價格更新: {standard_symbol} = {price}")
+                
+                # 通知回調
+                self._notify_price_update(standard_symbol, price, event_time)
+            
+            data = frame.control
+            if data is None:
                 return
             
-            data = json.loads(message)
+            arg = data.get("arg")
+            if arg and "data" in data:
+                channel = arg.get("channel")
+                
+                # 處理成交數據
+                if channel == "trades":
+                    self._process_trades_message(data)
+                    return
+                
+                # 處理訂單簿數據
+                if channel == self.book_channel:
+                    self._process_book_message(data)
+                    return
             
             # 處理訂閱確認消息
             if "event" in data and data["event"] == "subscribe":
@@ -257,27 +691,6 @@ class OkxWebSocket(WebSocketBase):
             if "event" in data and data["event"] == "error":
                 logger.error(f"{self.exchange_name}錯誤消息: {data}")
                 return
-            
-            # 處理ticker數據
-            if "data" in data and "arg" in data and data["arg"].get("channel") == "tickers":
-                for ticker_data in data["data"]:
-                    if "instId" in ticker_data:
-                        okx_symbol = ticker_data["instId"].replace("-SPOT", "")
-                        
-                        # 將OKX格式轉換回標準格式
-                        standard_symbol = self._denormalize_symbol(okx_symbol)
-                        
-                        # 最新價格
-                        price = float(ticker_data["last"])
-                        
-                        # 更新最新價格
-                        self.latest_prices[standard_symbol] = price
-                        
-                        # 打印日誌
-                        logger.debug(f"{self.exchange_name}價格更新: {standard_symbol} = {price}")
-                        
-                        # 通知回調
-                        self._notify_price_update(standard_symbol, price)
         except json.JSONDecodeError:
             if message != "pong":  # 忽略心跳回應的解析錯誤
                 logger.error(f"{self.exchange_name}無法解析JSON消息: {message}")
@@ -0,0 +1,212 @@
+"""
+本地訂單簿
+
+以排序數組維護買賣盤價位，使用二分查找定位價位，支持增量更新、最優買賣價和前N檔查詢。
+同時保留交易所發送的原始價格和數量字符串，用於校驗和計算。
+"""
+
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Any, Iterable, Sequence, Tuple
+
+# 價位：(價格, 數量)
+Level = Tuple[float, float]
+
+class OrderBookSide:
+    """
+    訂單簿的一側（買盤或賣盤）
+    """
+    
+    def __init__(self, descending: bool):
+        """
+        初始化訂單簿一側
+        
+        Args:
+            descending: 價格是否從高到低排列（買盤為True）
+        """
+        self.descending = descending
+        
+        # 排序鍵（升序）：買盤使用負價格，使最優價位始終位於開頭
+        self._keys: List[float] = []
+        
+        # 排序鍵到原始字符串 {鍵: (價格字符串, 數量字符串)}
+        self._levels: Dict[float, Tuple[str, str]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def clear(self) -> None:
+        """清空所有價位"""
+        self._keys.clear()
+        self._levels.clear()
+    
+    def update(self, price: str, size: str) -> None:
+        """
+        更新價位，數量為0時刪除該價位
+        
+        Args:
+            price: 價格字符串
+            size: 數量字符串
+        """
+        key = float(price)
+        if self.descending:
+            key = -key
+        
+        if float(size) == 0:
+            if key in self._levels:
+                del self._levels[key]
+                del self._keys[bisect_left(self._keys, key)]
+            return
+        
+        if key not in self._levels:
+            insort(self._keys, key)
+        self._levels[key] = (price, size)
+    
+    def best(self) -> Optional[Level]:
+        """
+        獲取最優價位
+        
+        Returns:
+            (價格, 數量)，沒有價位時返回None
+        """
+        if not self._keys:
+            return None
+        price, size = self._levels[self._keys[0]]
+        return float(price), float(size)
+    
+    def top(self, depth: int) -> List[Level]:
+        """
+        獲取前N檔價位
+        
+        Args:
+            depth: 檔位數量
+        
+        Returns:
+            價位列表 [(價格, 數量), ...]，按最優價格排列
+        """
+        levels = self._levels
+        result = []
+        for key in self._keys[:depth]:
+            price, size = levels[key]
+            result.append((float(price), float(size)))
+        return result
+    
+    def top_raw(self, depth: int) -> List[Tuple[str, str]]:
+        """
+        獲取前N檔價位的原始字符串
+        
+        Args:
+            depth: 檔位數量
+        
+        Returns:
+            價位列表 [(價格字符串, 數量字符串), ...]
+        """
+        levels = self._levels
+        return [levels[key] for key in self._keys[:depth]]
+    
+    def truncate(self, depth: int) -> None:
+        """
+        只保留前N檔價位
+        
+        Args:
+            depth: 保留的檔位數量
+        """
+        if len(self._keys) <= depth:
+            return
+        for key in self._keys[depth:]:
+            del self._levels[key]
+        del self._keys[depth:]
+
+
+class OrderBook:
+    """
+    單個交易對的本地訂單簿
+    """
+    
+    def __init__(self, symbol: str):
+        """
+        初始化訂單簿
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+        """
+        self.symbol = symbol
+        self.bids = OrderBookSide(descending=True)
+        self.asks = OrderBookSide(descending=False)
+        
+        # 最後應用的更新ID（幣安 lastUpdateId / u，OKX seqId）
+        self.last_update_id = 0
+        
+        # 最後更新的交易所時間（毫秒）
+        self.timestamp = 0
+        
+        # 是否已與快照同步，未同步時數據不可用
+        self.synced = False
+    
+    def reset(self) -> None:
+        """清空訂單簿並標記為未同步"""
+        self.bids.clear()
+        self.asks.clear()
+        self.last_update_id = 0
+        self.timestamp = 0
+        self.synced = False
+    
+    def apply_snapshot(self,
+                       bids: Iterable[Sequence[str]],
+                       asks: Iterable[Sequence[str]],
+                       last_update_id: int = 0) -> None:
+        """
+        以快照替換訂單簿內容
+        
+        Args:
+            bids: 買盤價位 [[價格, 數量, ...], ...]
+            asks: 賣盤價位 [[價格, 數量, ...], ...]
+            last_update_id: 快照對應的更新ID
+        """
+        self.bids.clear()
+        self.asks.clear()
+        self.apply_levels(bids, asks)
+        self.last_update_id = last_update_id
+    
+    def apply_levels(self, bids: Iterable[Sequence[str]], asks: Iterable[Sequence[str]]) -> None:
+        """
+        應用增量價位更新
+        
+        Args:
+            bids: 買盤價位 [[價格, 數量, ...], ...]
+            asks: 賣盤價位 [[價格, 數量, ...], ...]
+        """
+        for level in bids:
+            self.bids.update(level[0], level[1])
+        for level in asks:
+            self.asks.update(level[0], level[1])
+    
+    def best_bid(self) -> Optional[Level]:
+        """最優買價 (價格, 數量)"""
+        return self.bids.best()
+    
+    def best_ask(self) -> Optional[Level]:
+        """最優賣價 (價格, 數量)"""
+        return self.asks.best()
+    
+    def to_dict(self, depth: int = 10) -> Dict[str, Any]:
+        """
+        導出訂單簿的前N檔
+        
+        Args:
+            depth: 檔位數量
+        
+        Returns:
+            訂單簿數據，例如 {"symbol": "BTC/USDT", "bids": [[50000.0, 1.2]], "asks": [[50001.0, 0.5]], ...}
+        """
+        best_bid = self.best_bid()
+        best_ask = self.best_ask()
+        return {
+            "symbol": self.symbol,
+            "synced": self.synced,
+            "lastUpdateId": self.last_update_id,
+            "timestamp": self.timestamp,
+            "bestBid": list(best_bid) if best_bid else None,
+            "bestAsk": list(best_ask) if best_ask else None,
+            "bids": [list(level) for level in self.bids.top(depth)],
+            "asks": [list(level) for level in self.asks.top(depth)]
+        }
@@ -0,0 +1,130 @@
+"""
+價格歷史環形緩衝區
+
+為每個已訂閱的(交易所, 交易對)保留最近N個tick的(時間戳, 價格)，與成交記錄緩衝區相同基於
+ring_buffer.MirroredRingBuffer，最近N個tick或某個時間窗口都可以直接以數組切片返回。
+
+記憶體佔用固定：每個(交易所, 交易對)佔用 容量 × 2(鏡像) × 16字節，在收到第一個tick時分配，取消訂閱時釋放。
+"""
+
+from typing import Dict, NamedTuple, Optional, Any, Tuple
+
+import numpy as np
+
+from app.services.price_service.ring_buffer import MirroredRingBuffer
+
+
+class PriceView(NamedTuple):
+    """價格歷史的只讀列視圖，按時間從舊到新排列"""
+    # 收到價格的時間（毫秒）
+    timestamps: np.ndarray
+    # 價格
+    prices: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+class PriceRingBuffer(MirroredRingBuffer):
+    """
+    單個(交易所, 交易對)的價格環形緩衝區，append(時間戳, 價格)，last / window 返回 PriceView
+    """
+    
+    view_type = PriceView
+    dtypes = (np.int64, np.float64)
+    
+    def __init__(self, capacity: int = 2000):
+        """
+        初始化環形緩衝區
+        
+        Args:
+            capacity: 保留的tick數量
+        """
+        super().__init__(capacity)
+    
+    def append(self, timestamp: int, price: float) -> None:
+        """
+        寫入一個tick
+        
+        Args:
+            timestamp: 收到價格的時間（毫秒）
+            price: 價格
+        """
+        head = self._advance()
+        mirror = head + self.capacity
+        timestamps, prices = self._columns
+        timestamps[head] = timestamps[mirror] = timestamp
+        prices[head] = prices[mirror] = price
+
+
+class PriceHistory:
+    """
+    所有(交易所, 交易對)的價格歷史
+    """
+    
+    def __init__(self, capacity: int = 2000):
+        """
+        初始化價格歷史
+        
+        Args:
+            capacity: 每個(交易所, 交易對)保留的tick數量，0表示停用
+        """
+        self.capacity = capacity
+        self.buffers: Dict[Tuple[str, str], PriceRingBuffer] = {}
+    
+    def append(self, exchange_id: str, symbol: str, price: float, timestamp: int) -> None:
+        """
+        寫入一個tick，第一次寫入時分配緩衝區
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            price: 價格
+            timestamp: 收到價格的時間（毫秒）
+        """
+        buffer = self.buffers.get((exchange_id, symbol))
+        if buffer is None:
+            if self.capacity <= 0:
+                return
+            buffer = self.buffers[(exchange_id, symbol)] = PriceRingBuffer(self.capacity)
+        buffer.append(timestamp, price)
+    
+    def get(self, exchange_id: str, symbol: str) -> Optional[PriceRingBuffer]:
+        """
+        獲取(交易所, 交易對)的緩衝區
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        
+        Returns:
+            緩衝區，還沒有收到價格時返回None
+        """
+        return self.buffers.get((exchange_id, symbol))
+    
+    def remove(self, exchange_id: str, symbol: str) -> None:
+        """
+        釋放(交易所, 交易對)的緩衝區
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        """
+        self.buffers.pop((exchange_id, symbol), None)
+    
+    def clear(self) -> None:
+        """釋放所有緩衝區"""
+        self.buffers.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取價格歷史的統計信息
+        
+        Returns:
+            統計信息，例如 {"capacity": 2000, "buffers": 120, "bytes": 7680000}
+        """
+        return {
+            "capacity": self.capacity,
+            "buffers": len(self.buffers),
+            "bytes": sum(buffer.nbytes for buffer in self.buffers.values())
+        }
@@ -7,11 +7,28 @@
 
 import asyncio
 import logging
+import os
 import time
 from typing import Dict, List, Optional, Set, Any, Callable, Tuple
 
+import numpy as np
+
+from app.services.price_service.alerts import Alert, AlertEngine
 from app.services.price_service.binance_websocket import BinanceWebSocket
+from app.services.price_service.candles import CandleBuilder
+from app.services.price_service.latency import LatencyTracker, merge_trackers
 from app.services.price_service.okx_websocket import OkxWebSocket
+from app.services.price_service.price_history import PriceHistory, PriceView
+from app.services.price_service.price_snapshot import SNAPSHOT_VERSION, load_snapshot, save_snapshot
+from app.services.price_service.rolling_stats import RollingStats
+from app.services.price_service.sharded_websocket import ShardedWebSocketGroup
+from app.services.price_service.spread_monitor import SpreadMonitor
+from app.services.price_service.subscribers import PriceCallback, SubscriberIndex
+from app.services.price_service.subscription_refs import DEFAULT_CONSUMER, SubscriptionKey, SubscriptionRefCounter
+from app.services.price_service.symbol_registry import symbol_registry
+from app.services.price_service.trade_buffer import TradeRingBuffer, TradeView
+from app.services.price_service.watchdog import StalenessWatchdog
+from app.services.price_service.websocket_base import OverflowPolicy
 
 logger = logging.getLogger(__name__)
 
@@ -22,33 +39,126 @@ class PriceManager:
     
     def __init__(self):
         """初始化價格管理器"""
-        # 存儲WebSocket連接實例
-        self.exchange_connections: Dict[str, Any] = {}
+        # 存儲WebSocket連接實例，每個連接鍵對應一個分片連接組
+        self.exchange_connections: Dict[str, ShardedWebSocketGroup] = {}
+        
+        # 訂閱的使用者引用計數：最後一個使用者取消後等待 PRICE_UNSUBSCRIBE_GRACE 秒才向交易所取消，
+        # 訂閱數量超過 PRICE_SUBSCRIPTION_BUDGET 時淘汰最久未讀取的交易對（0表示不限制）
+        self.subscriptions = SubscriptionRefCounter(
+            grace=float(os.environ.get("PRICE_UNSUBSCRIBE_GRACE", "30")),
+            budget=int(os.environ.get("PRICE_SUBSCRIPTION_BUDGET", "0"))
+        )
+        self._teardown_task: Optional[asyncio.Task] = None
+        
+        # 交易對向交易所取消訂閱後的回調函數，參數為(exchange_id, symbol)
+        self.unsubscribe_callbacks: List[Callable[[str, str], None]] = []
+        
+        # 其他進程記錄的交易對讀取時間，淘汰訂閱前合併，返回 {交易對: 最近讀取時間(Unix秒)}
+        self.read_time_sources: List[Callable[[], Dict[str, float]]] = []
+        
+        # 每個連接鍵的初始化鎖，避免並發訂閱時重複建立同一個連接
+        self._init_locks: Dict[str, asyncio.Lock] = {}
         
         # 交易對和交易所的映射，用於跟踪每個交易對的訂閱情況
         # {"BTC/USDT": ["binance", "okx"], "ETH/USDT": ["binance"]}
         self.symbol_exchanges: Dict[str, List[str]] = {}
         
-        # 價格更新回調函數
-        # [(callback1, {"binance"}), (callback2, {"binance", "okx"})]
-        self.price_callbacks: List[Tuple[Callable[[str, str, float], None], Set[str]]] = []
+        # 價格更新訂閱者，按(交易所, 交易對)索引，按發布間隔接收合併後的最新價格
+        self.subscribers = SubscriberIndex()
+        
+        # 原始價格訂閱者，每個tick都會立即收到
+        self.raw_subscribers = SubscriberIndex()
+        
+        # 價格合併：同一(交易所, 交易對)在一個發布間隔內只保留最新價格，價格不變時不通知
+        # 發布間隔（秒），0表示收到後立即發布
+        self.publish_interval = float(os.environ.get("PRICE_PUBLISH_INTERVAL", "0.25"))
+        # 待發布的最新價格 {("binance", "BTC/USDT"): 50000.0}
+        self._pending_updates: Dict[Tuple[str, str], float] = {}
+        # 最後發布的價格
+        self._published_prices: Dict[Tuple[str, str], float] = {}
+        self._publish_task: Optional[asyncio.Task] = None
+        
+        # 合併統計
+        self.ticks_received = 0
+        self.updates_published = 0
         
         # 預設交易所配置
+        # max_symbols_per_connection: 每個WebSocket連接（分片）訂閱的交易對上限，超過時自動開啟新連接
+        # （幣安單個連接最多1024個stream）
+        # book_channel: OKX訂單簿頻道（books / books5）
+        okx_book_channel = os.environ.get("PRICE_OKX_BOOK_CHANNEL", "books")
         self.exchange_configs = {
             "binance": {
-                "spot": {"market_type": "spot"},
-                "futures": {"market_type": "futures"}
+                "spot": {"market_type": "spot", "max_symbols_per_connection": 200},
+                "futures": {"market_type": "futures", "max_symbols_per_connection": 200}
             },
             "okx": {
-                "spot": {"market_type": "spot"},
-                "swap": {"market_type": "swap"},
-                "futures": {"market_type": "futures"}
+                "spot": {"market_type": "spot", "max_symbols_per_connection": 200,
+                         "book_channel": okx_book_channel},
+                "swap": {"market_type": "swap", "max_symbols_per_connection": 200,
+                         "book_channel": okx_book_channel},
+                "futures": {"market_type": "futures", "max_symbols_per_connection": 200,
+                            "book_channel": okx_book_channel}
             }
         }
         
+        # 所有WebSocket連接共用的選項
+        # queue_size: 每個連接待處理消息隊列的容量
+        # overflow_policy: 隊列已滿時的處理策略（drop_oldest / drop_newest）
+        # trade_buffer_size: 每個交易對保留的成交筆數
+        # compress: 是否協商 permessage-deflate 壓縮
+        # measure_wire: 是否統計線上字節數和解壓耗時（在 /status 的 connections 中查看）
+        # record_dir: 錄製原始消息的目錄，每個連接一個文件，可用 benchmarks.replay_benchmark 回放
+        # track_latency: 是否統計交易所到價格回調的延遲（在 /latency 查看）
+        self.connection_options = {
+            "queue_size": int(os.environ.get("PRICE_QUEUE_SIZE", "10000")),
+            "overflow_policy": OverflowPolicy(os.environ.get("PRICE_QUEUE_OVERFLOW_POLICY", "drop_oldest")),
+            "trade_buffer_size": int(os.environ.get("PRICE_TRADE_BUFFER_SIZE", "10000")),
+            "compress": os.environ.get("PRICE_WS_COMPRESSION", "false").lower() == "true",
+            "measure_wire": os.environ.get("PRICE_WS_MEASURE_WIRE", "false").lower() == "true",
+            "record_dir": os.environ.get("PRICE_RECORD_DIR") or None,
+            "track_latency": os.environ.get("PRICE_TRACK_LATENCY", "true").lower() == "true"
+        }
+        
         # 最新價格緩存
         # {"BTC/USDT": {"binance": 50000.0, "okx": 50010.0}}
         self.latest_prices: Dict[str, Dict[str, float]] = {}
+        
+        # 由價格更新增量生成的多週期K線
+        self.candles = CandleBuilder(history=int(os.environ.get("PRICE_CANDLE_HISTORY", "500")))
+        
+        # 每個(交易所, 交易對)最近的tick，每個佔用 PRICE_HISTORY_SIZE × 32 字節
+        self.price_history = PriceHistory(capacity=int(os.environ.get("PRICE_HISTORY_SIZE", "2000")))
+        
+        # 每個(交易所, 交易對)的EMA、收益率波動率和z分數，窗口為 PRICE_STATS_WINDOWS 個tick（逗號分隔，留空停用）
+        stats_windows = os.environ.get("PRICE_STATS_WINDOWS", "20,100,500")
+        self.rolling_stats = RollingStats(windows=[int(w) for w in stats_windows.split(",") if w.strip()])
+        
+        # 同一交易對在不同交易所之間的價差，保留價差最大的 PRICE_SPREAD_TOP_K 個交易對
+        self.spreads = SpreadMonitor(top_k=int(os.environ.get("PRICE_SPREAD_TOP_K", "20")))
+        
+        # 價格警報，保留最近 PRICE_ALERT_EVENTS 條觸發記錄；警報觸發後的回調函數，參數為觸發記錄
+        self.alerts = AlertEngine(event_history=int(os.environ.get("PRICE_ALERT_EVENTS", "1000")))
+        self.alert_callbacks: List[Callable[[Dict[str, Any]], Any]] = []
+        
+        # 熱重啟快照：每 PRICE_SNAPSHOT_INTERVAL 秒及關閉時保存到 PRICE_SNAPSHOT_PATH（默認留空，即停用），
+        # 啟動時只恢復保存時間在 PRICE_SNAPSHOT_MAX_AGE 秒內的價格
+        self.snapshot_path = os.environ.get("PRICE_SNAPSHOT_PATH", "")
+        self.snapshot_interval = float(os.environ.get("PRICE_SNAPSHOT_INTERVAL", "60"))
+        self.snapshot_max_age = float(os.environ.get("PRICE_SNAPSHOT_MAX_AGE", "3600"))
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._restore_task: Optional[asyncio.Task] = None
+        # 從快照恢復、尚未收到新tick的價格 {("binance", "BTC/USDT")}，以及快照的保存時間（毫秒）
+        self.restored_prices: Set[Tuple[str, str]] = set()
+        self.restored_at: Optional[int] = None
+        
+        # 交易對停止更新監控：超過 PRICE_STALE_AFTER 秒沒有更新的交易對會被重新訂閱，0表示停用
+        self.watchdog = StalenessWatchdog(
+            self.exchange_connections,
+            stale_after=float(os.environ.get("PRICE_STALE_AFTER", "60")),
+            recycle_ratio=float(os.environ.get("PRICE_STALE_RECYCLE_RATIO", "0.5")),
+            backoff_max=float(os.environ.get("PRICE_STALE_BACKOFF_MAX", "1800"))
+        )
     
     async def init_exchange(self, exchange_id: str, market_type: str = "spot") -> bool:
         """
@@ -63,12 +173,37 @@ class PriceManager:
         """
         conn_key = f"{exchange_id}_{market_type}"
         
-        # 檢查是否已初始化
-        if conn_key in self.exchange_connections:
-            logger.info(f"交易所連接已存在: {conn_key}")
-            return True
+        # 同一連接鍵只允許一個初始化過程，並發的調用者等待其完成，避免重複建立連接
+        lock = self._init_locks.setdefault(conn_key, asyncio.Lock())
+        async with lock:
+            # 檢查是否已初始化
+            if conn_key in self.exchange_connections:
+                logger.debug(f"交易所連接已存在: {conn_key}")
+                return True
+            
+            return await self._init_exchange(exchange_id, market_type, conn_key)
+    
+    async def _init_exchange(self, exchange_id: str, market_type: str, conn_key: str) -> bool:
+        """
+        創建並連接交易所連接（調用者持有該連接鍵的初始化鎖）
+        
+        Args:
+            exchange_id: 交易所ID，例如 "binance", "okx"
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            conn_key: 連接鍵，例如 "binance_spot"
+            
+        Returns:
+            初始化是否成功
+        """
+        self._ensure_publish_task()
+        self._ensure_teardown_task()
+        self._ensure_snapshot_task()
+        self.watchdog.start()
         
         try:
+            # 載入交易對映射表，失敗時WebSocket客戶端會退回推測規則
+            await symbol_registry.ensure_loaded(exchange_id, market_type)
+            
             # 創建交易所連接
             if exchange_id.lower() == "binance":
                 if market_type not in self.exchange_configs["binance"]:
@@ -76,8 +211,13 @@ class PriceManager:
                     return False
                     
                 config = self.exchange_configs["binance"][market_type]
-                connection = BinanceWebSocket(
-                    market_type=config["market_type"]
+                connection = ShardedWebSocketGroup(
+                    exchange_name="Binance",
+                    connection_factory=lambda: BinanceWebSocket(
+                        market_type=config["market_type"],
+                        **self.connection_options
+                    ),
+                    max_symbols_per_connection=config["max_symbols_per_connection"]
                 )
             elif exchange_id.lower() == "okx":
                 if market_type not in self.exchange_configs["okx"]:
@@ -85,8 +225,14 @@ class PriceManager:
                     return False
                     
                 config = self.exchange_configs["okx"][market_type]
-                connection = OkxWebSocket(
-                    market_type=config["market_type"]
+                connection = ShardedWebSocketGroup(
+                    exchange_name="OKX",
+                    connection_factory=lambda: OkxWebSocket(
+                        market_type=config["market_type"],
+                        book_channel=config["book_channel"],
+                        **self.connection_options
+                    ),
+                    max_symbols_per_connection=config["max_symbols_per_connection"]
                 )
             else:
                 logger.error(f"不支持的交易所: {exchange_id}")
@@ -114,7 +260,30 @@ class PriceManager:
             return False
     
     async def close_all(self) -> None:
-        """關閉所有交易所連接"""
+        """關閉所有交易所連接，關閉前保存快照"""
+        if self._restore_task and not self._restore_task.done():
+            # 恢復尚未完成時保存會覆蓋原有的完整快照
+            self._restore_task.cancel()
+        elif self.snapshot_path:
+            try:
+                save_snapshot(self.snapshot_path, self.build_snapshot())
+                logger.info(f"已保存價格服務快照: {self.snapshot_path}")
+            except Exception as e:
+                logger.error(f"保存價格服務快照失敗: {e}")
+        self._restore_task = None
+        if self._snapshot_task and not self._snapshot_task.done():
+            self._snapshot_task.cancel()
+        self._snapshot_task = None
+        if self._publish_task and not self._publish_task.done():
+            self._publish_task.cancel()
+        self._publish_task = None
+        if self._teardown_task and not self._teardown_task.done():
+            self._teardown_task.cancel()
+        self._teardown_task = None
+        self.watchdog.stop()
+        self.subscribers.stop()
+        self.raw_subscribers.stop()
+        
         for conn_key, connection in list(self.exchange_connections.items()):
             try:
                 await connection.disconnect()
@@ -126,8 +295,57 @@ class PriceManager:
         self.exchange_connections.clear()
         self.symbol_exchanges.clear()
         self.latest_prices.clear()
+        self._pending_updates.clear()
+        self._published_prices.clear()
+        self.candles.clear()
+        self.price_history.clear()
+        self.rolling_stats.clear()
+        self.restored_prices.clear()
+        self.spreads.clear()
+        self.subscriptions.clear()
+    
+    def _resolve_market_type(self, exchange_id: str, market_type: str) -> str:
+        """
+        根據交易所限制確定最終使用的市場類型
+        
+        Args:
+            exchange_id: 交易所ID，例如 "binance", "okx"
+            market_type: 請求的市場類型，例如 "spot", "futures", "swap"
+            
+        Returns:
+            交易所實際使用的市場類型
+        """
+        if exchange_id.lower() == "binance" and market_type == "swap":
+            # 幣安使用 futures 代替 swap
+            logger.debug(f"幣安不支持 'swap'，自動轉換為 'futures'")
+            return "futures"
+        if exchange_id.lower() == "okx" and market_type == "futures":
+            # OKX使用 swap 代替 futures (簡化處理)
+            logger.debug(f"OKX使用 'swap' 代替 'futures' (簡化處理)")
+            return "swap"
+        return market_type
+    
+    async def _get_connection(self, exchange_id: str, market_type: str) -> Optional[ShardedWebSocketGroup]:
+        """
+        獲取交易所連接，不存在時初始化
+        
+        Args:
+            exchange_id: 交易所ID，例如 "binance", "okx"
+            market_type: 交易所實際使用的市場類型
+            
+        Returns:
+            交易所連接，初始化失敗時返回None
+        """
+        conn_key = f"{exchange_id}_{market_type}"
+        # 連接正在初始化時也要等待，否則會拿到尚未連接的連接組
+        lock = self._init_locks.get(conn_key)
+        if conn_key not in self.exchange_connections or (lock is not None and lock.locked()):
+            if not await self.init_exchange(exchange_id, market_type):
+                return None
+        return self.exchange_connections.get(conn_key)
     
-    async def subscribe_symbol(self, symbol: str, exchange_ids: List[str], market_type: str = "spot") -> Dict[str, bool]:
+    async def subscribe_symbol(self, symbol: str, exchange_ids: List[str], market_type: str = "spot",
+                               consumer: Optional[str] = None) -> Dict[str, bool]:
         """
         訂閱交易對價格，支持指定多個交易所
         
@@ -135,115 +353,770 @@ class PriceManager:
             symbol: 交易對，例如 "BTC/USDT"
             exchange_ids: 交易所ID列表，例如 ["binance", "okx"]
             market_type: 市場類型，例如 "spot", "futures", "swap"
+            consumer: 使用者ID（例如前端分頁或策略），None表示默認使用者
             
         Returns:
             各交易所訂閱結果，例如 {"binance": True, "okx": False}
         """
-        results = {}
+        results = await self.subscribe_symbols([symbol], exchange_ids, market_type, consumer=consumer)
+        return results[symbol]
+    
+    async def subscribe_symbols(self, symbols: List[str], exchange_ids: List[str],
+                                market_type: str = "spot", consumer: Optional[str] = None) -> Dict[str, Dict[str, bool]]:
+        """
+        批量訂閱交易對價格
         
-        for exchange_id in exchange_ids:
-            # 根據交易所和市場類型確定最終使用的市場類型
-            effective_market_type = market_type
-            
-            # 根據交易所限制調整市場類型
-            if exchange_id.lower() == "binance" and market_type == "swap":
-                # 幣安使用 futures 代替 swap
-                effective_market_type = "futures"
-                logger.info(f"幣安不支持 'swap'，自動轉換為 'futures'")
-            elif exchange_id.lower() == "okx" and market_type == "futures":
-                # OKX使用 swap 代替 futures (簡化處理)
-                effective_market_type = "swap"
-                logger.info(f"OKX使用 'swap' 代替 'futures' (簡化處理)")
+        各交易所並行處理，每個交易所的連接只初始化一次，所有交易對打包成批量訂閱請求發送。
+        使用者持有訂閱直到取消；已訂閱（包括寬限期中等待取消）的交易對直接沿用，不會再向交易所發送請求。
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            exchange_ids: 交易所ID列表，例如 ["binance", "okx"]
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            consumer: 使用者ID（例如前端分頁或策略），None表示默認使用者
             
-            # 初始化交易所連接
+        Returns:
+            各交易對在各交易所的訂閱結果，例如 {"BTC/USDT": {"binance": True, "okx": False}}
+        """
+        symbols = list(dict.fromkeys(symbols))
+        exchange_ids = list(dict.fromkeys(exchange_ids))
+        consumer = consumer or DEFAULT_CONSUMER
+        results: Dict[str, Dict[str, bool]] = {symbol: dict.fromkeys(exchange_ids, False) for symbol in symbols}
+        if not symbols:
+            return results
+        
+        # 超出訂閱預算時先淘汰最久未讀取的訂閱
+        budget = self.subscriptions.budget
+        if budget > 0:
+            requested = [(exchange_id, symbol) for exchange_id in exchange_ids for symbol in symbols]
+            added = sum(1 for key in requested if key not in self.subscriptions.holders)
+            overflow = len(self.subscriptions.holders) + added - budget
+            if overflow > 0:
+                for source in self.read_time_sources:
+                    try:
+                        for symbol, read_at in source().items():
+                            self.subscriptions.touch(symbol, read_at)
+                    except Exception as e:
+                        logger.error(f"讀取交易對讀取時間時出錯: {e}")
+                await self._evict(self.subscriptions.eviction_candidates(overflow, keep=requested))
+        
+        async def subscribe_exchange(exchange_id: str) -> None:
+            effective_market_type = self._resolve_market_type(exchange_id, market_type)
             conn_key = f"{exchange_id}_{effective_market_type}"
-            if conn_key not in self.exchange_connections:
-                init_success = await self.init_exchange(exchange_id, effective_market_type)
-                if not init_success:
-                    results[exchange_id] = False
-                    continue
             
-            connection = self.exchange_connections[conn_key]
+            # 初始化交易所連接
+            connection = await self._get_connection(exchange_id, effective_market_type)
+            if connection is None:
+                for symbol in symbols:
+                    results[symbol][exchange_id] = False
+                return
             
             # 訂閱交易對
             try:
-                success = await connection.subscribe_symbols([symbol])
-                results[exchange_id] = success
+                await connection.subscribe_symbols(symbols)
+            except Exception as e:
+                logger.error(f"訂閱{exchange_id}交易對失敗: {e}")
+            
+            # 以連接實際訂閱成功的交易對為準
+            subscribed = connection.subscribed_symbols
+            succeeded = 0
+            for symbol in symbols:
+                success = symbol in subscribed
+                results[symbol][exchange_id] = success
+                if not success:
+                    continue
                 
                 # 更新交易對和交易所的映射
-                if success:
-                    if symbol not in self.symbol_exchanges:
-                        self.symbol_exchanges[symbol] = []
-                    if exchange_id not in self.symbol_exchanges[symbol]:
-                        self.symbol_exchanges[symbol].append(exchange_id)
-                    
-                    logger.info(f"已訂閱{exchange_id}交易對: {symbol} (市場類型: {effective_market_type})")
-            except Exception as e:
-                logger.error(f"訂閱{exchange_id}交易對{symbol}失敗: {e}")
-                results[exchange_id] = False
+                succeeded += 1
+                exchanges = self.symbol_exchanges.setdefault(symbol, [])
+                if exchange_id not in exchanges:
+                    exchanges.append(exchange_id)
+                self.watchdog.watch(conn_key, symbol)
+                self.subscriptions.acquire(exchange_id, symbol, consumer)
+            
+            if len(symbols) == 1 and succeeded:
+                logger.info(f"已訂閱{exchange_id}交易對: {symbols[0]} (市場類型: {effective_market_type})")
+            else:
+                logger.info(f"已訂閱{exchange_id} {succeeded}/{len(symbols)}個交易對 (市場類型: {effective_market_type})")
         
+        await asyncio.gather(*(subscribe_exchange(exchange_id) for exchange_id in exchange_ids))
         return results
     
-    async def unsubscribe_symbol(self, symbol: str, exchange_ids: Optional[List[str]] = None) -> Dict[str, bool]:
+    async def unsubscribe_symbol(self, symbol: str, exchange_ids: Optional[List[str]] = None,
+                                 consumer: Optional[str] = None, force: bool = False) -> Dict[str, bool]:
         """
         取消訂閱交易對價格
         
         Args:
             symbol: 交易對，例如 "BTC/USDT"
             exchange_ids: 交易所ID列表，例如 ["binance", "okx"]。如果為None，則取消所有交易所的訂閱
+            consumer: 使用者ID，None表示默認使用者
+            force: 是否忽略其他使用者立即向交易所取消訂閱
             
         Returns:
             各交易所取消訂閱結果，例如 {"binance": True, "okx": True}
         """
-        results = {}
+        results = await self.unsubscribe_symbols([symbol], exchange_ids, consumer=consumer, force=force)
+        return results[symbol]
+    
+    async def unsubscribe_symbols(self, symbols: List[str], exchange_ids: Optional[List[str]] = None,
+                                  consumer: Optional[str] = None, force: bool = False) -> Dict[str, Dict[str, bool]]:
+        """
+        批量取消訂閱交易對價格
         
-        # 如果沒有指定交易所，取消所有訂閱該交易對的交易所
-        if exchange_ids is None:
-            exchange_ids = self.symbol_exchanges.get(symbol, [])
+        只移除該使用者對訂閱的持有；沒有其他使用者時，訂閱在寬限期（PRICE_UNSUBSCRIBE_GRACE）後
+        才向交易所取消，寬限期為0或 force 為True時立即取消。
         
-        for exchange_id in exchange_ids:
-            # 檢查交易對是否在該交易所訂閱
-            if symbol not in self.symbol_exchanges or exchange_id not in self.symbol_exchanges[symbol]:
-                logger.warning(f"{exchange_id}未訂閱交易對{symbol}")
-                results[exchange_id] = True  # 視為成功，因為本來就沒訂閱
-                continue
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            exchange_ids: 交易所ID列表。如果為None，則取消每個交易對在所有交易所的訂閱
+            consumer: 使用者ID，None表示默認使用者
+            force: 是否忽略其他使用者立即向交易所取消訂閱
             
-            # 查找連接
-            found = False
-            for conn_key, connection in self.exchange_connections.items():
-                if conn_key.startswith(f"{exchange_id}_"):
+        Returns:
+            各交易對在各交易所的取消訂閱結果，例如 {"BTC/USDT": {"binance": True, "okx": True}}
+        """
+        symbols = list(dict.fromkeys(symbols))
+        consumer = consumer or DEFAULT_CONSUMER
+        results: Dict[str, Dict[str, bool]] = {symbol: {} for symbol in symbols}
+        
+        # 按交易所分組需要立即向交易所取消的交易對
+        by_exchange: Dict[str, List[str]] = {}
+        for symbol in symbols:
+            # 如果沒有指定交易所，取消所有訂閱該交易對的交易所
+            targets = exchange_ids if exchange_ids is not None else list(self.symbol_exchanges.get(symbol, []))
+            for exchange_id in targets:
+                # 檢查交易對是否在該交易所訂閱
+                if exchange_id not in self.symbol_exchanges.get(symbol, []):
+                    logger.warning(f"{exchange_id}未訂閱交易對{symbol}")
+                    results[symbol][exchange_id] = True  # 視為成功，因為本來就沒訂閱
+                    continue
+                
+                idle = self.subscriptions.release(exchange_id, symbol, consumer)
+                if force or (idle and self.subscriptions.grace <= 0):
+                    by_exchange.setdefault(exchange_id, []).append(symbol)
+                else:
+                    # 仍有其他使用者或等待寬限期後取消
+                    results[symbol][exchange_id] = True
+        
+        await self._remove_subscriptions(by_exchange, results)
+        return results
+    
+    async def _remove_subscriptions(self, by_exchange: Dict[str, List[str]],
+                                    results: Optional[Dict[str, Dict[str, bool]]] = None) -> Dict[str, Dict[str, bool]]:
+        """
+        向交易所取消訂閱，各交易所並行處理，每個連接只發送一次批量取消訂閱請求
+        
+        調用時的使用者視為已同意取消；之後（例如等待取消訂閱往返期間）有新使用者訂閱的交易對不會被取消，
+        取消請求已發出的則重新向交易所訂閱，避免新使用者得到訂閱成功的結果卻收不到價格。
+        
+        Args:
+            by_exchange: 各交易所要取消的交易對，例如 {"binance": ["BTC/USDT"]}
+            results: 寫入結果的字典，None表示新建
+            
+        Returns:
+            各交易對在各交易所的取消訂閱結果
+        """
+        if results is None:
+            results = {}
+        claimed: Dict[SubscriptionKey, Set[str]] = {}
+        for exchange_id, exchange_symbols in by_exchange.items():
+            for symbol in exchange_symbols:
+                results.setdefault(symbol, {})
+                claimed[(exchange_id, symbol)] = set(self.subscriptions.holders.get((exchange_id, symbol), ()))
+        
+        def gained_holders(exchange_id: str, symbol: str) -> bool:
+            """訂閱是否有了決定取消後才加入的使用者"""
+            key = (exchange_id, symbol)
+            return bool(self.subscriptions.holders.get(key, set()) - claimed[key])
+        
+        async def unsubscribe_exchange(exchange_id: str, exchange_symbols: List[str]) -> None:
+            connections = [(conn_key, connection) for conn_key, connection in self.exchange_connections.items()
+                           if conn_key.startswith(f"{exchange_id}_")]
+            if not connections:
+                logger.warning(f"找不到{exchange_id}的交易所連接")
+                for symbol in exchange_symbols:
+                    results[symbol][exchange_id] = False
+                return
+            
+            for conn_key, connection in connections:
+                # 交易對可能訂閱在不同市場類型的連接上
+                subscribed = connection.subscribed_symbols
+                pending = []
+                for symbol in exchange_symbols:
+                    if symbol not in subscribed:
+                        continue
+                    if gained_holders(exchange_id, symbol):
+                        # 有新的使用者，保留訂閱
+                        results[symbol][exchange_id] = False
+                    else:
+                        pending.append(symbol)
+                if not pending:
+                    continue
+                
+                try:
+                    await connection.unsubscribe_symbols(pending)
+                except Exception as e:
+                    logger.error(f"取消訂閱{exchange_id}交易對失敗: {e}")
+                    for symbol in pending:
+                        results[symbol][exchange_id] = False
+                    continue
+                
+                # 等待連接期間加入的使用者看到交易對仍在訂閱中，沒有重新訂閱，需要補回
+                remaining = connection.subscribed_symbols
+                regained = [symbol for symbol in pending
+                            if symbol not in remaining and gained_holders(exchange_id, symbol)]
+                if regained:
                     try:
-                        success = await connection.unsubscribe_symbols([symbol])
-                        results[exchange_id] = success
-                        
-                        if success:
-                            # 更新交易對和交易所的映射
-                            self.symbol_exchanges[symbol].remove(exchange_id)
-                            if not self.symbol_exchanges[symbol]:
-                                del self.symbol_exchanges[symbol]
-                            
-                            # 清除價格緩存
-                            if symbol in self.latest_prices and exchange_id in self.latest_prices[symbol]:
-                                del self.latest_prices[symbol][exchange_id]
-                                if not self.latest_prices[symbol]:
-                                    del self.latest_prices[symbol]
-                            
-                            logger.info(f"已取消訂閱{exchange_id}交易對: {symbol}")
-                        
-                        found = True
-                        break
+                        await connection.subscribe_symbols(regained)
                     except Exception as e:
-                        logger.error(f"取消訂閱{exchange_id}交易對{symbol}失敗: {e}")
-                        results[exchange_id] = False
-                        found = True
-                        break
+                        logger.error(f"重新訂閱{exchange_id}交易對失敗: {e}")
+                    remaining = connection.subscribed_symbols
+                    logger.info(f"取消訂閱期間有新的使用者，已重新訂閱{exchange_id} "
+                                f"{sum(1 for symbol in regained if symbol in remaining)}/{len(regained)}個交易對")
+                
+                # 以連接實際取消成功的交易對為準
+                for symbol in pending:
+                    success = symbol not in remaining
+                    results[symbol][exchange_id] = success
+                    if success:
+                        self._clear_symbol(exchange_id, symbol, conn_key)
             
-            if not found:
-                logger.warning(f"找不到{exchange_id}的交易所連接")
-                results[exchange_id] = False
+            # 已不在任何連接上的交易對（例如連接已重建）只需清除本地狀態
+            for symbol in exchange_symbols:
+                if exchange_id not in results[symbol]:
+                    if gained_holders(exchange_id, symbol):
+                        results[symbol][exchange_id] = False
+                        continue
+                    results[symbol][exchange_id] = True
+                    for conn_key, _ in connections:
+                        self._clear_symbol(exchange_id, symbol, conn_key)
+            
+            removed = sum(1 for symbol in exchange_symbols if results[symbol].get(exchange_id))
+            if len(exchange_symbols) == 1 and removed:
+                logger.info(f"已取消訂閱{exchange_id}交易對: {exchange_symbols[0]}")
+            else:
+                logger.info(f"已取消訂閱{exchange_id} {removed}/{len(exchange_symbols)}個交易對")
         
+        await asyncio.gather(*(unsubscribe_exchange(exchange_id, exchange_symbols)
+                               for exchange_id, exchange_symbols in by_exchange.items()))
         return results
     
+    async def _evict(self, keys: List[SubscriptionKey]) -> None:
+        """
+        淘汰超出訂閱預算的訂閱
+        
+        Args:
+            keys: 要淘汰的訂閱 [(交易所ID, 交易對)]
+        """
+        if not keys:
+            return
+        
+        by_exchange: Dict[str, List[str]] = {}
+        held = 0
+        for exchange_id, symbol in keys:
+            by_exchange.setdefault(exchange_id, []).append(symbol)
+            if self.subscriptions.holders.get((exchange_id, symbol)):
+                held += 1
+        if held:
+            logger.warning(f"訂閱數量超出預算（{self.subscriptions.budget}），淘汰{held}個仍有使用者的最久未讀取訂閱")
+        
+        results = await self._remove_subscriptions(by_exchange)
+        self.subscriptions.evicted += sum(1 for exchanges in results.values() for success in exchanges.values() if success)
+        logger.info(f"訂閱數量超出預算，已淘汰{len(keys)}個訂閱")
+    
+    def _ensure_teardown_task(self) -> None:
+        """啟動延遲取消訂閱任務（需要在事件循環中調用）"""
+        if self.subscriptions.grace > 0 and (self._teardown_task is None or self._teardown_task.done()):
+            self._teardown_task = asyncio.create_task(self._teardown_loop())
+    
+    async def _teardown_loop(self) -> None:
+        """每秒檢查一次寬限期已過且沒有使用者的訂閱，批量向交易所取消"""
+        while True:
+            await asyncio.sleep(self.subscriptions.wheel.tick)
+            try:
+                expired = self.subscriptions.expired()
+                if not expired:
+                    continue
+                
+                by_exchange: Dict[str, List[str]] = {}
+                for exchange_id, symbol in expired:
+                    by_exchange.setdefault(exchange_id, []).append(symbol)
+                results = await self._remove_subscriptions(by_exchange)
+                removed = sum(1 for exchanges in results.values() for success in exchanges.values() if success)
+                self.subscriptions.torn_down += removed
+                logger.info(f"寬限期已過，已向交易所取消{removed}個沒有使用者的訂閱")
+            except Exception as e:
+                logger.error(f"延遲取消訂閱時出錯: {e}")
+    
+    def _ensure_snapshot_task(self) -> None:
+        """啟動定期保存快照任務（需要在事件循環中調用）"""
+        if self.snapshot_path and self.snapshot_interval > 0 and (self._snapshot_task is None or self._snapshot_task.done()):
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+    
+    async def _snapshot_loop(self) -> None:
+        """定期保存快照，文件寫入在線程中執行"""
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self._restore_task and not self._restore_task.done():
+                continue
+            try:
+                await asyncio.to_thread(save_snapshot, self.snapshot_path, self.build_snapshot())
+            except Exception as e:
+                logger.error(f"保存價格服務快照失敗: {e}")
+    
+    def build_snapshot(self) -> Dict[str, Any]:
+        """
+        生成快照：各連接訂閱的交易對及其使用者、交易所配置和最新價格（寬限期中沒有使用者的訂閱不保存）
+        
+        Returns:
+            快照內容，格式見 price_snapshot 模組
+        """
+        connections = []
+        for conn_key, connection in self.exchange_connections.items():
+            exchange_id, market_type = conn_key.split("_", 1)
+            symbols = {}
+            for symbol in sorted(connection.subscribed_symbols):
+                holders = self.subscriptions.holders.get((exchange_id, symbol))
+                if holders:
+                    symbols[symbol] = sorted(holders)
+            if symbols:
+                connections.append({
+                    "exchange": exchange_id,
+                    "market_type": market_type,
+                    "config": self.exchange_configs.get(exchange_id, {}).get(market_type),
+                    "symbols": symbols
+                })
+        
+        return {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": int(time.time() * 1000),
+            "connections": connections,
+            "prices": {symbol: dict(prices) for symbol, prices in self.latest_prices.items()}
+        }
+    
+    def restore_snapshot(self) -> Optional[asyncio.Task]:
+        """
+        從快照熱重啟（需要在事件循環中調用）：立即恢復最新價格並標記為過期，直到收到新的tick；
+        同時在後台並行重連各交易所，每個連接按使用者批量重新訂閱
+        
+        交易所配置以當前環境變量為準，快照中的配置只作記錄。
+        
+        Returns:
+            重新訂閱任務，沒有快照時返回None
+        """
+        if not self.snapshot_path:
+            return None
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return None
+        
+        saved_at = int(snapshot.get("saved_at", 0))
+        if time.time() * 1000 - saved_at <= self.snapshot_max_age * 1000:
+            for symbol, prices in snapshot.get("prices", {}).items():
+                current = self.latest_prices.setdefault(symbol, {})
+                for exchange_id, price in prices.items():
+                    if exchange_id not in current:
+                        current[exchange_id] = float(price)
+                        self.restored_prices.add((exchange_id, symbol))
+            self.restored_at = saved_at
+            logger.info(f"已從快照恢復{len(self.restored_prices)}個價格（標記為過期，直到收到新的價格）")
+        else:
+            logger.info(f"價格服務快照已超過{self.snapshot_max_age:g}秒，只恢復訂閱")
+        
+        connections = snapshot.get("connections", [])
+        if not connections:
+            self._discard_restored_prices()
+            return None
+        self._restore_task = asyncio.create_task(self._resubscribe(connections))
+        return self._restore_task
+    
+    async def _resubscribe(self, connections: List[Dict[str, Any]]) -> None:
+        """並行重連快照中的各個連接並批量重新訂閱"""
+        async def restore_connection(entry: Dict[str, Any]) -> int:
+            exchange_id = entry["exchange"]
+            market_type = entry["market_type"]
+            symbols: Dict[str, List[str]] = entry.get("symbols", {})
+            
+            # 按第一個使用者分組，每組一個批量訂閱請求，其餘使用者直接記錄
+            groups: Dict[str, List[str]] = {}
+            for symbol, consumers in symbols.items():
+                groups.setdefault(consumers[0] if consumers else DEFAULT_CONSUMER, []).append(symbol)
+            
+            restored = 0
+            for consumer, group in groups.items():
+                results = await self.subscribe_symbols(group, [exchange_id], market_type, consumer=consumer)
+                for symbol in group:
+                    if not results[symbol][exchange_id]:
+                        continue
+                    restored += 1
+                    for other in symbols[symbol][1:]:
+                        self.subscriptions.acquire(exchange_id, symbol, other)
+            return restored
+        
+        try:
+            counts = await asyncio.gather(*(restore_connection(entry) for entry in connections),
+                                          return_exceptions=True)
+            restored = sum(count for count in counts if isinstance(count, int))
+            total = sum(len(entry.get("symbols", {})) for entry in connections)
+            for entry, count in zip(connections, counts):
+                if isinstance(count, Exception):
+                    logger.error(f"從快照重新訂閱{entry.get('exchange')}_{entry.get('market_type')}失敗: {count}")
+            logger.info(f"已從快照重新訂閱{restored}/{total}個交易對（{len(connections)}個連接）")
+        finally:
+            self._discard_restored_prices()
+    
+    def _discard_restored_prices(self) -> None:
+        """移除沒有重新訂閱成功的交易對的恢復價格"""
+        for exchange_id, symbol in list(self.restored_prices):
+            if exchange_id in self.symbol_exchanges.get(symbol, ()):
+                continue
+            self.restored_prices.discard((exchange_id, symbol))
+            prices = self.latest_prices.get(symbol)
+            if prices is not None:
+                prices.pop(exchange_id, None)
+                if not prices:
+                    del self.latest_prices[symbol]
+            for callback in self.unsubscribe_callbacks:
+                try:
+                    callback(exchange_id, symbol)
+                except Exception as e:
+                    logger.error(f"執行取消訂閱回調函數時出錯: {e}")
+    
+    def _clear_symbol(self, exchange_id: str, symbol: str, conn_key: str) -> None:
+        """
+        取消訂閱成功後清除交易對在該交易所的映射、價格緩存和K線
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            conn_key: 連接鍵，例如 "binance_spot"
+        """
+        # 更新交易對和交易所的映射
+        exchanges = self.symbol_exchanges.get(symbol)
+        if exchanges and exchange_id in exchanges:
+            exchanges.remove(exchange_id)
+            if not exchanges:
+                del self.symbol_exchanges[symbol]
+        
+        # 清除價格緩存
+        if symbol in self.latest_prices and exchange_id in self.latest_prices[symbol]:
+            del self.latest_prices[symbol][exchange_id]
+            if not self.latest_prices[symbol]:
+                del self.latest_prices[symbol]
+        if symbol in self.latest_prices:
+            self.spreads.update(symbol, self.latest_prices[symbol])
+        else:
+            self.spreads.remove(symbol)
+        self._pending_updates.pop((exchange_id, symbol), None)
+        self._published_prices.pop((exchange_id, symbol), None)
+        self.candles.remove(exchange_id, symbol)
+        self.price_history.remove(exchange_id, symbol)
+        self.rolling_stats.remove(exchange_id, symbol)
+        self.restored_prices.discard((exchange_id, symbol))
+        self.watchdog.unwatch(conn_key, symbol)
+        self.subscriptions.forget(exchange_id, symbol)
+        
+        for callback in self.unsubscribe_callbacks:
+            try:
+                callback(exchange_id, symbol)
+            except Exception as e:
+                logger.error(f"執行取消訂閱回調函數時出錯: {e}")
+    
+    async def subscribe_order_book(self, symbol: str, exchange_id: str, market_type: str = "spot") -> bool:
+        """
+        訂閱交易對的本地訂單簿
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            
+        Returns:
+            訂閱是否成功
+        """
+        connection = await self._get_connection(exchange_id, self._resolve_market_type(exchange_id, market_type))
+        if connection is None:
+            return False
+        
+        try:
+            success = await connection.subscribe_depth([symbol])
+            if success:
+                logger.info(f"已訂閱{exchange_id}訂單簿: {symbol} (市場類型: {market_type})")
+            return success
+        except Exception as e:
+            logger.error(f"訂閱{exchange_id}訂單簿{symbol}失敗: {e}")
+            return False
+    
+    async def unsubscribe_order_book(self, symbol: str, exchange_id: str, market_type: str = "spot") -> bool:
+        """
+        取消訂閱交易對的本地訂單簿
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            
+        Returns:
+            取消訂閱是否成功
+        """
+        conn_key = f"{exchange_id}_{self._resolve_market_type(exchange_id, market_type)}"
+        connection = self.exchange_connections.get(conn_key)
+        if connection is None:
+            return True
+        
+        try:
+            return await connection.unsubscribe_depth([symbol])
+        except Exception as e:
+            logger.error(f"取消訂閱{exchange_id}訂單簿{symbol}失敗: {e}")
+            return False
+    
+    def get_order_book(self, symbol: str, exchange_id: str, market_type: str = "spot",
+                       depth: int = 10) -> Optional[Dict[str, Any]]:
+        """
+        獲取交易對本地訂單簿的最優買賣價和前N檔
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            depth: 檔位數量
+            
+        Returns:
+            訂單簿數據，例如 {"bestBid": [50000.0, 1.2], "bestAsk": [50001.0, 0.5], "bids": [...], "asks": [...]}，
+            沒有訂閱時返回None
+        """
+        conn_key = f"{exchange_id}_{self._resolve_market_type(exchange_id, market_type)}"
+        connection = self.exchange_connections.get(conn_key)
+        if connection is None:
+            return None
+        
+        book = connection.get_order_book(symbol)
+        if book is None:
+            return None
+        
+        result = book.to_dict(depth)
+        result["exchange"] = exchange_id
+        return result
+    
+    def get_best_bid_ask(self, symbol: str, exchange_id: str,
+                         market_type: str = "spot") -> Optional[Dict[str, Optional[List[float]]]]:
+        """
+        獲取交易對的最優買賣價
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            
+        Returns:
+            最優買賣價，例如 {"bid": [50000.0, 1.2], "ask": [50001.0, 0.5]}，訂單簿未同步時返回None
+        """
+        conn_key = f"{exchange_id}_{self._resolve_market_type(exchange_id, market_type)}"
+        connection = self.exchange_connections.get(conn_key)
+        book = connection.get_order_book(symbol) if connection is not None else None
+        if book is None or not book.synced:
+            return None
+        
+        best_bid = book.best_bid()
+        best_ask = book.best_ask()
+        return {
+            "bid": list(best_bid) if best_bid else None,
+            "ask": list(best_ask) if best_ask else None
+        }
+    
+    async def subscribe_trades(self, symbol: str, exchange_id: str, market_type: str = "spot") -> bool:
+        """
+        訂閱交易對的成交數據，成交記錄保存在固定容量的環形緩衝區中
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            
+        Returns:
+            訂閱是否成功
+        """
+        connection = await self._get_connection(exchange_id, self._resolve_market_type(exchange_id, market_type))
+        if connection is None:
+            return False
+        
+        try:
+            success = await connection.subscribe_trades([symbol])
+            if success:
+                logger.info(f"已訂閱{exchange_id}成交數據: {symbol} (市場類型: {market_type})")
+            return success
+        except Exception as e:
+            logger.error(f"訂閱{exchange_id}成交數據{symbol}失敗: {e}")
+            return False
+    
+    async def unsubscribe_trades(self, symbol: str, exchange_id: str, market_type: str = "spot") -> bool:
+        """
+        取消訂閱交易對的成交數據
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            
+        Returns:
+            取消訂閱是否成功
+        """
+        conn_key = f"{exchange_id}_{self._resolve_market_type(exchange_id, market_type)}"
+        connection = self.exchange_connections.get(conn_key)
+        if connection is None:
+            return True
+        
+        try:
+            return await connection.unsubscribe_trades([symbol])
+        except Exception as e:
+            logger.error(f"取消訂閱{exchange_id}成交數據{symbol}失敗: {e}")
+            return False
+    
+    def _get_trade_buffer(self, symbol: str, exchange_id: str, market_type: str) -> Optional[TradeRingBuffer]:
+        """查找交易對的成交記錄緩衝區"""
+        conn_key = f"{exchange_id}_{self._resolve_market_type(exchange_id, market_type)}"
+        connection = self.exchange_connections.get(conn_key)
+        return connection.get_trade_buffer(symbol) if connection is not None else None
+    
+    def get_recent_trades(self, symbol: str, exchange_id: str, market_type: str = "spot",
+                          limit: int = 100) -> Optional[TradeView]:
+        """
+        獲取交易對最近N筆成交
+        
+        返回的是成交記錄緩衝區的只讀數組視圖（不複製數據），之後的成交會覆蓋其內容，
+        需要長期保存時請自行複製。
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            limit: 成交筆數
+            
+        Returns:
+            成交記錄視圖 (timestamps, prices, quantities, sides)，沒有訂閱時返回None
+        """
+        buffer = self._get_trade_buffer(symbol, exchange_id, market_type)
+        return buffer.last(limit) if buffer is not None else None
+    
+    def get_trades_between(self, symbol: str, exchange_id: str, start_ms: int,
+                           end_ms: Optional[int] = None, market_type: str = "spot") -> Optional[TradeView]:
+        """
+        獲取交易對在時間窗口內的成交，返回值同 get_recent_trades
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            start_ms: 開始時間（毫秒，包含）
+            end_ms: 結束時間（毫秒，包含），None表示到最新一筆
+            market_type: 市場類型，例如 "spot", "futures", "swap"
+            
+        Returns:
+            成交記錄視圖，沒有訂閱時返回None
+        """
+        buffer = self._get_trade_buffer(symbol, exchange_id, market_type)
+        if buffer is None:
+            return None
+        if end_ms is None:
+            end_ms = np.iinfo(np.int64).max
+        return buffer.window(start_ms, end_ms)
+    
+    def get_candles(self, symbol: str, exchange_id: str, interval: str = "1m",
+                    limit: int = 100) -> Optional[List[Dict[str, Any]]]:
+        """
+        獲取交易對最近的K線（由實時價格生成，最後一根可能尚未收盤）
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            interval: 週期，"1s"、"1m"、"5m" 或 "1h"
+            limit: K線數量
+            
+        Returns:
+            K線列表，沒有該交易對的價格數據時返回None
+            
+        Raises:
+            ValueError: 不支持的週期
+        """
+        return self.candles.get_candles(exchange_id, symbol, interval, limit)
+    
+    def get_price_history(self, symbol: str, exchange_id: str, limit: Optional[int] = None,
+                          start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Optional[PriceView]:
+        """
+        獲取交易對最近的價格歷史
+        
+        返回的是價格歷史緩衝區的只讀數組視圖（不複製數據），之後的tick會覆蓋其內容，
+        需要長期保存時請自行複製。
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            limit: 最多返回最近多少個tick，None表示不限制（時間窗口內的全部或全部保留的tick）
+            start_ms: 開始時間（毫秒，包含），None表示不限制
+            end_ms: 結束時間（毫秒，包含），None表示到最新一個tick
+            
+        Returns:
+            價格歷史視圖 (timestamps, prices)，沒有該交易對的價格數據時返回None
+        """
+        buffer = self.price_history.get(exchange_id, symbol)
+        if buffer is None:
+            return None
+        
+        if start_ms is None and end_ms is None:
+            return buffer.last(buffer.capacity if limit is None else limit)
+        
+        view = buffer.window(start_ms if start_ms is not None else np.iinfo(np.int64).min,
+                             end_ms if end_ms is not None else np.iinfo(np.int64).max)
+        if limit is not None and len(view) > limit:
+            # 窗口內超過limit時保留最新的部分
+            view = PriceView(view.timestamps[len(view) - limit:], view.prices[len(view) - limit:])
+        return view
+    
+    def _ensure_publish_task(self) -> None:
+        """啟動價格發布任務（需要在事件循環中調用）"""
+        if self.publish_interval > 0 and (self._publish_task is None or self._publish_task.done()):
+            self._publish_task = asyncio.create_task(self._publish_loop())
+    
+    async def _publish_loop(self) -> None:
+        """按發布間隔將合併後的價格通知給回調函數"""
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                self._flush_updates()
+            except Exception as e:
+                logger.error(f"發布價格更新時出錯: {e}")
+    
+    def _flush_updates(self) -> None:
+        """發布所有待發布的價格"""
+        if not self._pending_updates:
+            return
+        
+        updates = self._pending_updates
+        self._pending_updates = {}
+        for (exchange_id, symbol), price in updates.items():
+            self._publish(exchange_id, symbol, price)
+    
+    def _publish(self, exchange_id: str, symbol: str, price: float) -> None:
+        """
+        將價格通知給合併回調函數，價格與上次發布相同時跳過
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            price: 價格
+        """
+        key = (exchange_id, symbol)
+        if self._published_prices.get(key) == price:
+            return
+        self._published_prices[key] = price
+        self.updates_published += 1
+        
+        for deliver in self.subscribers.match(exchange_id, symbol):
+            try:
+                deliver(exchange_id, symbol, price)
+            except Exception as e:
+                logger.error(f"執行價格回調函數時出錯: {e}")
+    
     def _on_price_update(self, exchange_id: str, symbol: str, price: float) -> None:
         """
         處理價格更新
@@ -253,38 +1126,337 @@ class PriceManager:
             symbol: 交易對
             price: 價格
         """
+        self.ticks_received += 1
+        
         # 更新最新價格緩存
         if symbol not in self.latest_prices:
             self.latest_prices[symbol] = {}
-        self.latest_prices[symbol][exchange_id] = price
+        prices = self.latest_prices[symbol]
+        prices[exchange_id] = price
+        if self.restored_prices:
+            self.restored_prices.discard((exchange_id, symbol))
         
-        # 通知回調
-        for callback, exchanges in self.price_callbacks:
-            if not exchanges or exchange_id in exchanges:
-                try:
-                    callback(exchange_id, symbol, price)
-                except Exception as e:
-                    logger.error(f"執行價格回調函數時出錯: {e}")
+        # 只重新計算該交易對的跨交易所價差
+        if len(prices) > 1:
+            self.spreads.update(symbol, prices)
+        
+        # 只取出被這個價格穿越的警報
+        fired = self.alerts.check(exchange_id, symbol, price)
+        if fired:
+            self._notify_alerts(fired)
+        
+        # 更新K線和價格歷史
+        self.candles.update(exchange_id, symbol, price)
+        self.price_history.append(exchange_id, symbol, price, self.candles.now_ms())
+        self.rolling_stats.update(exchange_id, symbol, price)
+        
+        # 原始回調：每個tick立即通知
+        for deliver in self.raw_subscribers.match(exchange_id, symbol):
+            try:
+                deliver(exchange_id, symbol, price)
+            except Exception as e:
+                logger.error(f"執行原始價格回調函數時出錯: {e}")
+        
+        if not self.subscribers.match(exchange_id, symbol):
+            return
+        
+        # 合併回調：只保留最新價格，由發布任務按間隔通知
+        if self.publish_interval > 0 and self._publish_task is not None:
+            self._pending_updates[(exchange_id, symbol)] = price
+        else:
+            self._publish(exchange_id, symbol, price)
     
-    def add_price_callback(self, callback: Callable[[str, str, float], None], 
-                          exchanges: Optional[Set[str]] = None) -> None:
+    def add_price_callback(self, callback: PriceCallback, 
+                          exchanges: Optional[Set[str]] = None,
+                          raw: bool = False,
+                          symbols: Optional[Set[str]] = None,
+                          queue_size: int = 1000,
+                          overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST) -> None:
         """
         添加價格更新回調函數
         
+        同步回調在行情處理中直接執行，必須快速返回；async def 回調擁有獨立的有界隊列和消費任務，
+        處理緩慢時按溢出策略丟棄自己隊列中的價格，不會阻塞行情處理。
+        
         Args:
-            callback: 回調函數，參數為(exchange_id, symbol, price)
+            callback: 回調函數（同步或 async def），參數為(exchange_id, symbol, price)
             exchanges: 只關注特定交易所的價格更新，None表示所有交易所
+            raw: 是否接收每個原始tick；默認按發布間隔接收合併後且有變化的價格
+            symbols: 只關注特定交易對的價格更新，None表示所有交易對
+            queue_size: 異步回調的隊列容量
+            overflow_policy: 異步回調隊列已滿時的處理策略
         """
-        self.price_callbacks.append((callback, exchanges or set()))
+        subscribers = self.raw_subscribers if raw else self.subscribers
+        subscribers.add(callback, exchanges=exchanges, symbols=symbols,
+                        queue_size=queue_size, overflow_policy=overflow_policy)
     
-    def remove_price_callback(self, callback: Callable[[str, str, float], None]) -> None:
+    def remove_price_callback(self, callback: PriceCallback) -> None:
         """
         移除價格更新回調函數
         
         Args:
             callback: 要移除的回調函數
         """
-        self.price_callbacks = [(cb, exs) for cb, exs in self.price_callbacks if cb != callback]
+        self.subscribers.remove(callback)
+        self.raw_subscribers.remove(callback)
+    
+    def add_unsubscribe_callback(self, callback: Callable[[str, str], None]) -> None:
+        """
+        添加交易對向交易所取消訂閱後的回調函數（包括寬限期後的延遲取消、超出預算的淘汰和快照恢復後重新訂閱失敗）
+        
+        Args:
+            callback: 回調函數，參數為(exchange_id, symbol)
+        """
+        self.unsubscribe_callbacks.append(callback)
+    
+    def add_read_time_source(self, source: Callable[[], Dict[str, float]]) -> None:
+        """
+        添加交易對讀取時間的來源，用於價格不經過本管理器讀取的情況（例如API進程從共享內存讀取），
+        超出訂閱預算時按合併後的讀取時間淘汰最久未讀取的訂閱
+        
+        Args:
+            source: 返回各交易對最近讀取時間（Unix秒）的函數，例如 SharedPriceTable.read_times
+        """
+        self.read_time_sources.append(source)
+    
+    def add_alert_callback(self, callback: Callable[[Dict[str, Any]], Any]) -> None:
+        """
+        添加警報觸發後的回調函數，async def 回調會作為任務執行
+        
+        Args:
+            callback: 回調函數，參數為觸發記錄，例如 {"id": 1, "symbol": "BTC/USDT", "price": 50001.0, ...}
+        """
+        self.alert_callbacks.append(callback)
+    
+    def remove_alert_callback(self, callback: Callable[[Dict[str, Any]], Any]) -> None:
+        """
+        移除警報觸發後的回調函數
+        
+        Args:
+            callback: 要移除的回調函數
+        """
+        if callback in self.alert_callbacks:
+            self.alert_callbacks.remove(callback)
+    
+    def _notify_alerts(self, events: List[Dict[str, Any]]) -> None:
+        """通知警報回調函數"""
+        for event in events:
+            logger.info(f"價格警報 #{event['id']} 觸發: {event['exchange']} {event['symbol']} "
+                        f"{event['direction']} {event['threshold']}，價格 {event['price']}")
+            for callback in self.alert_callbacks:
+                try:
+                    result = callback(event)
+                    if asyncio.iscoroutine(result):
+                        asyncio.ensure_future(result)
+                except Exception as e:
+                    logger.error(f"執行警報回調函數時出錯: {e}")
+    
+    def add_alert(self, symbol: str, exchange_id: str, direction: str, threshold: float,
+                  mode: str = "once", hysteresis: Optional[float] = None,
+                  note: Optional[str] = None) -> Dict[str, Any]:
+        """
+        添加價格警報，警報只在價格穿越閾值時觸發（需要另外訂閱該交易對才會收到價格）
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，例如 "binance"
+            direction: "above"（向上穿越）或 "below"（向下穿越）
+            threshold: 閾值價格
+            mode: "once"（一次性）或 "repeat"（重複）
+            hysteresis: 重複警報觸發後價格需要反向越過的回差，None表示使用閾值的0.1%
+            note: 備註
+        
+        Returns:
+            新的警報
+        
+        Raises:
+            ValueError: 參數無效
+        """
+        last_price = self.latest_prices.get(symbol, {}).get(exchange_id)
+        alert = self.alerts.add(exchange_id, symbol, direction, threshold, mode=mode,
+                                hysteresis=hysteresis, note=note, last_price=last_price)
+        return alert.to_dict()
+    
+    def update_alert(self, alert_id: int, **changes: Any) -> Optional[Dict[str, Any]]:
+        """
+        修改價格警報，修改後按當前價格重新生效
+        
+        Args:
+            alert_id: 警報ID
+            **changes: 要修改的欄位，可以是 direction、threshold、mode、hysteresis、note
+        
+        Returns:
+            修改後的警報，找不到時返回None
+        
+        Raises:
+            ValueError: 參數無效
+        """
+        alert: Optional[Alert] = self.alerts.get(alert_id)
+        if alert is None:
+            return None
+        last_price = self.latest_prices.get(alert.symbol, {}).get(alert.exchange_id)
+        alert = self.alerts.update(alert_id, last_price=last_price, **changes)
+        return alert.to_dict() if alert else None
+    
+    def remove_alert(self, alert_id: int) -> bool:
+        """
+        刪除價格警報
+        
+        Args:
+            alert_id: 警報ID
+        
+        Returns:
+            是否找到並刪除
+        """
+        return self.alerts.remove(alert_id)
+    
+    def get_alert(self, alert_id: int) -> Optional[Dict[str, Any]]:
+        """
+        獲取價格警報
+        
+        Args:
+            alert_id: 警報ID
+        
+        Returns:
+            警報，找不到時返回None
+        """
+        alert = self.alerts.get(alert_id)
+        return alert.to_dict() if alert else None
+    
+    def get_alerts(self, symbol: Optional[str] = None, exchange_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        列出價格警報
+        
+        Args:
+            symbol: 只列出該交易對的警報，None表示全部
+            exchange_id: 只列出該交易所的警報，None表示全部
+        
+        Returns:
+            按ID排列的警報列表
+        """
+        return [alert.to_dict() for alert in self.alerts.list(symbol=symbol, exchange_id=exchange_id)]
+    
+    def get_alert_events(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        獲取最近的警報觸發記錄
+        
+        Args:
+            limit: 返回數量
+        
+        Returns:
+            按時間從新到舊排列的觸發記錄
+        """
+        return self.alerts.get_events(limit)
+    
+    def get_alert_stats(self) -> Dict[str, Any]:
+        """
+        獲取價格警報的統計信息
+        
+        Returns:
+            統計信息，例如 {"alerts": 100, "armed": 90, "waiting": 5, "triggered": 5, "books": 20, "fired": 42}
+        """
+        return self.alerts.get_stats()
+    
+    def get_publish_stats(self) -> Dict[str, Any]:
+        """
+        獲取價格合併發布的統計信息
+        
+        Returns:
+            統計信息，例如 {"interval": 0.25, "ticks_received": 1000, "updates_published": 120, "pending": 3}
+        """
+        return {
+            "interval": self.publish_interval,
+            "ticks_received": self.ticks_received,
+            "updates_published": self.updates_published,
+            "pending": len(self._pending_updates)
+        }
+    
+    def get_top_spreads(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        獲取跨交易所價差（基點）最大的交易對，直接返回增量維護的快照
+        
+        Args:
+            limit: 返回數量，None表示全部（最多 PRICE_SPREAD_TOP_K 個）
+            
+        Returns:
+            按價差從大到小排列的價差列表，例如 [{"symbol": "BTC/USDT", "high_exchange": "okx", "bps": 2.0, ...}]
+        """
+        return self.spreads.top(limit)
+    
+    def get_spread(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """
+        獲取交易對的跨交易所價差
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            價差，例如 {"symbol": "BTC/USDT", "high_exchange": "okx", "high": 50010.0,
+            "low_exchange": "binance", "low": 50000.0, "spread": 10.0, "bps": 2.0, "timestamp": ...}，
+            少於兩個交易所有價格時返回None
+        """
+        return self.spreads.get_spread(symbol)
+    
+    def get_price_stats(self, symbol: str, exchange_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        獲取交易對的滾動統計（EMA、收益率波動率和z分數）
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，如果為None則返回所有交易所的統計
+            
+        Returns:
+            按窗口分組的統計，例如 {"20": {"ema": 50001.2, "mean": 0.00001, "volatility": 0.0003, "zscore": 1.4, "count": 20}}，
+            未指定exchange_id時按交易所分組，例如 {"binance": {"20": {...}}}；沒有數據時返回None
+        """
+        if exchange_id:
+            return self.rolling_stats.get(exchange_id, symbol)
+        
+        stats = {}
+        for exchange in self.latest_prices.get(symbol, {}):
+            exchange_stats = self.rolling_stats.get(exchange, symbol)
+            if exchange_stats is not None:
+                stats[exchange] = exchange_stats
+        return stats or None
+    
+    def get_rolling_stats_usage(self) -> Dict[str, Any]:
+        """
+        獲取滾動統計的窗口和記憶體佔用
+        
+        Returns:
+            統計信息，例如 {"windows": [20, 100, 500], "slots": 120, "capacity": 256, "bytes": 1100000}
+        """
+        return self.rolling_stats.get_stats()
+    
+    def get_history_stats(self) -> Dict[str, Any]:
+        """
+        獲取價格歷史緩衝區的統計信息
+        
+        Returns:
+            統計信息，例如 {"capacity": 2000, "buffers": 120, "bytes": 7680000}
+        """
+        return self.price_history.get_stats()
+    
+    def get_subscription_stats(self) -> Dict[str, Any]:
+        """
+        獲取訂閱引用計數的統計信息
+        
+        Returns:
+            統計信息，例如 {"subscriptions": 120, "idle": 3, "budget": 500, "reused": 12, ...}
+        """
+        return self.subscriptions.get_stats()
+    
+    def get_subscriber_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        獲取價格訂閱者的統計信息
+        
+        Returns:
+            {"coalesced": [...], "raw": [...]}，每個訂閱者包含過濾條件，異步訂閱者另外包含隊列深度、丟棄數量和排隊延遲
+        """
+        return {
+            "coalesced": self.subscribers.get_stats(),
+            "raw": self.raw_subscribers.get_stats()
+        }
     
     def get_latest_price(self, symbol: str, exchange_id: Optional[str] = None) -> Optional[Dict[str, float]]:
         """
@@ -297,6 +1469,8 @@ class PriceManager:
         Returns:
             價格信息，例如 {"binance": 50000.0, "okx": 50010.0} 或 50000.0 (指定exchange_id時)
         """
+        if symbol in self.symbol_exchanges:
+            self.subscriptions.touch(symbol)
         if symbol not in self.latest_prices:
             return None
         
@@ -305,6 +1479,21 @@ class PriceManager:
         
         return self.latest_prices[symbol]
     
+    def get_restored_exchanges(self, symbol: str) -> List[str]:
+        """
+        獲取交易對價格仍為快照恢復值（過期）的交易所
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            交易所ID列表，例如 ["okx"]
+        """
+        if not self.restored_prices:
+            return []
+        return [exchange_id for exchange_id in self.latest_prices.get(symbol, {})
+                if (exchange_id, symbol) in self.restored_prices]
+    
     def get_subscribed_symbols(self) -> Dict[str, List[str]]:
         """
         獲取所有已訂閱的交易對
@@ -326,6 +1515,71 @@ class PriceManager:
             for conn_key, connection in self.exchange_connections.items()
         }
     
+    def get_connection_load(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        獲取各交易所連接的分片負載
+        
+        Returns:
+            各連接鍵的分片負載，例如 {"binance_spot": [{"shard": 0, "symbols": 150, "capacity": 200, "state": "CONNECTED"}]}
+        """
+        return {
+            conn_key: connection.get_shard_load()
+            for conn_key, connection in self.exchange_connections.items()
+        }
+    
+    def get_endpoint_stats(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        獲取各交易所連接的端點池狀態
+        
+        Returns:
+            各連接鍵的端點池狀態，例如 {"binance_spot": {"endpoints": [{"url": "wss://...", "latency_ms": 35.2, "failures": 0}], "breaker": {...}}}
+        """
+        return {
+            conn_key: connection.get_endpoint_stats()
+            for conn_key, connection in self.exchange_connections.items()
+        }
+    
+    def get_latency_stats(self, reset: bool = False) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        獲取各交易所從交易所事件時間到價格回調完成的延遲分佈
+        
+        Args:
+            reset: 讀取後是否清空統計
+        
+        Returns:
+            各交易所的延遲統計（毫秒），例如
+            {"binance": {"network": {"p50": 12.1, "p99": 40.3, "p999": 85.0, ...}, "processing": {...}, "total": {...}}}
+        """
+        trackers: Dict[str, List[LatencyTracker]] = {}
+        for conn_key, connection in self.exchange_connections.items():
+            exchange_id = conn_key.split("_", 1)[0]
+            trackers.setdefault(exchange_id, []).extend(
+                shard.latency for shard in connection.shards if shard.latency is not None
+            )
+        
+        stats = {exchange_id: merge_trackers(items) for exchange_id, items in trackers.items()}
+        if reset:
+            for items in trackers.values():
+                for tracker in items:
+                    tracker.reset()
+        return stats
+    
+    def get_staleness(self) -> Dict[str, Any]:
+        """
+        獲取各交易對距離最近一次價格更新的秒數及監控統計
+        
+        Returns:
+            例如 {"watchdog": {"stale_after": 60, ...}, "connections": {"binance_spot": {"BTC/USDT": 0.4}}}
+        """
+        now = time.monotonic()
+        return {
+            "watchdog": self.watchdog.get_stats(),
+            "connections": {
+                conn_key: connection.get_staleness(now)
+                for conn_key, connection in self.exchange_connections.items()
+            }
+        }
+    
     def get_symbol_market_types(self, symbol: str) -> Dict[str, str]:
         """
         獲取交易對的市場類型
@@ -0,0 +1,80 @@
+"""
+價格服務快照（熱重啟）
+
+定期及關閉時將已訂閱的交易對（按連接分組，包括交易所配置和持有訂閱的使用者）與最新價格保存到本地JSON文件；
+重新啟動時先恢復價格（標記為過期，直到收到新的tick），再並行重連各交易所並批量重新訂閱。
+
+寫入時先寫臨時文件再原子替換，進程在寫入中途退出也不會留下損壞的快照。
+
+文件格式:
+    {
+        "version": 1,
+        "saved_at": 1700000000000,
+        "connections": [
+            {"exchange": "binance", "market_type": "spot", "config": {...},
+             "symbols": {"BTC/USDT": ["default", "tab-1"]}}
+        ],
+        "prices": {"BTC/USDT": {"binance": 50000.0, "okx": 50010.0}}
+    }
+"""
+
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path: str, snapshot: Dict[str, Any]) -> None:
+    """
+    保存快照
+    
+    Args:
+        path: 快照文件路徑，目錄不存在時自動創建
+        snapshot: 快照內容
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    
+    fd, temp_path = tempfile.mkstemp(prefix=".price_snapshot.", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """
+    載入快照
+    
+    Args:
+        path: 快照文件路徑
+    
+    Returns:
+        快照內容，文件不存在、無法解析或版本不符時返回None
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"無法讀取價格服務快照 {path}: {e}")
+        return None
+    
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        logger.warning(f"忽略不支持的價格服務快照 {path}（版本: {snapshot.get('version') if isinstance(snapshot, dict) else None}）")
+        return None
+    return snapshot
@@ -0,0 +1,313 @@
+"""
+遠程價格管理器
+
+與 PriceManager 接口兼容的讀取端，供API進程在行情由獨立進程（ingest_service）接入時使用：
+最新價格直接從共享內存價格表讀取，不加鎖、不經過進程間通信；訂閱和其他查詢通過控制連接轉發到行情接入進程（每次調用從連接池取一個連接，互不阻塞）。
+轉發的方法都是協程（遠程調用在線程中執行，最長可能等待 CALL_TIMEOUT 秒），不會阻塞事件循環；
+同名的 PriceManager 查詢方法是同步的，API端點通過 _resolve 統一處理兩者。
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from multiprocessing.connection import Client, Connection
+from typing import Dict, List, Optional, Any
+
+from app.services.price_service.ingest_service import ingest_address, ingest_authkey, shm_name
+from app.services.price_service.price_history import PriceView
+from app.services.price_service.shared_prices import SharedPriceTable
+from app.services.price_service.trade_buffer import TradeView
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteCallError(RuntimeError):
+    """行情接入進程執行請求失敗"""
+
+
+class RemotePriceManager:
+    """
+    從共享內存讀取價格、通過控制連接訂閱的價格管理器
+    """
+    
+    def __init__(self, name: Optional[str] = None):
+        """
+        初始化遠程價格管理器，共享內存和控制連接在第一次使用時才建立
+        
+        Args:
+            name: 共享內存價格表名稱，None表示使用 PRICE_SHM_NAME
+        """
+        self.name = name or shm_name()
+        self._table: Optional[SharedPriceTable] = None
+        # 空閒的控制連接，最多保留 PRICE_INGEST_POOL_SIZE 個
+        self.pool_size = max(1, int(os.environ.get("PRICE_INGEST_POOL_SIZE", "4")))
+        self._idle: List[Connection] = []
+        self._lock = threading.Lock()
+        # 控制連接斷開後設置，下次讀取時重新映射價格表（行情接入進程可能已重啟）
+        self._remap = False
+    
+    @property
+    def table(self) -> SharedPriceTable:
+        """共享內存價格表，行情接入進程重啟後自動重新映射"""
+        if self._table is not None and (self._remap or self._table.retired):
+            self._table.close()
+            self._table = None
+        self._remap = False
+        if self._table is None:
+            try:
+                self._table = SharedPriceTable.attach(self.name)
+            except FileNotFoundError:
+                raise RemoteCallError(f"找不到共享內存價格表 {self.name}，行情接入進程是否已啟動？")
+        return self._table
+    
+    def _connect(self) -> Connection:
+        """從連接池取出空閒的控制連接，沒有時建立新連接"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            address, authkey = ingest_address(), ingest_authkey()
+        except (ValueError, RuntimeError) as e:
+            raise RemoteCallError(str(e))
+        return Client(address, authkey=authkey)
+    
+    def _release(self, connection: Connection) -> None:
+        """歸還控制連接，連接池已滿時關閉"""
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+    
+    def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """
+        在行情接入進程中調用 PriceManager 方法（阻塞），連接斷開時重連一次
+        
+        每次調用獨佔一個控制連接，慢請求（例如訂閱大量交易對）不會阻塞同時進行的其他調用。
+        
+        Args:
+            method: 方法名
+            *args: 位置參數
+            **kwargs: 關鍵字參數
+        
+        Returns:
+            方法的返回值
+        
+        Raises:
+            RemoteCallError: 無法連接或方法執行失敗
+        """
+        for attempt in range(2):
+            connection = None
+            try:
+                connection = self._connect()
+                connection.send((method, args, kwargs))
+                success, result = connection.recv()
+                break
+            except (EOFError, OSError) as e:
+                if connection is not None:
+                    connection.close()
+                # 連接斷開可能是行情接入進程重啟，下次讀取時重新映射價格表
+                self._remap = True
+                if attempt:
+                    raise RemoteCallError(f"無法連接行情接入進程: {e}")
+        
+        self._release(connection)
+        if not success:
+            raise RemoteCallError(result)
+        return result
+    
+    async def _call_async(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """在線程中執行遠程調用，不阻塞事件循環"""
+        return await asyncio.to_thread(self._call, method, *args, **kwargs)
+    
+    async def close_all(self) -> None:
+        """斷開與行情接入進程的連接（不會關閉交易所連接）"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+        if self._table is not None:
+            self._table.close()
+            self._table = None
+    
+    # 直接從共享內存讀取
+    
+    def get_latest_price(self, symbol: str, exchange_id: Optional[str] = None) -> Optional[Dict[str, float]]:
+        """
+        獲取交易對的最新價格
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            exchange_id: 交易所ID，如果為None則返回所有交易所的價格
+        
+        Returns:
+            價格信息，例如 {"binance": 50000.0, "okx": 50010.0} 或 50000.0 (指定exchange_id時)
+        """
+        table = self.table
+        # 記錄讀取時間，行情接入進程按最久未讀取的順序淘汰訂閱
+        table.touch(symbol)
+        if exchange_id:
+            entry = table.read(exchange_id, symbol)
+            return entry[0] if entry is not None else None
+        
+        entries = table.read_symbol(symbol)
+        if not entries:
+            return None
+        return {exchange: entry[0] for exchange, entry in entries.items()}
+    
+    def get_restored_exchanges(self, symbol: str) -> List[str]:
+        """
+        獲取交易對價格仍為快照恢復值（過期）的交易所
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+        
+        Returns:
+            交易所ID列表，例如 ["okx"]
+        """
+        restored_at = self.table.restored_at
+        if not restored_at:
+            return []
+        return [exchange for exchange, entry in self.table.read_symbol(symbol).items() if entry[1] <= restored_at]
+    
+    def get_latest_prices(self) -> Dict[str, Dict[str, float]]:
+        """
+        獲取所有交易對的最新價格
+        
+        Returns:
+            例如 {"BTC/USDT": {"binance": 50000.0, "okx": 50010.0}}
+        """
+        prices: Dict[str, Dict[str, float]] = {}
+        for exchange_id, symbol, (price, _, _) in self.table.items():
+            prices.setdefault(symbol, {})[exchange_id] = price
+        return prices
+    
+    # 轉發到行情接入進程
+    
+    async def subscribe_symbol(self, symbol: str, exchange_ids: List[str], market_type: str = "spot",
+                               consumer: Optional[str] = None) -> Dict[str, bool]:
+        return await self._call_async("subscribe_symbol", symbol, exchange_ids, market_type, consumer)
+    
+    async def unsubscribe_symbol(self, symbol: str, exchange_ids: Optional[List[str]] = None,
+                                 consumer: Optional[str] = None, force: bool = False) -> Dict[str, bool]:
+        return await self._call_async("unsubscribe_symbol", symbol, exchange_ids, consumer, force)
+    
+    async def subscribe_symbols(self, symbols: List[str], exchange_ids: List[str],
+                                market_type: str = "spot", consumer: Optional[str] = None) -> Dict[str, Dict[str, bool]]:
+        return await self._call_async("subscribe_symbols", symbols, exchange_ids, market_type, consumer)
+    
+    async def unsubscribe_symbols(self, symbols: List[str], exchange_ids: Optional[List[str]] = None,
+                                  consumer: Optional[str] = None, force: bool = False) -> Dict[str, Dict[str, bool]]:
+        return await self._call_async("unsubscribe_symbols", symbols, exchange_ids, consumer, force)
+    
+    async def subscribe_order_book(self, symbol: str, exchange_id: str, market_type: str = "spot") -> bool:
+        return await self._call_async("subscribe_order_book", symbol, exchange_id, market_type)
+    
+    async def unsubscribe_order_book(self, symbol: str, exchange_id: str, market_type: str = "spot") -> bool:
+        return await self._call_async("unsubscribe_order_book", symbol, exchange_id, market_type)
+    
+    async def subscribe_trades(self, symbol: str, exchange_id: str, market_type: str = "spot") -> bool:
+        return await self._call_async("subscribe_trades", symbol, exchange_id, market_type)
+    
+    async def unsubscribe_trades(self, symbol: str, exchange_id: str, market_type: str = "spot") -> bool:
+        return await self._call_async("unsubscribe_trades", symbol, exchange_id, market_type)
+    
+    async def get_order_book(self, symbol: str, exchange_id: str, market_type: str = "spot",
+                             depth: int = 10) -> Optional[Dict[str, Any]]:
+        return await self._call_async("get_order_book", symbol, exchange_id, market_type, depth)
+    
+    async def get_best_bid_ask(self, symbol: str, exchange_id: str, market_type: str = "spot") -> Optional[Dict[str, Any]]:
+        return await self._call_async("get_best_bid_ask", symbol, exchange_id, market_type)
+    
+    async def get_recent_trades(self, symbol: str, exchange_id: str, market_type: str = "spot",
+                                limit: int = 100) -> Optional[TradeView]:
+        # 遠程調用返回的是成交記錄的副本
+        return await self._call_async("get_recent_trades", symbol, exchange_id, market_type, limit)
+    
+    async def get_trades_between(self, symbol: str, exchange_id: str, start_ms: int,
+                                 end_ms: Optional[int] = None, market_type: str = "spot") -> Optional[TradeView]:
+        return await self._call_async("get_trades_between", symbol, exchange_id, start_ms, end_ms, market_type)
+    
+    async def get_candles(self, symbol: str, exchange_id: str, interval: str = "1m",
+                          limit: int = 100) -> Optional[List[Dict[str, Any]]]:
+        try:
+            return await self._call_async("get_candles", symbol, exchange_id, interval, limit)
+        except RemoteCallError as e:
+            # 保持與 PriceManager 相同的異常類型
+            if str(e).startswith("ValueError"):
+                raise ValueError(str(e).split(": ", 1)[-1])
+            raise
+    
+    async def get_price_history(self, symbol: str, exchange_id: str, limit: Optional[int] = None,
+                                start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Optional[PriceView]:
+        # 遠程調用返回的是價格歷史的副本
+        return await self._call_async("get_price_history", symbol, exchange_id, limit, start_ms, end_ms)
+    
+    async def get_top_spreads(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return await self._call_async("get_top_spreads", limit)
+    
+    async def get_spread(self, symbol: str) -> Optional[Dict[str, Any]]:
+        return await self._call_async("get_spread", symbol)
+    
+    async def get_history_stats(self) -> Dict[str, Any]:
+        return await self._call_async("get_history_stats")
+    
+    async def get_price_stats(self, symbol: str, exchange_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return await self._call_async("get_price_stats", symbol, exchange_id)
+    
+    async def get_rolling_stats_usage(self) -> Dict[str, Any]:
+        return await self._call_async("get_rolling_stats_usage")
+    
+    async def add_alert(self, symbol: str, exchange_id: str, direction: str, threshold: float,
+                        mode: str = "once", hysteresis: Optional[float] = None,
+                        note: Optional[str] = None) -> Dict[str, Any]:
+        return await self._call_async("add_alert", symbol, exchange_id, direction, threshold, mode, hysteresis, note)
+    
+    async def update_alert(self, alert_id: int, **changes: Any) -> Optional[Dict[str, Any]]:
+        return await self._call_async("update_alert", alert_id, **changes)
+    
+    async def remove_alert(self, alert_id: int) -> bool:
+        return await self._call_async("remove_alert", alert_id)
+    
+    async def get_alert(self, alert_id: int) -> Optional[Dict[str, Any]]:
+        return await self._call_async("get_alert", alert_id)
+    
+    async def get_alerts(self, symbol: Optional[str] = None, exchange_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self._call_async("get_alerts", symbol, exchange_id)
+    
+    async def get_alert_events(self, limit: int = 100) -> List[Dict[str, Any]]:
+        return await self._call_async("get_alert_events", limit)
+    
+    async def get_alert_stats(self) -> Dict[str, Any]:
+        return await self._call_async("get_alert_stats")
+    
+    async def get_subscribed_symbols(self) -> Dict[str, List[str]]:
+        return await self._call_async("get_subscribed_symbols")
+    
+    async def get_symbol_market_types(self, symbol: str) -> Dict[str, str]:
+        return await self._call_async("get_symbol_market_types", symbol)
+    
+    async def get_exchange_status(self) -> Dict[str, bool]:
+        return await self._call_async("get_exchange_status")
+    
+    async def get_connection_load(self) -> Dict[str, List[Dict[str, Any]]]:
+        return await self._call_async("get_connection_load")
+    
+    async def get_endpoint_stats(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        return await self._call_async("get_endpoint_stats")
+    
+    async def get_publish_stats(self) -> Dict[str, Any]:
+        return await self._call_async("get_publish_stats")
+    
+    async def get_subscription_stats(self) -> Dict[str, Any]:
+        return await self._call_async("get_subscription_stats")
+    
+    async def get_subscriber_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        return await self._call_async("get_subscriber_stats")
+    
+    async def get_staleness(self) -> Dict[str, Any]:
+        return await self._call_async("get_staleness")
+    
+    async def get_latency_stats(self, reset: bool = False) -> Dict[str, Optional[Dict[str, Any]]]:
+        return await self._call_async("get_latency_stats", reset)
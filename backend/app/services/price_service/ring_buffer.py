@@ -0,0 +1,126 @@
+"""
+按列存儲的鏡像環形緩衝區
+
+以預分配的NumPy數組按列存儲最近N條記錄，記憶體佔用固定。每條記錄同時寫入各列的兩個鏡像位置，
+任意不超過容量的最近區間在內存中都是連續的，讀取最近N條或某個時間窗口時直接返回數組視圖，
+不需要複製或創建逐條的Python對象。
+
+成交記錄（TradeRingBuffer）和價格歷史（PriceRingBuffer）都基於此實現，子類只需要定義列。
+"""
+
+from typing import Any, Tuple, Type
+
+import numpy as np
+
+
+class MirroredRingBuffer:
+    """
+    按列存儲的鏡像環形緩衝區
+    
+    子類定義 view_type（列視圖的NamedTuple）和 dtypes（各列的數據類型，順序與視圖的欄位相同），
+    第一列必須是按寫入順序遞增的時間戳（毫秒），用於按時間窗口查找。
+    
+    返回的視圖直接引用緩衝區內存，之後寫入超過容量數量的記錄後其內容會被覆蓋，
+    需要長期保存時請自行複製。
+    """
+    
+    # 列視圖類型
+    view_type: Type[Tuple[np.ndarray, ...]] = tuple
+    # 各列的數據類型
+    dtypes: Tuple[Any, ...] = ()
+    
+    def __init__(self, capacity: int):
+        """
+        初始化環形緩衝區
+        
+        Args:
+            capacity: 保留的記錄數量
+        """
+        if capacity <= 0:
+            raise ValueError("capacity 必須大於0")
+        
+        self.capacity = capacity
+        
+        # 每列長度為兩倍容量，第i條記錄同時寫入位置 i 和 i+capacity
+        self._columns = tuple(np.zeros(capacity * 2, dtype=dtype) for dtype in self.dtypes)
+        self._timestamps = self._columns[0]
+        
+        # 下一條記錄的寫入位置
+        self._head = 0
+        
+        # 已寫入的記錄總數
+        self.total = 0
+    
+    def __len__(self) -> int:
+        return min(self.total, self.capacity)
+    
+    @property
+    def nbytes(self) -> int:
+        """緩衝區佔用的記憶體（字節）"""
+        return sum(column.nbytes for column in self._columns)
+    
+    def clear(self) -> None:
+        """清空緩衝區"""
+        self._head = 0
+        self.total = 0
+    
+    def _advance(self) -> int:
+        """佔用下一個寫入位置，返回該位置（鏡像位置為 位置+capacity）"""
+        head = self._head
+        self._head = head + 1 if head + 1 < self.capacity else 0
+        self.total += 1
+        return head
+    
+    def append(self, *values: Any) -> None:
+        """
+        寫入一條記錄（子類在每個tick的路徑上按列展開覆蓋此方法，省去逐列循環的開銷）
+        
+        Args:
+            *values: 各列的值，順序與 dtypes 相同
+        """
+        head = self._advance()
+        mirror = head + self.capacity
+        for column, value in zip(self._columns, values):
+            column[head] = column[mirror] = value
+    
+    def _view(self, start: int, stop: int) -> Any:
+        """返回鏡像數組 [start, stop) 區間的只讀視圖"""
+        columns = []
+        for column in self._columns:
+            view = column[start:stop]
+            view.flags.writeable = False
+            columns.append(view)
+        return self.view_type(*columns)
+    
+    def last(self, n: int) -> Any:
+        """
+        獲取最近N條記錄
+        
+        Args:
+            n: 記錄數量，超過已保留數量時返回全部
+        
+        Returns:
+            列視圖（view_type）
+        """
+        n = max(0, min(n, len(self)))
+        # 寫入位置之前的n條在鏡像數組中連續存放於 [head+capacity-n, head+capacity)
+        stop = self._head + self.capacity
+        return self._view(stop - n, stop)
+    
+    def window(self, start_ms: int, end_ms: int) -> Any:
+        """
+        獲取時間窗口內的記錄
+        
+        Args:
+            start_ms: 開始時間（毫秒，包含）
+            end_ms: 結束時間（毫秒，包含）
+        
+        Returns:
+            列視圖（view_type）
+        """
+        stop = self._head + self.capacity
+        begin = stop - len(self)
+        timestamps = self._timestamps[begin:stop]
+        left = int(np.searchsorted(timestamps, start_ms, side="left"))
+        right = int(np.searchsorted(timestamps, end_ms, side="right"))
+        return self._view(begin + left, begin + max(left, right))
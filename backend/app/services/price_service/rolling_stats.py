@@ -0,0 +1,210 @@
+"""
+滾動統計
+
+為每個(交易所, 交易對)增量維護多個窗口（以tick數計）的統計量，每個tick的成本固定，與窗口長度無關：
+- EMA：價格的指數移動平均，平滑係數 2 / (窗口 + 1)
+- 波動率：最近N個對數收益率的樣本標準差，用滑動窗口的 Welford 算法更新（加入最新收益率、移除最舊的一個）
+- z分數：最新收益率相對於窗口內均值的標準差倍數
+
+每個(交易所, 交易對)分配一個整數槽位，所有狀態按槽位存放在連續的 array.array 中（結構數組），
+槽位不足時按兩倍擴容，取消訂閱後槽位回收重用。收益率環形緩衝區的長度等於最長的窗口。
+每個tick只讀寫單個元素，array.array 直接返回Python浮點數，比NumPy的標量索引快約一倍。
+"""
+
+import math
+from array import array
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+
+class RollingStats:
+    """
+    按槽位存放的滾動統計量
+    """
+    
+    def __init__(self, windows: Iterable[int] = (20, 100, 500), capacity: int = 256):
+        """
+        初始化滾動統計
+        
+        Args:
+            windows: 統計窗口（tick數），每個至少為2，為空表示停用
+            capacity: 初始槽位數量
+        """
+        windows = sorted({int(window) for window in windows})
+        if windows and windows[0] < 2:
+            raise ValueError("統計窗口至少為2個tick")
+        
+        self.windows: Tuple[int, ...] = tuple(windows)
+        self._alphas = tuple(2.0 / (window + 1) for window in windows)
+        # 每個tick遍歷的(窗口序號, 平滑係數, 窗口)
+        self._params = tuple(zip(range(len(windows)), self._alphas, windows))
+        # 收益率環形緩衝區長度
+        self._depth = windows[-1] if windows else 1
+        
+        # {("binance", "BTC/USDT"): 槽位}
+        self._slots: Dict[Tuple[str, str], int] = {}
+        self._free: List[int] = []
+        
+        self.capacity = 0
+        self._allocate(max(1, capacity))
+    
+    def _allocate(self, capacity: int) -> None:
+        """分配（或擴容到）指定數量的槽位，保留現有數據"""
+        added = capacity - self.capacity
+        count = len(self.windows)
+        if not self.capacity:
+            # 最新價格
+            self._last = array("d")
+            # 已記錄的收益率數量
+            self._count = array("q")
+            # 每個窗口的EMA、收益率均值和離差平方和，槽位 s 的第 i 個窗口位於 s × 窗口數 + i
+            self._ema = array("d")
+            self._mean = array("d")
+            self._m2 = array("d")
+            # 最近的對數收益率，槽位 s 的環形緩衝區從 s × 最長窗口 開始
+            self._returns = array("d")
+        for values, width in ((self._last, 1), (self._count, 1), (self._ema, count), (self._mean, count),
+                              (self._m2, count), (self._returns, self._depth)):
+            values.frombytes(bytes(added * width * values.itemsize))
+        self._free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+    
+    def __len__(self) -> int:
+        return len(self._slots)
+    
+    @property
+    def nbytes(self) -> int:
+        """所有數組佔用的記憶體（字節）"""
+        return sum(len(values) * values.itemsize
+                   for values in (self._last, self._count, self._ema, self._mean, self._m2, self._returns))
+    
+    def _assign(self, key: Tuple[str, str], price: float) -> None:
+        """為新的(交易所, 交易對)分配槽位並以第一個價格初始化"""
+        if not self._free:
+            self._allocate(self.capacity * 2)
+        slot = self._free.pop()
+        self._slots[key] = slot
+        self._last[slot] = price
+        self._count[slot] = 0
+        base = slot * len(self.windows)
+        for index in range(base, base + len(self.windows)):
+            self._ema[index] = price
+            self._mean[index] = 0.0
+            self._m2[index] = 0.0
+    
+    def update(self, exchange_id: str, symbol: str, price: float) -> None:
+        """
+        用最新價格更新統計量（每個tick調用）
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            price: 最新價格
+        """
+        if not self.windows:
+            return
+        
+        slot = self._slots.get((exchange_id, symbol))
+        if slot is None:
+            self._assign((exchange_id, symbol), price)
+            return
+        
+        previous = self._last[slot]
+        self._last[slot] = price
+        ema = self._ema
+        mean = self._mean
+        m2 = self._m2
+        base = slot * len(self.windows)
+        
+        if price <= 0 or previous <= 0:
+            for index, alpha in enumerate(self._alphas, base):
+                ema[index] += alpha * (price - ema[index])
+            return
+        
+        ret = math.log(price / previous)
+        n = self._count[slot]
+        returns = self._returns
+        depth = self._depth
+        ring = slot * depth
+        for index, alpha, window in self._params:
+            index += base
+            ema[index] += alpha * (price - ema[index])
+            
+            mu = mean[index]
+            if n < window:
+                # 窗口未滿：標準 Welford 加入
+                delta = ret - mu
+                new_mu = mu + delta / (n + 1)
+                m2[index] += delta * (ret - new_mu)
+            else:
+                # 窗口已滿：以最新收益率替換窗口中最舊的一個
+                oldest = returns[ring + (n - window) % depth]
+                new_mu = mu + (ret - oldest) / window
+                m2[index] += (ret - oldest) * (ret - new_mu + oldest - mu)
+            mean[index] = new_mu
+        
+        returns[ring + n % depth] = ret
+        self._count[slot] = n + 1
+    
+    def get(self, exchange_id: str, symbol: str) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        獲取(交易所, 交易對)的統計量
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        
+        Returns:
+            按窗口分組的統計量，例如 {"20": {"ema": 50001.2, "mean": 0.00001, "volatility": 0.0003,
+            "zscore": 1.4, "count": 20}}，沒有數據時返回None
+        """
+        slot = self._slots.get((exchange_id, symbol))
+        if slot is None:
+            return None
+        
+        n = self._count[slot]
+        latest = self._returns[slot * self._depth + (n - 1) % self._depth] if n else 0.0
+        base = slot * len(self.windows)
+        stats = {}
+        for index, window in enumerate(self.windows):
+            count = min(n, window)
+            mean = self._mean[base + index]
+            volatility = math.sqrt(max(self._m2[base + index], 0.0) / (count - 1)) if count > 1 else 0.0
+            stats[str(window)] = {
+                "ema": self._ema[base + index],
+                "mean": mean,
+                "volatility": volatility,
+                "zscore": (latest - mean) / volatility if volatility > 0 else 0.0,
+                "count": count
+            }
+        return stats
+    
+    def remove(self, exchange_id: str, symbol: str) -> None:
+        """
+        釋放(交易所, 交易對)的槽位
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        """
+        slot = self._slots.pop((exchange_id, symbol), None)
+        if slot is not None:
+            self._free.append(slot)
+    
+    def clear(self) -> None:
+        """釋放所有槽位"""
+        self._slots.clear()
+        self._free = list(range(self.capacity - 1, -1, -1))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取滾動統計的統計信息
+        
+        Returns:
+            統計信息，例如 {"windows": [20, 100, 500], "slots": 120, "capacity": 256, "bytes": 1100000}
+        """
+        return {
+            "windows": list(self.windows),
+            "slots": len(self._slots),
+            "capacity": self.capacity,
+            "bytes": self.nbytes
+        }
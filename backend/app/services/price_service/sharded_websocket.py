@@ -0,0 +1,574 @@
+"""
+分片WebSocket連接組
+
+將大量交易對分散到多個WebSocket連接上，對外提供與單個WebSocket客戶端相同的接口。
+每個連接的交易對數量受上限控制，取消訂閱後會自動合併負載較輕的連接。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Any, Set, Callable
+
+from app.services.price_service.trade_buffer import TradeRingBuffer
+from app.services.price_service.websocket_base import WebSocketBase, WebSocketState
+
+logger = logging.getLogger(__name__)
+
+class ShardedWebSocketGroup:
+    """
+    分片WebSocket連接組，在同一個連接鍵下管理多個交易所WebSocket連接（分片）。
+    """
+    
+    def __init__(self,
+                 exchange_name: str,
+                 connection_factory: Callable[[], WebSocketBase],
+                 max_symbols_per_connection: int = 200):
+        """
+        初始化分片連接組
+        
+        Args:
+            exchange_name: 交易所名稱
+            connection_factory: 創建單個WebSocket連接的工廠函數
+            max_symbols_per_connection: 每個連接可訂閱的交易對數量上限
+        """
+        if max_symbols_per_connection <= 0:
+            raise ValueError("max_symbols_per_connection 必須大於0")
+        
+        self.exchange_name = exchange_name
+        self.connection_factory = connection_factory
+        self.max_symbols_per_connection = max_symbols_per_connection
+        
+        # 分片連接列表
+        self.shards: List[WebSocketBase] = []
+        
+        # 交易對所在的分片 {"BTC/USDT": shard}
+        self.symbol_shards: Dict[str, WebSocketBase] = {}
+        
+        # 訂單簿訂閱所在的分片 {"BTC/USDT": shard}
+        self.depth_shards: Dict[str, WebSocketBase] = {}
+        
+        # 成交數據訂閱所在的分片 {"BTC/USDT": shard}
+        self.trade_shards: Dict[str, WebSocketBase] = {}
+        
+        # 價格更新回調函數
+        self.price_callbacks: List[Callable[[str, float], None]] = []
+        
+        # 串行化分片的增減與重新分配
+        self._lock = asyncio.Lock()
+    
+    @property
+    def subscribed_symbols(self) -> Set[str]:
+        """所有分片已訂閱的交易對集合"""
+        return set(self.symbol_shards)
+    
+    @property
+    def state(self) -> WebSocketState:
+        """連接組狀態，只有所有分片都已連接時才視為已連接"""
+        if not self.shards:
+            return WebSocketState.DISCONNECTED
+        
+        for shard in self.shards:
+            if shard.state != WebSocketState.CONNECTED:
+                return shard.state
+        return WebSocketState.CONNECTED
+    
+    def _create_shard(self) -> WebSocketBase:
+        """創建新的分片連接並轉發其價格更新"""
+        shard = self.connection_factory()
+        shard.add_price_callback(self._notify_price_update)
+        self.shards.append(shard)
+        logger.info(f"{self.exchange_name}新增分片連接，目前共{len(self.shards)}個分片")
+        return shard
+    
+    def _shard_load(self, shard: WebSocketBase) -> int:
+        """分片當前的交易對數量"""
+        return len(shard.subscribed_symbols)
+    
+    def _has_streams(self, shard: WebSocketBase) -> bool:
+        """分片是否訂閱了訂單簿或成交數據（這些數據的本地狀態保存在分片上）"""
+        return bool(shard.depth_symbols or shard.trade_symbols)
+    
+    async def connect(self) -> bool:
+        """
+        建立所有分片的WebSocket連接，至少保持一個分片
+        
+        Returns:
+            所有分片是否連接成功
+        """
+        async with self._lock:
+            if not self.shards:
+                self._create_shard()
+            results = await asyncio.gather(*(shard.connect() for shard in self.shards))
+        return all(results)
+    
+    async def disconnect(self) -> None:
+        """關閉所有分片的WebSocket連接"""
+        async with self._lock:
+            await asyncio.gather(*(shard.disconnect() for shard in self.shards),
+                                 return_exceptions=True)
+            self.shards.clear()
+            self.symbol_shards.clear()
+            self.depth_shards.clear()
+            self.trade_shards.clear()
+    
+    def _assign_shards(self, symbols: List[str]) -> Dict[WebSocketBase, List[str]]:
+        """
+        為新交易對分配分片，優先填入負載最輕的分片，容量不足時創建新分片
+        
+        Args:
+            symbols: 尚未訂閱的交易對列表
+        
+        Returns:
+            分片和分配給它的交易對 {shard: [symbol, ...]}
+        """
+        assignments: Dict[WebSocketBase, List[str]] = {}
+        loads = {shard: self._shard_load(shard) for shard in self.shards}
+        
+        for symbol in symbols:
+            shard = min(loads, key=loads.get) if loads else None
+            if shard is None or loads[shard] >= self.max_symbols_per_connection:
+                shard = self._create_shard()
+                loads[shard] = 0
+            
+            assignments.setdefault(shard, []).append(symbol)
+            loads[shard] += 1
+        
+        return assignments
+    
+    async def subscribe_symbols(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對，自動分散到各個分片
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+        
+        Returns:
+            訂閱是否全部成功
+        """
+        async with self._lock:
+            new_symbols = [s for s in dict.fromkeys(symbols) if s not in self.symbol_shards]
+            if not new_symbols:
+                return True
+            
+            assignments = self._assign_shards(new_symbols)
+            shards = list(assignments)
+            results = await asyncio.gather(
+                *(shard.subscribe_symbols(assignments[shard]) for shard in shards),
+                return_exceptions=True
+            )
+            
+            all_success = True
+            for shard, result in zip(shards, results):
+                if isinstance(result, Exception):
+                    logger.error(f"{self.exchange_name}分片訂閱失敗: {result}")
+                if result is not True:
+                    all_success = False
+                
+                # 以分片實際訂閱成功的交易對為準
+                for symbol in assignments[shard]:
+                    if symbol in shard.subscribed_symbols:
+                        self.symbol_shards[symbol] = shard
+            
+            await self._close_empty_shards()
+            return all_success
+    
+    async def unsubscribe_symbols(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對，並在負載下降後重新平衡分片
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+        
+        Returns:
+            取消訂閱是否全部成功
+        """
+        async with self._lock:
+            by_shard: Dict[WebSocketBase, List[str]] = {}
+            for symbol in dict.fromkeys(symbols):
+                shard = self.symbol_shards.get(symbol)
+                if shard is not None:
+                    by_shard.setdefault(shard, []).append(symbol)
+            
+            if not by_shard:
+                return True
+            
+            shards = list(by_shard)
+            results = await asyncio.gather(
+                *(shard.unsubscribe_symbols(by_shard[shard]) for shard in shards),
+                return_exceptions=True
+            )
+            
+            all_success = True
+            for shard, result in zip(shards, results):
+                if isinstance(result, Exception):
+                    logger.error(f"{self.exchange_name}分片取消訂閱失敗: {result}")
+                if result is not True:
+                    all_success = False
+                
+                for symbol in by_shard[shard]:
+                    if symbol not in shard.subscribed_symbols:
+                        self.symbol_shards.pop(symbol, None)
+            
+            await self._rebalance()
+            return all_success
+    
+    async def resubscribe_symbols(self, symbols: List[str]) -> bool:
+        """
+        在交易對所在的分片上重新訂閱停止更新的交易對
+        
+        重新訂閱失敗的交易對仍保留在原分片的映射中，由調用者稍後重試。
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+        
+        Returns:
+            重新訂閱是否全部成功
+        """
+        async with self._lock:
+            by_shard: Dict[WebSocketBase, List[str]] = {}
+            for symbol in dict.fromkeys(symbols):
+                shard = self.symbol_shards.get(symbol)
+                if shard is not None:
+                    by_shard.setdefault(shard, []).append(symbol)
+            
+            if not by_shard:
+                return True
+            
+            shards = list(by_shard)
+            results = await asyncio.gather(
+                *(shard.resubscribe_symbols(by_shard[shard]) for shard in shards),
+                return_exceptions=True
+            )
+            
+            all_success = True
+            for shard, result in zip(shards, results):
+                if isinstance(result, Exception):
+                    logger.error(f"{self.exchange_name}分片重新訂閱失敗: {result}")
+                if result is not True:
+                    all_success = False
+            return all_success
+    
+    async def recycle_shard(self, shard: WebSocketBase) -> None:
+        """
+        回收重建分片的連接
+        
+        Args:
+            shard: 分片連接
+        """
+        if shard in self.shards:
+            await shard.recycle()
+    
+    async def _rebalance(self) -> None:
+        """
+        重新平衡分片：當其他分片的剩餘容量足以容納負載最輕的分片時，
+        將其交易對遷移過去（先訂閱後取消），然後關閉該分片。
+        """
+        while len(self.shards) > 1:
+            # 訂閱了訂單簿或成交數據的分片不參與合併，避免訂單簿重新同步和成交記錄丟失
+            candidates = [s for s in self.shards if not self._has_streams(s)]
+            if not candidates:
+                break
+            shard = min(candidates, key=self._shard_load)
+            symbols = list(shard.subscribed_symbols)
+            others = [s for s in self.shards if s is not shard]
+            free = sum(self.max_symbols_per_connection - self._shard_load(s) for s in others)
+            if len(symbols) > free:
+                break
+            
+            # 按剩餘容量將交易對分配到其他分片
+            offset = 0
+            for target in sorted(others, key=self._shard_load):
+                capacity = self.max_symbols_per_connection - self._shard_load(target)
+                batch = symbols[offset:offset + capacity]
+                offset += len(batch)
+                if not batch:
+                    continue
+                
+                await target.subscribe_symbols(batch)
+                for symbol in batch:
+                    if symbol in target.subscribed_symbols:
+                        self.symbol_shards[symbol] = target
+            
+            remaining = [s for s in symbols if self.symbol_shards.get(s) is shard]
+            if remaining:
+                # 遷移未完成時保留原分片，只取消已遷移的交易對
+                logger.warning(f"{self.exchange_name}分片遷移未完成，保留{len(remaining)}個交易對在原分片")
+                await shard.unsubscribe_symbols([s for s in symbols if s not in remaining])
+                break
+            
+            logger.info(f"{self.exchange_name}合併分片: 遷移{len(symbols)}個交易對")
+            await self._remove_shard(shard)
+        
+        await self._close_empty_shards()
+    
+    async def _close_empty_shards(self) -> None:
+        """關閉沒有任何交易對的多餘分片，保留至少一個分片"""
+        for shard in list(self.shards):
+            if len(self.shards) <= 1:
+                break
+            if not shard.subscribed_symbols and not self._has_streams(shard):
+                await self._remove_shard(shard)
+    
+    async def _remove_shard(self, shard: WebSocketBase) -> None:
+        """斷開並移除分片"""
+        self.shards.remove(shard)
+        shard.remove_price_callback(self._notify_price_update)
+        try:
+            await shard.disconnect()
+        except Exception as e:
+            logger.error(f"關閉{self.exchange_name}分片連接失敗: {e}")
+        logger.info(f"{self.exchange_name}移除分片連接，目前共{len(self.shards)}個分片")
+    
+    async def _subscribe_stream(self,
+                                symbols: List[str],
+                                routes: Dict[str, WebSocketBase],
+                                method: str,
+                                symbols_attr: str) -> bool:
+        """
+        訂閱交易對的附加數據（訂單簿、成交等），優先使用該交易對ticker所在的分片
+        
+        Args:
+            symbols: 交易對列表
+            routes: 該數據的交易對到分片映射，訂閱成功後會更新
+            method: 分片的訂閱方法名，例如 "subscribe_depth"
+            symbols_attr: 分片記錄已訂閱交易對的屬性名，例如 "depth_symbols"
+            
+        Returns:
+            訂閱是否全部成功
+        """
+        async with self._lock:
+            by_shard: Dict[WebSocketBase, List[str]] = {}
+            for symbol in dict.fromkeys(symbols):
+                if symbol in routes:
+                    continue
+                shard = self.symbol_shards.get(symbol)
+                if shard is None:
+                    if not self.shards:
+                        self._create_shard()
+                    shard = min(self.shards, key=self._shard_load)
+                by_shard.setdefault(shard, []).append(symbol)
+            
+            if not by_shard:
+                return True
+            
+            shards = list(by_shard)
+            results = await asyncio.gather(
+                *(getattr(shard, method)(by_shard[shard]) for shard in shards),
+                return_exceptions=True
+            )
+            
+            all_success = True
+            for shard, result in zip(shards, results):
+                if isinstance(result, Exception):
+                    logger.error(f"{self.exchange_name}分片{method}失敗: {result}")
+                if result is not True:
+                    all_success = False
+                
+                for symbol in by_shard[shard]:
+                    if symbol in getattr(shard, symbols_attr):
+                        routes[symbol] = shard
+            
+            return all_success
+    
+    async def _unsubscribe_stream(self,
+                                  symbols: List[str],
+                                  routes: Dict[str, WebSocketBase],
+                                  method: str,
+                                  symbols_attr: str) -> bool:
+        """
+        取消訂閱交易對的附加數據
+        
+        Args:
+            symbols: 交易對列表
+            routes: 該數據的交易對到分片映射，取消成功後會更新
+            method: 分片的取消訂閱方法名，例如 "unsubscribe_depth"
+            symbols_attr: 分片記錄已訂閱交易對的屬性名，例如 "depth_symbols"
+            
+        Returns:
+            取消訂閱是否全部成功
+        """
+        async with self._lock:
+            by_shard: Dict[WebSocketBase, List[str]] = {}
+            for symbol in dict.fromkeys(symbols):
+                shard = routes.get(symbol)
+                if shard is not None:
+                    by_shard.setdefault(shard, []).append(symbol)
+            
+            all_success = True
+            for shard, shard_symbols in by_shard.items():
+                if not await getattr(shard, method)(shard_symbols):
+                    all_success = False
+                for symbol in shard_symbols:
+                    if symbol not in getattr(shard, symbols_attr):
+                        routes.pop(symbol, None)
+            
+            await self._rebalance()
+            return all_success
+    
+    async def subscribe_depth(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對的訂單簿
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            訂閱是否全部成功
+        """
+        return await self._subscribe_stream(symbols, self.depth_shards, "subscribe_depth", "depth_symbols")
+    
+    async def unsubscribe_depth(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對的訂單簿
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            取消訂閱是否全部成功
+        """
+        return await self._unsubscribe_stream(symbols, self.depth_shards, "unsubscribe_depth", "depth_symbols")
+    
+    async def subscribe_trades(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對的成交數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            訂閱是否全部成功
+        """
+        return await self._subscribe_stream(symbols, self.trade_shards, "subscribe_trades", "trade_symbols")
+    
+    async def unsubscribe_trades(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對的成交數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            取消訂閱是否全部成功
+        """
+        return await self._unsubscribe_stream(symbols, self.trade_shards, "unsubscribe_trades", "trade_symbols")
+    
+    def get_trade_buffer(self, symbol: str) -> Optional[TradeRingBuffer]:
+        """
+        獲取交易對的成交記錄緩衝區
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            成交記錄緩衝區，如果沒有訂閱則返回None
+        """
+        shard = self.trade_shards.get(symbol)
+        return shard.get_trade_buffer(symbol) if shard is not None else None
+    
+    def get_order_book(self, symbol: str) -> Optional[Any]:
+        """
+        獲取交易對的本地訂單簿
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            訂單簿，如果沒有則返回None
+        """
+        shard = self.depth_shards.get(symbol)
+        return shard.get_order_book(symbol) if shard is not None else None
+    
+    def add_price_callback(self, callback: Callable[[str, float], None]) -> None:
+        """
+        添加價格更新回調函數
+        
+        Args:
+            callback: 回調函數，參數為(symbol, price)
+        """
+        self.price_callbacks.append(callback)
+    
+    def remove_price_callback(self, callback: Callable[[str, float], None]) -> None:
+        """
+        移除價格更新回調函數
+        
+        Args:
+            callback: 要移除的回調函數
+        """
+        if callback in self.price_callbacks:
+            self.price_callbacks.remove(callback)
+    
+    def _notify_price_update(self, symbol: str, price: float) -> None:
+        """
+        將分片的價格更新轉發給所有回調函數
+        
+        Args:
+            symbol: 交易對
+            price: 更新的價格
+        """
+        for callback in self.price_callbacks:
+            try:
+                callback(symbol, price)
+            except Exception as e:
+                logger.error(f"執行價格回調函數時出錯: {e}")
+    
+    def get_latest_price(self, symbol: str) -> Optional[float]:
+        """
+        獲取交易對的最新價格
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+        
+        Returns:
+            最新價格，如果沒有則返回None
+        """
+        shard = self.symbol_shards.get(symbol)
+        return shard.get_latest_price(symbol) if shard is not None else None
+    
+    def get_shard_load(self) -> List[Dict[str, Any]]:
+        """
+        獲取各分片的負載情況
+        
+        Returns:
+            分片負載列表，例如 [{"shard": 0, "symbols": 150, "capacity": 200, "state": "CONNECTED", "queue": {...}, "wire": {...}}]
+        """
+        return [
+            {
+                "shard": index,
+                "symbols": self._shard_load(shard),
+                "capacity": self.max_symbols_per_connection,
+                "state": shard.state.name,
+                "queue": shard.get_queue_stats(),
+                "wire": shard.get_wire_stats()
+            }
+            for index, shard in enumerate(self.shards)
+        ]
+    
+    def get_staleness(self, now: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """
+        獲取各交易對距離最近一次價格更新的秒數
+        
+        Args:
+            now: 當前時間（time.monotonic()），None表示現在
+        
+        Returns:
+            交易對的停止更新時間，例如 {"BTC/USDT": 0.4, "ETH/USDT": None}，None表示訂閱後還沒有收到更新
+        """
+        now = time.monotonic() if now is None else now
+        staleness = {}
+        for symbol, shard in self.symbol_shards.items():
+            last_update = shard.last_update.get(symbol)
+            staleness[symbol] = round(now - last_update, 3) if last_update is not None else None
+        return staleness
+    
+    def get_endpoint_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        獲取端點池狀態（所有分片共享同一個端點池）
+        
+        Returns:
+            端點延遲排序和熔斷器狀態，還沒有分片時返回None
+        """
+        if not self.shards:
+            return None
+        return self.shards[0].endpoints.to_dict()
@@ -0,0 +1,344 @@
+"""
+共享內存價格表
+
+行情接入進程將最新價格寫入 multiprocessing.shared_memory 中的固定槽位表，任意數量的API進程
+直接映射同一塊內存讀取，不需要加鎖。每個(交易所, 交易對)佔用一個槽位，槽位分配後不會移動。
+
+只允許一個寫入進程。每個槽位使用序號鎖（seqlock）：寫入前後各將序號加一，寫入期間序號為奇數；
+讀取時前後兩次讀到相同的偶數序號才算讀到完整的數據，否則重試。
+
+讀取進程查詢交易對價格時在槽位上記錄讀取時間（touch），行情接入進程據此按最久未讀取的順序淘汰訂閱。
+讀取時間只是提示：多個讀取進程同時寫入同一槽位時保留任意一個即可，不使用序號鎖。
+
+內存佈局（小端序，均為8字節對齊）:
+    表頭: int64[8]，依次為 MAGIC、版本、容量、已分配槽位數、快照恢復時間
+          （時間不晚於快照恢復時間的價格是從快照恢復、尚未被新tick更新的舊價格，0表示沒有恢復）
+          寫入進程關閉或被新的寫入進程取代時先將 MAGIC 清零再刪除共享內存，
+          仍映射舊表的讀取進程據此（retired）重新映射新表，而不是繼續返回舊價格
+    序號: uint64[容量]
+    價格: float64[容量]
+    時間: int64[容量]（寫入時間，Unix毫秒，0表示沒有價格）
+    讀取: int64[容量]（最近被讀取進程查詢的時間，Unix毫秒，0表示沒有讀取）
+    鍵:   bytes64[容量]（"交易所|交易對"，UTF-8）
+"""
+
+import logging
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0x50524943455442  # "PRICETB"
+VERSION = 2
+
+_HEADER_FIELDS = 8
+_HEADER_SIZE = _HEADER_FIELDS * 8
+_KEY_SIZE = 64
+
+# 讀取時遇到正在寫入的槽位的重試次數
+_READ_RETRIES = 100
+
+# 價格記錄：(價格, 寫入時間(毫秒), 序號)
+PriceEntry = Tuple[float, int, int]
+
+
+class SharedPriceTable:
+    """
+    共享內存價格表，通過 create（寫入進程）或 attach（讀取進程）創建
+    """
+    
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        """
+        映射共享內存中的價格表
+        
+        Args:
+            shm: 共享內存
+            owner: 是否為創建者（寫入進程），關閉時負責刪除共享內存
+        """
+        self.shm = shm
+        self.owner = owner
+        
+        buffer = shm.buf
+        self.header = np.ndarray((_HEADER_FIELDS,), dtype="<i8", buffer=buffer)
+        if self.header[0] != MAGIC or self.header[1] != VERSION:
+            raise ValueError(f"共享內存 {shm.name} 不是有效的價格表")
+        
+        self.capacity = int(self.header[2])
+        capacity = self.capacity
+        self.seqs = np.ndarray((capacity,), dtype="<u8", buffer=buffer, offset=_HEADER_SIZE)
+        self.prices = np.ndarray((capacity,), dtype="<f8", buffer=buffer, offset=_HEADER_SIZE + capacity * 8)
+        self.timestamps = np.ndarray((capacity,), dtype="<i8", buffer=buffer, offset=_HEADER_SIZE + capacity * 16)
+        self.read_at = np.ndarray((capacity,), dtype="<i8", buffer=buffer, offset=_HEADER_SIZE + capacity * 24)
+        self.keys = np.ndarray((capacity,), dtype=f"S{_KEY_SIZE}", buffer=buffer, offset=_HEADER_SIZE + capacity * 32)
+        
+        # 鍵到槽位的索引，讀取進程按已分配槽位數增量更新
+        self._slots: Dict[Tuple[str, str], int] = {}
+        self._by_symbol: Dict[str, Dict[str, int]] = {}
+        self._indexed = 0
+        self._refresh_index()
+    
+    @staticmethod
+    def _size(capacity: int) -> int:
+        """指定容量所需的共享內存大小"""
+        return _HEADER_SIZE + capacity * (32 + _KEY_SIZE)
+    
+    @classmethod
+    def create(cls, name: str, capacity: int = 4096) -> "SharedPriceTable":
+        """
+        創建價格表（寫入進程），同名的舊共享內存（例如上次異常退出殘留的）會被刪除
+        
+        Args:
+            name: 共享內存名稱
+            capacity: 槽位數量
+        
+        Returns:
+            價格表
+        """
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            pass
+        else:
+            logger.warning(f"刪除殘留的共享內存價格表: {name}")
+            if stale.size >= _HEADER_SIZE:
+                # 通知仍映射舊表的讀取進程
+                header = np.ndarray((_HEADER_FIELDS,), dtype="<i8", buffer=stale.buf)
+                header[0] = 0
+                del header
+            stale.close()
+            stale.unlink()
+        
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls._size(capacity))
+        header = np.ndarray((_HEADER_FIELDS,), dtype="<i8", buffer=shm.buf)
+        header[:] = 0
+        header[2] = capacity
+        header[1] = VERSION
+        header[0] = MAGIC
+        del header
+        return cls(shm, owner=True)
+    
+    @classmethod
+    def attach(cls, name: str) -> "SharedPriceTable":
+        """
+        映射已存在的價格表（讀取進程）
+        
+        Args:
+            name: 共享內存名稱
+        
+        Returns:
+            價格表
+        
+        Raises:
+            FileNotFoundError: 價格表不存在（行情接入進程未啟動）
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        # 讀取進程不擁有共享內存，避免 resource_tracker 在進程退出時將其刪除
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+    
+    def close(self) -> None:
+        """解除映射，寫入進程同時刪除共享內存"""
+        self._slots.clear()
+        self._by_symbol.clear()
+        if self.owner:
+            self.header[0] = 0
+        del self.header, self.seqs, self.prices, self.timestamps, self.read_at, self.keys
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+    
+    def _refresh_index(self) -> None:
+        """將新分配的槽位加入索引"""
+        count = int(self.header[3])
+        for slot in range(self._indexed, count):
+            exchange_id, symbol = self.keys[slot].decode("utf-8").split("|", 1)
+            self._slots[(exchange_id, symbol)] = slot
+            self._by_symbol.setdefault(symbol, {})[exchange_id] = slot
+        self._indexed = count
+    
+    # 寫入（只在行情接入進程中調用）
+    
+    def _allocate(self, exchange_id: str, symbol: str) -> Optional[int]:
+        """為(交易所, 交易對)分配槽位，已滿時返回None"""
+        key = (exchange_id, symbol)
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+        
+        slot = int(self.header[3])
+        if slot >= self.capacity:
+            logger.error(f"共享內存價格表已滿（{self.capacity}個槽位），無法寫入 {exchange_id} {symbol}")
+            return None
+        
+        encoded = f"{exchange_id}|{symbol}".encode("utf-8")
+        if len(encoded) > _KEY_SIZE:
+            logger.error(f"交易對名稱過長，無法寫入共享內存價格表: {symbol}")
+            return None
+        
+        self.keys[slot] = encoded
+        # 鍵寫入完成後才增加槽位數，讀取進程看到新槽位時鍵一定是完整的
+        self.header[3] = slot + 1
+        self._slots[key] = slot
+        self._by_symbol.setdefault(symbol, {})[exchange_id] = slot
+        self._indexed = slot + 1
+        return slot
+    
+    def write(self, exchange_id: str, symbol: str, price: float, timestamp_ms: Optional[int] = None) -> None:
+        """
+        寫入最新價格
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            price: 價格
+            timestamp_ms: 時間（Unix毫秒），None表示現在
+        """
+        slot = self._slots.get((exchange_id, symbol))
+        if slot is None:
+            slot = self._allocate(exchange_id, symbol)
+            if slot is None:
+                return
+        
+        seqs = self.seqs
+        seqs[slot] += 1
+        self.prices[slot] = price
+        self.timestamps[slot] = timestamp_ms if timestamp_ms is not None else time.time_ns() // 1000000
+        seqs[slot] += 1
+    
+    def remove(self, exchange_id: str, symbol: str) -> None:
+        """
+        清除交易對的價格（取消訂閱後），槽位保留給之後重新訂閱時使用
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        """
+        slot = self._slots.get((exchange_id, symbol))
+        if slot is None:
+            return
+        self.seqs[slot] += 1
+        self.prices[slot] = np.nan
+        self.timestamps[slot] = 0
+        self.seqs[slot] += 1
+        self.read_at[slot] = 0
+    
+    def mark_restored(self, saved_at_ms: int) -> None:
+        """
+        記錄快照恢復時間，之後以不晚於該時間寫入的價格視為從快照恢復的過期價格
+        
+        Args:
+            saved_at_ms: 快照的保存時間（Unix毫秒）
+        """
+        self.header[4] = saved_at_ms
+    
+    def read_times(self) -> Dict[str, float]:
+        """
+        獲取讀取進程記錄的交易對最近讀取時間
+        
+        Returns:
+            各交易對最近被讀取的時間（Unix秒），沒有讀取記錄的交易對不包含在內，例如 {"BTC/USDT": 1700000000.5}
+        """
+        count = int(self.header[3])
+        read_at = self.read_at[:count]
+        times: Dict[str, float] = {}
+        for slot in np.flatnonzero(read_at).tolist():
+            symbol = self.keys[slot].decode("utf-8").split("|", 1)[1]
+            at = int(read_at[slot]) / 1000
+            if at > times.get(symbol, 0.0):
+                times[symbol] = at
+        return times
+    
+    # 讀取（任意進程，不加鎖）
+    
+    @property
+    def retired(self) -> bool:
+        """寫入進程是否已關閉或被取代（表中的價格不再更新，讀取進程應重新映射）"""
+        return int(self.header[0]) != MAGIC
+    
+    @property
+    def restored_at(self) -> int:
+        """快照恢復時間（Unix毫秒），0表示沒有恢復"""
+        return int(self.header[4])
+    
+    def _read_slot(self, slot: int) -> Optional[PriceEntry]:
+        """按序號鎖讀取槽位，沒有價格時返回None"""
+        seqs = self.seqs
+        for _ in range(_READ_RETRIES):
+            seq = int(seqs[slot])
+            if seq & 1:
+                continue
+            price = float(self.prices[slot])
+            timestamp = int(self.timestamps[slot])
+            if int(seqs[slot]) == seq:
+                return (price, timestamp, seq) if timestamp else None
+        return None
+    
+    def touch(self, symbol: str) -> None:
+        """
+        記錄交易對被讀取（供行情接入進程按最久未讀取的順序淘汰訂閱）
+        
+        Args:
+            symbol: 交易對
+        """
+        slots = self._by_symbol.get(symbol)
+        if slots is None:
+            self._refresh_index()
+            slots = self._by_symbol.get(symbol)
+            if slots is None:
+                return
+        now = time.time_ns() // 1000000
+        for slot in slots.values():
+            self.read_at[slot] = now
+    
+    def read(self, exchange_id: str, symbol: str) -> Optional[PriceEntry]:
+        """
+        讀取(交易所, 交易對)的最新價格
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        
+        Returns:
+            (價格, 寫入時間(毫秒), 序號)，沒有價格時返回None
+        """
+        slot = self._slots.get((exchange_id, symbol))
+        if slot is None:
+            self._refresh_index()
+            slot = self._slots.get((exchange_id, symbol))
+            if slot is None:
+                return None
+        return self._read_slot(slot)
+    
+    def read_symbol(self, symbol: str) -> Dict[str, PriceEntry]:
+        """
+        讀取交易對在所有交易所的最新價格
+        
+        Args:
+            symbol: 交易對
+        
+        Returns:
+            各交易所的價格記錄，例如 {"binance": (50000.0, 1700000000000, 42)}
+        """
+        self._refresh_index()
+        entries = {}
+        for exchange_id, slot in self._by_symbol.get(symbol, {}).items():
+            entry = self._read_slot(slot)
+            if entry is not None:
+                entries[exchange_id] = entry
+        return entries
+    
+    def items(self) -> Iterator[Tuple[str, str, PriceEntry]]:
+        """
+        遍歷所有有價格的槽位
+        
+        Returns:
+            (交易所ID, 交易對, 價格記錄) 迭代器
+        """
+        self._refresh_index()
+        for (exchange_id, symbol), slot in list(self._slots.items()):
+            entry = self._read_slot(slot)
+            if entry is not None:
+                yield exchange_id, symbol, entry
@@ -0,0 +1,224 @@
+"""
+跨交易所價差監控
+
+每個tick只重新計算該交易對在各交易所最新價格之間的價差（最高價減最低價，以及相對中間價的基點），
+並增量維護價差最大的前K個交易對：前K名保存在一個小字典中，其餘交易對放在帶延遲刪除的最大堆裡，
+始終保持「堆中有效的價差都不大於前K名中的最小值」，因此每次更新只需 O(K + log N)；
+前K名變化時重建排序後的快照，查詢時直接返回快照，為常數時間。
+"""
+
+import heapq
+import time
+from typing import Dict, List, Optional, Any, Tuple
+
+
+class SpreadMonitor:
+    """
+    跨交易所價差監控器
+    """
+    
+    def __init__(self, top_k: int = 20):
+        """
+        初始化價差監控器
+        
+        Args:
+            top_k: 保留價差最大的交易對數量
+        """
+        if top_k <= 0:
+            raise ValueError("top_k 必須大於0")
+        
+        self.top_k = top_k
+        
+        # 各交易對的最新價差 {"BTC/USDT": {"symbol": ..., "bps": 1.2, ...}}
+        self.spreads: Dict[str, Dict[str, Any]] = {}
+        
+        # 前K名 {交易對: 基點}
+        self._top: Dict[str, float] = {}
+        # 其餘交易對的最大堆（延遲刪除）：(-基點, 版本, 交易對)，版本與 _versions 不同的項已失效
+        self._rest: List[Tuple[float, int, str]] = []
+        self._versions: Dict[str, int] = {}
+        self._version = 0
+        
+        # 前K名按價差從大到小排列的快照
+        self._snapshot: List[Dict[str, Any]] = []
+        
+        # 統計
+        self.updates = 0
+    
+    def update(self, symbol: str, prices: Dict[str, float]) -> Optional[Dict[str, Any]]:
+        """
+        根據交易對在各交易所的最新價格重新計算價差
+        
+        Args:
+            symbol: 交易對
+            prices: 各交易所的最新價格，例如 {"binance": 50000.0, "okx": 50010.0}
+        
+        Returns:
+            交易對的價差，少於兩個交易所有價格時返回None
+        """
+        self.updates += 1
+        if len(prices) < 2:
+            self.remove(symbol)
+            return None
+        
+        high_exchange = low_exchange = None
+        high = low = 0.0
+        for exchange_id, price in prices.items():
+            if high_exchange is None or price > high:
+                high_exchange, high = exchange_id, price
+            if low_exchange is None or price < low:
+                low_exchange, low = exchange_id, price
+        
+        spread = high - low
+        mid = (high + low) / 2
+        bps = spread / mid * 10000 if mid > 0 else 0.0
+        entry = {
+            "symbol": symbol,
+            "high_exchange": high_exchange,
+            "high": high,
+            "low_exchange": low_exchange,
+            "low": low,
+            "spread": spread,
+            "bps": round(bps, 4),
+            "timestamp": int(time.time() * 1000)
+        }
+        self.spreads[symbol] = entry
+        self._rank(symbol, bps)
+        return entry
+    
+    def _rank(self, symbol: str, bps: float) -> None:
+        """更新交易對在前K名中的位置"""
+        top = self._top
+        if symbol in top:
+            decreased = bps < top[symbol]
+            top[symbol] = bps
+            if decreased:
+                self._refill()
+            self._rebuild_snapshot()
+            return
+        
+        if len(top) < self.top_k:
+            top[symbol] = bps
+            self._versions.pop(symbol, None)
+            self._rebuild_snapshot()
+            return
+        
+        weakest = min(top, key=top.get)
+        if bps > top[weakest]:
+            # 新的價差大於前K名的最小值，也就大於堆中所有有效的價差
+            self._push(weakest, top.pop(weakest))
+            top[symbol] = bps
+            self._versions.pop(symbol, None)
+            self._rebuild_snapshot()
+        else:
+            self._push(symbol, bps)
+    
+    def _push(self, symbol: str, bps: float) -> None:
+        """將交易對放入堆中，舊的項自動失效"""
+        self._version += 1
+        self._versions[symbol] = self._version
+        heapq.heappush(self._rest, (-bps, self._version, symbol))
+        
+        # 失效項過多時重建堆
+        if len(self._rest) > 2 * len(self._versions) + 64:
+            self._rest = [item for item in self._rest if self._versions.get(item[2]) == item[1]]
+            heapq.heapify(self._rest)
+    
+    def _peek(self) -> Optional[Tuple[float, int, str]]:
+        """返回堆中價差最大的有效項，同時丟棄堆頂的失效項"""
+        rest = self._rest
+        versions = self._versions
+        while rest:
+            item = rest[0]
+            if versions.get(item[2]) == item[1]:
+                return item
+            heapq.heappop(rest)
+        return None
+    
+    def _refill(self) -> None:
+        """前K名中的價差變小或有交易對移除後，用堆中更大的價差替換"""
+        top = self._top
+        while True:
+            best = self._peek()
+            if best is None:
+                return
+            if len(top) < self.top_k:
+                heapq.heappop(self._rest)
+                del self._versions[best[2]]
+                top[best[2]] = -best[0]
+                continue
+            
+            weakest = min(top, key=top.get)
+            if -best[0] <= top[weakest]:
+                return
+            heapq.heappop(self._rest)
+            del self._versions[best[2]]
+            self._push(weakest, top.pop(weakest))
+            top[best[2]] = -best[0]
+    
+    def _rebuild_snapshot(self) -> None:
+        """按價差從大到小重建前K名快照"""
+        spreads = self.spreads
+        self._snapshot = [spreads[symbol] for symbol in sorted(self._top, key=self._top.get, reverse=True)]
+    
+    def remove(self, symbol: str) -> None:
+        """
+        移除交易對（取消訂閱或只剩一個交易所有價格時）
+        
+        Args:
+            symbol: 交易對
+        """
+        self.spreads.pop(symbol, None)
+        self._versions.pop(symbol, None)
+        if self._top.pop(symbol, None) is not None:
+            self._refill()
+            self._rebuild_snapshot()
+    
+    def clear(self) -> None:
+        """清空所有價差"""
+        self.spreads.clear()
+        self._top.clear()
+        self._rest.clear()
+        self._versions.clear()
+        self._snapshot = []
+    
+    def get_spread(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """
+        獲取交易對的最新價差
+        
+        Args:
+            symbol: 交易對
+        
+        Returns:
+            價差，例如 {"symbol": "BTC/USDT", "high_exchange": "okx", "high": 50010.0,
+            "low_exchange": "binance", "low": 50000.0, "spread": 10.0, "bps": 2.0, "timestamp": ...}，
+            少於兩個交易所有價格時返回None
+        """
+        return self.spreads.get(symbol)
+    
+    def top(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        獲取價差（基點）最大的交易對
+        
+        Args:
+            limit: 返回數量，None表示全部K個
+        
+        Returns:
+            按價差從大到小排列的價差列表
+        """
+        snapshot = self._snapshot
+        return snapshot if limit is None or limit >= len(snapshot) else snapshot[:limit]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取價差監控的統計信息
+        
+        Returns:
+            統計信息，例如 {"symbols": 120, "top_k": 20, "updates": 10000, "heap": 150}
+        """
+        return {
+            "symbols": len(self.spreads),
+            "top_k": self.top_k,
+            "updates": self.updates,
+            "heap": len(self._rest)
+        }
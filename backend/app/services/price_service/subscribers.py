@@ -0,0 +1,278 @@
+"""
+價格訂閱者分發
+
+SubscriberIndex 按(交易所, 交易對)索引訂閱者，交易所或交易對可以是通配（None），
+每個tick只需查找四個鍵 (交易所, 交易對)、(交易所, *)、(*, 交易對)、(*, *)，
+查找結果按(交易所, 交易對)緩存，訂閱者變化時才重新計算，不再逐個檢查所有回調的過濾條件。
+
+異步訂閱者（async def 回調）各自擁有一個有界隊列和消費任務，處理緩慢時只會在自己的隊列中
+按溢出策略丟棄價格，不會阻塞行情處理，並統計隊列深度、丟棄數量和排隊延遲（lag）。
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Any, Tuple, Union
+
+from app.services.price_service.latency import LatencyHistogram
+from app.services.price_service.websocket_base import OverflowPolicy
+
+logger = logging.getLogger(__name__)
+
+# 回調函數，參數為(exchange_id, symbol, price)
+SyncPriceCallback = Callable[[str, str, float], None]
+AsyncPriceCallback = Callable[[str, str, float], Awaitable[None]]
+PriceCallback = Union[SyncPriceCallback, AsyncPriceCallback]
+
+# 索引鍵：(交易所ID或None, 交易對或None)，None表示通配
+_Key = Tuple[Optional[str], Optional[str]]
+
+_sequence = itertools.count()
+
+
+class AsyncSubscriber:
+    """
+    異步訂閱者，價格放入有界隊列後由獨立任務依次交給回調函數
+    """
+    
+    def __init__(self, callback: AsyncPriceCallback, queue_size: int = 1000,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST):
+        """
+        初始化異步訂閱者，消費任務在第一次收到價格時啟動
+        
+        Args:
+            callback: 異步回調函數，參數為(exchange_id, symbol, price)
+            queue_size: 隊列容量
+            overflow_policy: 隊列已滿時的處理策略
+        """
+        self.callback = callback
+        self.queue_size = queue_size
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        
+        # 待處理的價格：(交易所ID, 交易對, 價格, 入隊時間(time.monotonic_ns()))
+        self._queue: Deque[Tuple[str, str, float, int]] = deque()
+        self._event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        
+        # 統計
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        # 從入隊到回調開始執行的延遲（微秒）
+        self.lag = LatencyHistogram()
+    
+    @property
+    def name(self) -> str:
+        """回調函數名稱，用於日誌和統計"""
+        return getattr(self.callback, "__qualname__", repr(self.callback))
+    
+    def put(self, exchange_id: str, symbol: str, price: float) -> None:
+        """
+        將價格放入隊列，隊列已滿時按溢出策略丟棄（需要在事件循環中調用）
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            price: 價格
+        """
+        self.received += 1
+        queue = self._queue
+        
+        if len(queue) >= self.queue_size:
+            self.dropped += 1
+            if self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                return
+            queue.popleft()
+        
+        queue.append((exchange_id, symbol, price, time.monotonic_ns()))
+        depth = len(queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self._event.set()
+        
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self) -> None:
+        """消費任務：依次將隊列中的價格交給回調函數"""
+        queue = self._queue
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            
+            while queue:
+                exchange_id, symbol, price, enqueued_ns = queue.popleft()
+                self.lag.record((time.monotonic_ns() - enqueued_ns) // 1000)
+                try:
+                    await self.callback(exchange_id, symbol, price)
+                    self.delivered += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"執行異步價格回調函數 {self.name} 時出錯: {e}")
+    
+    def stop(self) -> None:
+        """停止消費任務並清空隊列"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self._queue.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取訂閱者的統計信息
+        
+        Returns:
+            統計信息，例如 {"depth": 0, "capacity": 1000, "dropped": 0, "lag": {"p99": 0.4, ...}, ...}
+        """
+        return {
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "capacity": self.queue_size,
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "overflow_policy": self.overflow_policy.value,
+            "lag": self.lag.to_dict()
+        }
+
+
+class _Subscription:
+    """一個已註冊的回調函數及其過濾條件"""
+    
+    __slots__ = ("callback", "deliver", "keys", "order", "subscriber")
+    
+    def __init__(self, callback: PriceCallback, keys: List[_Key], subscriber: Optional[AsyncSubscriber]):
+        self.callback = callback
+        self.subscriber = subscriber
+        # 每個tick實際調用的函數：同步回調本身或異步訂閱者的 put
+        self.deliver: SyncPriceCallback = subscriber.put if subscriber is not None else callback
+        self.keys = keys
+        self.order = next(_sequence)
+
+
+class SubscriberIndex:
+    """
+    按(交易所, 交易對)索引的價格訂閱者集合
+    """
+    
+    def __init__(self):
+        """初始化空索引"""
+        self._index: Dict[_Key, List[_Subscription]] = {}
+        self._subscriptions: List[_Subscription] = []
+        # 查找結果緩存 {("binance", "BTC/USDT"): (deliver1, deliver2)}
+        self._resolved: Dict[Tuple[str, str], Tuple[SyncPriceCallback, ...]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+    
+    def add(self, callback: PriceCallback, exchanges: Optional[Iterable[str]] = None,
+            symbols: Optional[Iterable[str]] = None, queue_size: int = 1000,
+            overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST) -> None:
+        """
+        註冊回調函數，async def 回調會自動使用獨立隊列異步執行
+        
+        Args:
+            callback: 回調函數，參數為(exchange_id, symbol, price)
+            exchanges: 只接收這些交易所的價格，None或空集合表示所有交易所
+            symbols: 只接收這些交易對的價格，None或空集合表示所有交易對
+            queue_size: 異步回調的隊列容量
+            overflow_policy: 異步回調隊列已滿時的處理策略
+        """
+        exchange_keys: List[Optional[str]] = list(exchanges) if exchanges else [None]
+        symbol_keys: List[Optional[str]] = list(symbols) if symbols else [None]
+        keys = [(exchange_id, symbol) for exchange_id in exchange_keys for symbol in symbol_keys]
+        
+        subscriber = None
+        if asyncio.iscoroutinefunction(callback):
+            subscriber = AsyncSubscriber(callback, queue_size=queue_size, overflow_policy=overflow_policy)
+        
+        subscription = _Subscription(callback, keys, subscriber)
+        self._subscriptions.append(subscription)
+        for key in keys:
+            self._index.setdefault(key, []).append(subscription)
+        self._resolved.clear()
+    
+    def remove(self, callback: PriceCallback) -> bool:
+        """
+        移除回調函數的所有註冊
+        
+        Args:
+            callback: 要移除的回調函數
+        
+        Returns:
+            是否找到並移除
+        """
+        removed = [s for s in self._subscriptions if s.callback == callback]
+        if not removed:
+            return False
+        
+        for subscription in removed:
+            self._subscriptions.remove(subscription)
+            for key in subscription.keys:
+                entries = self._index[key]
+                entries.remove(subscription)
+                if not entries:
+                    del self._index[key]
+            if subscription.subscriber is not None:
+                subscription.subscriber.stop()
+        self._resolved.clear()
+        return True
+    
+    def match(self, exchange_id: str, symbol: str) -> Tuple[SyncPriceCallback, ...]:
+        """
+        查找關注(交易所, 交易對)的訂閱者
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        
+        Returns:
+            按註冊順序排列的分發函數，參數為(exchange_id, symbol, price)
+        """
+        key = (exchange_id, symbol)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            index = self._index
+            matched: List[_Subscription] = []
+            for lookup in (key, (exchange_id, None), (None, symbol), (None, None)):
+                entries = index.get(lookup)
+                if entries:
+                    matched.extend(entries)
+            matched.sort(key=lambda s: s.order)
+            resolved = self._resolved[key] = tuple(s.deliver for s in matched)
+        return resolved
+    
+    def stop(self) -> None:
+        """停止所有異步訂閱者的消費任務（訂閱保留，收到價格時重新啟動）"""
+        for subscription in self._subscriptions:
+            if subscription.subscriber is not None:
+                subscription.subscriber.stop()
+    
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """
+        獲取所有訂閱者的統計信息
+        
+        Returns:
+            每個訂閱者的過濾條件，異步訂閱者另外包含隊列統計
+        """
+        stats = []
+        for subscription in self._subscriptions:
+            exchanges = sorted({exchange_id for exchange_id, _ in subscription.keys if exchange_id})
+            symbols = sorted({symbol for _, symbol in subscription.keys if symbol})
+            entry: Dict[str, Any] = {
+                "callback": getattr(subscription.callback, "__qualname__", repr(subscription.callback)),
+                "exchanges": exchanges or "*",
+                "symbols": symbols or "*",
+                "async": subscription.subscriber is not None
+            }
+            if subscription.subscriber is not None:
+                entry["queue"] = subscription.subscriber.get_stats()
+            stats.append(entry)
+        return stats
@@ -0,0 +1,200 @@
+"""
+訂閱引用計數
+
+多個前端分頁或策略可能關注同一個交易對。每個(交易所, 交易對)記錄持有它的使用者（consumer），
+最後一個使用者取消後不會立即向交易所取消訂閱，而是等待寬限期，期間重新訂閱可以直接沿用現有訂閱，
+減少交易所控制通道上訂閱/取消訂閱的往返。
+
+同時記錄每個交易對最近被讀取的時間，訂閱數量超過預算時按最久未讀取的順序淘汰，
+沒有使用者的（寬限期中的）訂閱優先淘汰。讀取時間使用Unix時間，其他進程（例如從共享內存讀取價格的API進程）
+記錄的讀取時間也可以合併進來。
+"""
+
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Any, Set, Tuple
+
+from app.services.price_service.watchdog import TimerWheel
+
+# 沒有指定使用者時使用的使用者ID
+DEFAULT_CONSUMER = "default"
+
+# 訂閱鍵：(交易所ID, 交易對)
+SubscriptionKey = Tuple[str, str]
+
+
+class SubscriptionRefCounter:
+    """
+    訂閱的使用者引用計數、延遲取消和最久未讀取淘汰
+    """
+    
+    def __init__(self, grace: float = 30.0, budget: int = 0):
+        """
+        初始化引用計數
+        
+        Args:
+            grace: 沒有使用者後延遲多少秒才取消訂閱，0表示立即取消
+            budget: 訂閱數量（交易所 × 交易對）上限，0表示不限制
+        """
+        self.grace = grace
+        self.budget = budget
+        
+        # 各訂閱的使用者 {("binance", "BTC/USDT"): {"tab-1", "strategy-a"}}
+        self.holders: Dict[SubscriptionKey, Set[str]] = {}
+        
+        # 沒有使用者、等待取消的訂閱
+        self.wheel = TimerWheel(tick=1.0, slots=max(2, math.ceil(grace) + 2))
+        
+        # 交易對最近被讀取的時間（Unix秒）
+        self._last_read: Dict[str, float] = {}
+        # 各交易對有記錄的訂閱數量
+        self._symbol_keys: Dict[str, int] = {}
+        
+        # 統計
+        self.reused = 0
+        self.deferred = 0
+        self.torn_down = 0
+        self.evicted = 0
+    
+    def acquire(self, exchange_id: str, symbol: str, consumer: str = DEFAULT_CONSUMER) -> bool:
+        """
+        記錄使用者持有訂閱，並取消等待中的延遲取消
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            consumer: 使用者ID
+        
+        Returns:
+            訂閱是否原本沒有使用者
+        """
+        key = (exchange_id, symbol)
+        holders = self.holders.get(key)
+        if holders is None:
+            holders = self.holders[key] = set()
+            self._symbol_keys[symbol] = self._symbol_keys.get(symbol, 0) + 1
+        was_idle = not holders
+        if was_idle and key in self.wheel:
+            self.wheel.cancel(key)
+            self.reused += 1
+        holders.add(consumer)
+        self.touch(symbol)
+        return was_idle
+    
+    def release(self, exchange_id: str, symbol: str, consumer: str = DEFAULT_CONSUMER) -> bool:
+        """
+        移除使用者，最後一個使用者離開後安排延遲取消
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+            consumer: 使用者ID
+        
+        Returns:
+            訂閱是否已沒有使用者（寬限期為0時調用者應立即取消訂閱）
+        """
+        key = (exchange_id, symbol)
+        holders = self.holders.get(key)
+        if holders is None:
+            return True
+        holders.discard(consumer)
+        if holders:
+            return False
+        
+        if self.grace > 0:
+            self.wheel.schedule(key, self.grace)
+            self.deferred += 1
+        return True
+    
+    def forget(self, exchange_id: str, symbol: str) -> None:
+        """
+        訂閱已向交易所取消，移除其記錄
+        
+        Args:
+            exchange_id: 交易所ID
+            symbol: 交易對
+        """
+        key = (exchange_id, symbol)
+        self.wheel.cancel(key)
+        if self.holders.pop(key, None) is None:
+            return
+        
+        # 交易對在所有交易所都已取消時不再記錄讀取時間
+        remaining = self._symbol_keys[symbol] - 1
+        if remaining:
+            self._symbol_keys[symbol] = remaining
+        else:
+            del self._symbol_keys[symbol]
+            self._last_read.pop(symbol, None)
+    
+    def touch(self, symbol: str, at: Optional[float] = None) -> None:
+        """
+        記錄交易對被讀取
+        
+        Args:
+            symbol: 交易對
+            at: 讀取時間（Unix秒），None表示現在；早於已記錄的時間時忽略
+        """
+        if at is None:
+            self._last_read[symbol] = time.time()
+        elif at > self._last_read.get(symbol, 0.0) and symbol in self._symbol_keys:
+            self._last_read[symbol] = at
+    
+    def expired(self, now: Optional[float] = None) -> List[SubscriptionKey]:
+        """
+        取出寬限期已過且仍沒有使用者的訂閱
+        
+        Args:
+            now: 當前時間（time.monotonic()），None表示現在
+        
+        Returns:
+            應向交易所取消的訂閱
+        """
+        expired = self.wheel.advance(time.monotonic() if now is None else now)
+        return [key for key in expired if not self.holders.get(key)]
+    
+    def eviction_candidates(self, count: int, keep: Iterable[SubscriptionKey] = ()) -> List[SubscriptionKey]:
+        """
+        選出超出預算時應淘汰的訂閱：先淘汰沒有使用者的，再按交易對最久未讀取的順序
+        
+        Args:
+            count: 需要淘汰的數量
+            keep: 不可淘汰的訂閱（例如正在訂閱的）
+        
+        Returns:
+            應淘汰的訂閱
+        """
+        if count <= 0:
+            return []
+        
+        keep = set(keep)
+        last_read = self._last_read
+        candidates = [key for key in self.holders if key not in keep]
+        candidates.sort(key=lambda key: (bool(self.holders[key]), last_read.get(key[1], 0.0)))
+        return candidates[:count]
+    
+    def clear(self) -> None:
+        """清空所有記錄"""
+        self.holders.clear()
+        self.wheel.clear()
+        self._last_read.clear()
+        self._symbol_keys.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取引用計數的統計信息
+        
+        Returns:
+            統計信息，例如 {"subscriptions": 120, "idle": 3, "budget": 500, "reused": 12, ...}
+        """
+        return {
+            "subscriptions": len(self.holders),
+            "idle": len(self.wheel),
+            "consumers": len({consumer for holders in self.holders.values() for consumer in holders}),
+            "grace": self.grace,
+            "budget": self.budget,
+            "reused": self.reused,
+            "deferred": self.deferred,
+            "torn_down": self.torn_down,
+            "evicted": self.evicted
+        }
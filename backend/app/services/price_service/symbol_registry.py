@@ -0,0 +1,249 @@
+"""
+交易對註冊表
+
+根據交易所的 exchangeInfo / instruments 數據建立交易所原生交易對ID與標準格式（BASE/QUOTE）之間的雙向映射。
+所有WebSocket客戶端共享同一個註冊表，行情處理時只需一次字典查找即可完成轉換。
+"""
+
+import asyncio
+import logging
+import sys
+from typing import Dict, List, Optional, Any
+
+from app.services.price_service.exchange_info import ExchangeInfoService, exchange_info_service
+
+logger = logging.getLogger(__name__)
+
+class InstrumentTable:
+    """
+    單個交易所市場的交易對映射表
+    """
+    
+    def __init__(self, exchange: str, market_type: str):
+        """
+        初始化映射表
+        
+        Args:
+            exchange: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot"
+        """
+        self.exchange = exchange
+        self.market_type = market_type
+        
+        # 原生ID到標準格式 {"ETHBTC": "ETH/BTC", "BTC-USDT-SWAP": "BTC/USDT"}
+        self.native_to_standard: Dict[str, str] = {}
+        
+        # 標準格式到原生ID {"ETH/BTC": "ETHBTC"}，多個合約對應同一標準格式時保留主合約
+        self.standard_to_native: Dict[str, str] = {}
+        
+        # 是否已從交易所數據載入
+        self.loaded = False
+    
+    def add(self, native_id: str, base: str, quote: str, primary: bool = True) -> str:
+        """
+        添加交易對映射
+        
+        Args:
+            native_id: 交易所原生ID，例如 "ETHBTC"、"BTC-USDT-240628"
+            base: 基礎貨幣，例如 "ETH"
+            quote: 報價貨幣，例如 "BTC"
+            primary: 是否作為該標準交易對的主合約（用於標準格式到原生ID的映射）
+        
+        Returns:
+            標準格式的交易對
+        """
+        native_id = sys.intern(native_id.upper())
+        standard = sys.intern(f"{base.upper()}/{quote.upper()}")
+        
+        self.native_to_standard[native_id] = standard
+        if primary or standard not in self.standard_to_native:
+            self.standard_to_native[standard] = native_id
+        return standard
+    
+    def remember(self, native_id: str, standard: str) -> None:
+        """
+        緩存推測得到的映射，避免每條消息重複推測；載入交易所數據時會被覆蓋
+        
+        Args:
+            native_id: 交易所原生ID
+            standard: 推測的標準格式交易對
+        """
+        self.native_to_standard[sys.intern(native_id)] = sys.intern(standard)
+    
+    def to_standard(self, native_id: str) -> Optional[str]:
+        """
+        原生ID轉換為標準格式
+        
+        Args:
+            native_id: 交易所原生ID，例如 "ETHBTC"
+        
+        Returns:
+            標準格式的交易對，例如 "ETH/BTC"，未知時返回None
+        """
+        standard = self.native_to_standard.get(native_id)
+        if standard is None:
+            standard = self.native_to_standard.get(native_id.upper())
+        return standard
+    
+    def to_native(self, standard: str) -> Optional[str]:
+        """
+        標準格式轉換為原生ID
+        
+        Args:
+            standard: 標準格式的交易對，例如 "ETH/BTC"
+        
+        Returns:
+            交易所原生ID，例如 "ETHBTC"，未知時返回None
+        """
+        native_id = self.standard_to_native.get(standard)
+        if native_id is None:
+            native_id = self.standard_to_native.get(standard.upper())
+        return native_id
+
+
+class SymbolRegistry:
+    """
+    交易對註冊表，管理所有交易所市場的映射表
+    """
+    
+    # OKX產品類型對應
+    OKX_INST_TYPES = {"spot": "SPOT", "swap": "SWAP", "futures": "FUTURES"}
+    
+    def __init__(self, info_service: Optional[ExchangeInfoService] = None):
+        """
+        初始化交易對註冊表
+        
+        Args:
+            info_service: 交易所信息服務，None表示使用全局實例
+        """
+        self.info_service = info_service or exchange_info_service
+        
+        # {"binance_spot": InstrumentTable}
+        self.tables: Dict[str, InstrumentTable] = {}
+        
+        # 避免並發重複載入同一市場
+        self._locks: Dict[str, asyncio.Lock] = {}
+    
+    def table(self, exchange: str, market_type: str) -> InstrumentTable:
+        """
+        獲取交易所市場的映射表，不存在時創建空表
+        
+        WebSocket客戶端可以持有返回的映射表，載入數據時會原地更新。
+        
+        Args:
+            exchange: 交易所ID，例如 "binance"
+            market_type: 市場類型，例如 "spot"
+        
+        Returns:
+            映射表
+        """
+        key = f"{exchange.lower()}_{market_type.lower()}"
+        if key not in self.tables:
+            self.tables[key] = InstrumentTable(exchange.lower(), market_type.lower())
+        return self.tables[key]
+    
+    def load_binance(self, market_type: str, symbols: List[Dict[str, Any]]) -> int:
+        """
+        從幣安 exchangeInfo 的 symbols 數據載入映射
+        
+        Args:
+            market_type: 市場類型，"spot" 或 "futures"
+            symbols: exchangeInfo 中的 symbols 列表
+        
+        Returns:
+            載入的交易對數量
+        """
+        table = self.table("binance", market_type)
+        
+        # 永續合約優先作為主合約，交割合約（例如 BTCUSDT_240628）排在後面
+        ordered = sorted(symbols, key=lambda s: s.get("contractType", "PERPETUAL") != "PERPETUAL")
+        for symbol in ordered:
+            table.add(symbol["symbol"], symbol["baseAsset"], symbol["quoteAsset"],
+                      primary=symbol.get("contractType", "PERPETUAL") == "PERPETUAL")
+        
+        table.loaded = True
+        return len(ordered)
+    
+    def load_okx(self, market_type: str, instruments: List[Dict[str, Any]]) -> int:
+        """
+        從OKX instruments 數據載入映射
+        
+        現貨使用 baseCcy/quoteCcy，永續（-SWAP）和交割合約（例如 BTC-USDT-240628）使用 uly。
+        同一標準交易對有多個交割合約時，最近到期的作為主合約。
+        
+        Args:
+            market_type: 市場類型，"spot"、"swap" 或 "futures"
+            instruments: instruments 數據列表
+        
+        Returns:
+            載入的產品數量
+        """
+        table = self.table("okx", market_type)
+        
+        ordered = sorted(instruments, key=lambda i: int(i.get("expTime") or 0))
+        count = 0
+        for instrument in ordered:
+            base = instrument.get("baseCcy")
+            quote = instrument.get("quoteCcy")
+            if not base or not quote:
+                underlying = instrument.get("uly") or instrument.get("instFamily") or instrument["instId"]
+                parts = underlying.split("-")
+                if len(parts) < 2:
+                    continue
+                base, quote = parts[0], parts[1]
+            
+            table.add(instrument["instId"], base, quote, primary=False)
+            count += 1
+        
+        table.loaded = True
+        return count
+    
+    async def ensure_loaded(self, exchange: str, market_type: str, force_refresh: bool = False) -> bool:
+        """
+        確保交易所市場的映射表已從交易所數據載入
+        
+        Args:
+            exchange: 交易所ID，"binance" 或 "okx"
+            market_type: 市場類型
+            force_refresh: 是否強制重新載入
+        
+        Returns:
+            映射表是否可用
+        """
+        exchange = exchange.lower()
+        market_type = market_type.lower()
+        table = self.table(exchange, market_type)
+        if table.loaded and not force_refresh:
+            return True
+        
+        key = f"{exchange}_{market_type}"
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if table.loaded and not force_refresh:
+                return True
+            
+            try:
+                if exchange == "binance":
+                    instruments = await self.info_service.get_binance_instruments(market_type, force_refresh)
+                    count = self.load_binance(market_type, instruments) if instruments else 0
+                elif exchange == "okx":
+                    inst_type = self.OKX_INST_TYPES.get(market_type, "SPOT")
+                    instruments = await self.info_service.get_okx_instruments(inst_type, force_refresh)
+                    count = self.load_okx(market_type, instruments) if instruments else 0
+                else:
+                    logger.warning(f"不支持的交易所: {exchange}")
+                    return False
+            except Exception as e:
+                logger.error(f"載入{key}交易對映射失敗: {e}")
+                return False
+            
+            if not count:
+                logger.warning(f"未能載入{key}交易對映射，將使用推測規則轉換交易對")
+                return False
+            
+            logger.info(f"已載入{key}交易對映射，共 {count} 個交易對")
+            return True
+
+
+# 創建一個全局實例，供所有WebSocket客戶端共享
+symbol_registry = SymbolRegistry()
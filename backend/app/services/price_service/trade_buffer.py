@@ -0,0 +1,67 @@
+"""
+成交記錄環形緩衝區
+
+按列存儲單個交易對的成交記錄（時間戳、價格、數量、方向），記憶體佔用固定，
+讀取最近N筆或某個時間窗口時直接返回數組視圖（見 ring_buffer.MirroredRingBuffer）。
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from app.services.price_service.ring_buffer import MirroredRingBuffer
+
+# 成交方向
+BUY = 1
+SELL = -1
+
+
+class TradeView(NamedTuple):
+    """成交記錄的只讀列視圖，按時間從舊到新排列"""
+    # 成交時間（毫秒）
+    timestamps: np.ndarray
+    # 成交價格
+    prices: np.ndarray
+    # 成交數量
+    quantities: np.ndarray
+    # 主動成交方向，1為買入，-1為賣出
+    sides: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+class TradeRingBuffer(MirroredRingBuffer):
+    """
+    單個交易對的成交記錄環形緩衝區，append(時間戳, 價格, 數量, 方向)，last / window 返回 TradeView
+    """
+    
+    view_type = TradeView
+    dtypes = (np.int64, np.float64, np.float64, np.int8)
+    
+    def __init__(self, capacity: int = 10000):
+        """
+        初始化環形緩衝區
+        
+        Args:
+            capacity: 保留的成交筆數
+        """
+        super().__init__(capacity)
+    
+    def append(self, timestamp: int, price: float, quantity: float, side: int) -> None:
+        """
+        寫入一筆成交
+        
+        Args:
+            timestamp: 成交時間（毫秒）
+            price: 成交價格
+            quantity: 成交數量
+            side: 主動成交方向，BUY 或 SELL
+        """
+        head = self._advance()
+        mirror = head + self.capacity
+        timestamps, prices, quantities, sides = self._columns
+        timestamps[head] = timestamps[mirror] = timestamp
+        prices[head] = prices[mirror] = price
+        quantities[head] = quantities[mirror] = quantity
+        sides[head] = sides[mirror] = side
@@ -0,0 +1,338 @@
+"""
+交易對停止更新監控
+
+連接保持 CONNECTED 時，個別交易對仍可能悄悄停止推送。監控器用單層時間輪為每個(連接, 交易對)
+安排一次到期檢查：價格更新只寫入分片上的時間戳，不觸碰時間輪；到期時才讀取實際的最近更新時間，
+未過期的按剩餘時間重新排入時間輪。整個服務只有一個監控任務，每個檢查週期只處理當前槽位的交易對。
+
+發現停止更新的交易對後只重新訂閱這些交易對；同一分片中停止更新的交易對過多時，直接回收重建該分片的連接。
+冷門交易對可能確實長時間沒有成交，連續被判定停止更新時檢查間隔按指數增長，且只有之前有過更新、
+之後才停止的交易對計入回收條件，避免反復重新訂閱冷門交易對或回收正常的分片。
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Hashable, List, Optional, Any, Set, Tuple
+
+from app.services.price_service.sharded_websocket import ShardedWebSocketGroup
+from app.services.price_service.websocket_base import WebSocketBase, WebSocketState
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """
+    單層時間輪
+    
+    槽位數量覆蓋最長的定時時間，安排和取消都是O(1)；超過覆蓋範圍的定時會提前到期，由調用者重新安排。
+    """
+    
+    def __init__(self, tick: float, slots: int):
+        """
+        初始化時間輪
+        
+        Args:
+            tick: 每個槽位的時間長度（秒）
+            slots: 槽位數量
+        """
+        if tick <= 0 or slots < 2:
+            raise ValueError("tick 必須大於0，slots 至少為2")
+        
+        self.tick = tick
+        self.slots: List[Set[Hashable]] = [set() for _ in range(slots)]
+        self.cursor = 0
+        
+        # 當前槽位的開始時間
+        self._time = time.monotonic()
+        
+        # 各定時所在的槽位
+        self._slot_of: Dict[Hashable, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self._slot_of)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+    
+    def schedule(self, key: Hashable, delay: float) -> None:
+        """
+        安排定時，已存在的定時會被替換
+        
+        Args:
+            key: 定時的鍵
+            delay: 延遲（秒）
+        """
+        self.cancel(key)
+        ticks = min(len(self.slots) - 1, max(1, math.ceil(delay / self.tick)))
+        index = (self.cursor + ticks) % len(self.slots)
+        self.slots[index].add(key)
+        self._slot_of[key] = index
+    
+    def cancel(self, key: Hashable) -> None:
+        """
+        取消定時
+        
+        Args:
+            key: 定時的鍵
+        """
+        index = self._slot_of.pop(key, None)
+        if index is not None:
+            self.slots[index].discard(key)
+    
+    def clear(self) -> None:
+        """取消所有定時"""
+        for slot in self.slots:
+            slot.clear()
+        self._slot_of.clear()
+    
+    def advance(self, now: float) -> List[Hashable]:
+        """
+        推進時間輪到指定時間
+        
+        Args:
+            now: 當前時間（time.monotonic()）
+        
+        Returns:
+            到期的定時鍵列表
+        """
+        elapsed = int((now - self._time) // self.tick)
+        if elapsed <= 0:
+            return []
+        
+        # 停頓超過一整圈時所有槽位都已到期
+        steps = min(elapsed, len(self.slots))
+        self._time += elapsed * self.tick
+        
+        expired: List[Hashable] = []
+        for _ in range(steps):
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            slot = self.slots[self.cursor]
+            if slot:
+                expired.extend(slot)
+                for key in slot:
+                    del self._slot_of[key]
+                slot.clear()
+        self.cursor = (self.cursor + elapsed - steps) % len(self.slots)
+        return expired
+
+
+class StalenessWatchdog:
+    """
+    交易對停止更新監控器
+    """
+    
+    def __init__(self,
+                 connections: Dict[str, ShardedWebSocketGroup],
+                 stale_after: float = 60,
+                 check_interval: float = 1.0,
+                 recycle_ratio: float = 0.5,
+                 recycle_min: int = 3,
+                 backoff_max: float = 1800):
+        """
+        初始化監控器
+        
+        Args:
+            connections: 連接鍵到分片連接組的映射（與價格管理器共用同一個字典）
+            stale_after: 交易對多少秒沒有更新視為停止更新，0表示停用監控
+            check_interval: 檢查間隔（秒），即時間輪每個槽位的長度
+            recycle_ratio: 同一分片中停止更新的交易對佔比達到此值時回收重建連接
+            recycle_min: 回收重建連接所需的最少停止更新交易對數量
+            backoff_max: 交易對連續停止更新時檢查間隔的上限（秒）
+        """
+        self.connections = connections
+        self.stale_after = stale_after
+        self.check_interval = check_interval
+        self.recycle_ratio = recycle_ratio
+        self.recycle_min = recycle_min
+        self.backoff_max = max(backoff_max, stale_after)
+        
+        self.wheel = TimerWheel(check_interval, math.ceil(max(stale_after, check_interval) / check_interval) + 1)
+        
+        # 各(連接鍵, 交易對)開始計算停止更新的時間：開始監控或最近一次重新訂閱的時間
+        self._since: Dict[Tuple[str, str], float] = {}
+        
+        # 各(連接鍵, 交易對)連續被判定停止更新的次數，收到更新後清除
+        self._strikes: Dict[Tuple[str, str], int] = {}
+        
+        self._task: Optional[asyncio.Task] = None
+        
+        # 正在執行的重新訂閱/回收任務，以及正在回收的分片
+        self._actions: Set[asyncio.Task] = set()
+        self._recycling: Set[WebSocketBase] = set()
+        
+        # 統計
+        self.resubscribed = 0
+        self.recycled = 0
+    
+    @property
+    def enabled(self) -> bool:
+        """是否啟用監控"""
+        return self.stale_after > 0
+    
+    def watch(self, conn_key: str, symbol: str) -> None:
+        """
+        開始監控交易對
+        
+        Args:
+            conn_key: 連接鍵，例如 "binance_spot"
+            symbol: 交易對
+        """
+        if not self.enabled:
+            return
+        key = (conn_key, symbol)
+        self._since[key] = time.monotonic()
+        self.wheel.schedule(key, self.stale_after)
+    
+    def unwatch(self, conn_key: str, symbol: str) -> None:
+        """
+        停止監控交易對
+        
+        Args:
+            conn_key: 連接鍵
+            symbol: 交易對
+        """
+        key = (conn_key, symbol)
+        self._since.pop(key, None)
+        self._strikes.pop(key, None)
+        self.wheel.cancel(key)
+    
+    def start(self) -> None:
+        """啟動監控任務（需要在事件循環中調用）"""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+    
+    def stop(self) -> None:
+        """停止監控任務並清空所有監控"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        for task in self._actions:
+            task.cancel()
+        self._actions.clear()
+        self._recycling.clear()
+        self._since.clear()
+        self._strikes.clear()
+        self.wheel.clear()
+    
+    async def _run(self) -> None:
+        """監控任務"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check(time.monotonic())
+            except Exception as e:
+                logger.error(f"檢查交易對更新狀態時出錯: {e}")
+    
+    def _quiet_after(self, key: Tuple[str, str]) -> float:
+        """交易對多少秒沒有更新視為停止更新：每連續判定一次加倍，不超過 backoff_max"""
+        return min(self.stale_after * 2 ** self._strikes.get(key, 0), self.backoff_max)
+    
+    def _spawn(self, coro: Any) -> asyncio.Task:
+        """在後台執行重新訂閱/回收，不阻塞檢查循環"""
+        task = asyncio.create_task(coro)
+        self._actions.add(task)
+        task.add_done_callback(self._actions.discard)
+        return task
+    
+    async def _recycle(self, connection: ShardedWebSocketGroup, shard: WebSocketBase) -> None:
+        """回收重建分片，同一分片同時只回收一次"""
+        self._recycling.add(shard)
+        try:
+            await connection.recycle_shard(shard)
+        except Exception as e:
+            logger.error(f"回收重建分片連接時出錯: {e}")
+        finally:
+            self._recycling.discard(shard)
+    
+    async def _resubscribe(self, connection: ShardedWebSocketGroup, symbols: List[str]) -> None:
+        """重新訂閱停止更新的交易對"""
+        try:
+            await connection.resubscribe_symbols(symbols)
+        except Exception as e:
+            logger.error(f"重新訂閱停止更新的交易對時出錯: {e}")
+    
+    async def check(self, now: float) -> None:
+        """
+        檢查到期的交易對，重新訂閱停止更新的交易對或回收重建其所在的分片
+        
+        重新訂閱和回收在後台任務中執行，檢查本身不會等待它們完成。
+        
+        Args:
+            now: 當前時間（time.monotonic()）
+        """
+        # 各分片停止更新的交易對，以及其中之前有過更新、之後才停止的交易對
+        stale: Dict[Tuple[str, WebSocketBase], List[str]] = {}
+        went_quiet: Dict[Tuple[str, WebSocketBase], int] = {}
+        
+        for key in self.wheel.advance(now):
+            since = self._since.get(key)
+            if since is None:
+                continue
+            
+            conn_key, symbol = key
+            connection = self.connections.get(conn_key)
+            if connection is None:
+                self._since.pop(key, None)
+                continue
+            
+            # 分片未連接時由重連流程處理，連接後重新計時
+            shard = connection.symbol_shards.get(symbol)
+            if shard is None or shard.state != WebSocketState.CONNECTED:
+                self.wheel.schedule(key, self.stale_after)
+                continue
+            
+            last_update = shard.last_update.get(symbol, 0.0)
+            active = last_update > since
+            if active:
+                # 開始計時後收到過更新，恢復正常的檢查間隔
+                self._strikes.pop(key, None)
+            
+            quiet_after = self._quiet_after(key)
+            age = now - max(last_update, shard.connected_at, since)
+            if age < quiet_after:
+                self.wheel.schedule(key, quiet_after - age)
+                continue
+            
+            stale.setdefault((conn_key, shard), []).append(symbol)
+            if active:
+                went_quiet[(conn_key, shard)] = went_quiet.get((conn_key, shard), 0) + 1
+            self._strikes[key] = self._strikes.get(key, 0) + 1
+            self._since[key] = now
+            self.wheel.schedule(key, self._quiet_after(key))
+        
+        for (conn_key, shard), symbols in stale.items():
+            connection = self.connections.get(conn_key)
+            if connection is None:
+                continue
+            
+            if shard in self._recycling:
+                continue
+            
+            # 只有原本有更新的交易對計入回收條件，一直沒有成交的冷門交易對不會觸發回收
+            quiet = went_quiet.get((conn_key, shard), 0)
+            if quiet >= self.recycle_min and quiet >= len(shard.subscribed_symbols) * self.recycle_ratio:
+                logger.warning(f"{conn_key}分片有{quiet}/{len(shard.subscribed_symbols)}個交易對"
+                               f"超過{self.stale_after:g}秒沒有更新，回收重建連接")
+                self.recycled += 1
+                self._spawn(self._recycle(connection, shard))
+            else:
+                logger.warning(f"{conn_key}交易對超過{self.stale_after:g}秒沒有更新，重新訂閱: {symbols}")
+                self.resubscribed += len(symbols)
+                self._spawn(self._resubscribe(connection, symbols))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取監控統計
+        
+        Returns:
+            統計信息，例如 {"stale_after": 60, "watched": 120, "backing_off": 2, "resubscribed": 3, "recycled": 0}
+        """
+        return {
+            "stale_after": self.stale_after,
+            "watched": len(self._since),
+            "backing_off": len(self._strikes),
+            "resubscribed": self.resubscribed,
+            "recycled": self.recycled
+        }
@@ -10,11 +10,17 @@ import json
 import logging
 import time
 from abc import ABC, abstractmethod
+from collections import deque
 from enum import Enum
 from typing import Dict, List, Optional, Any, Set, Callable
 
 import aiohttp
 
+from app.services.price_service.endpoints import EndpointPool, backoff_delay, get_endpoint_pool
+from app.services.price_service.frame_capture import FrameRecorder, capture_path
+from app.services.price_service.latency import LatencyTracker
+from app.services.price_service.trade_buffer import TradeRingBuffer
+
 logger = logging.getLogger(__name__)
 
 class WebSocketState(Enum):
@@ -27,47 +33,216 @@ class WebSocketState(Enum):
     CLOSED = 5          # 已關閉
 
 
+class OverflowPolicy(Enum):
+    """消息隊列已滿時的處理策略"""
+    DROP_OLDEST = "drop_oldest"    # 丟棄最舊的消息（適合只關心最新價格的行情）
+    DROP_NEWEST = "drop_newest"    # 丟棄新收到的消息
+
+
+class RttStats:
+    """
+    心跳往返時間（RTT）統計
+    """
+    
+    def __init__(self, window: int = 100):
+        """
+        初始化RTT統計
+        
+        Args:
+            window: 計算分位數使用的最近樣本數量
+        """
+        self.samples: deque = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.last: Optional[float] = None
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        
+        # 下一次心跳發送前仍未收到回應的次數
+        self.missed = 0
+    
+    def add(self, rtt_ms: float) -> None:
+        """
+        記錄一次RTT樣本
+        
+        Args:
+            rtt_ms: 往返時間（毫秒）
+        """
+        self.samples.append(rtt_ms)
+        self.count += 1
+        self.total += rtt_ms
+        self.last = rtt_ms
+        if self.min is None or rtt_ms < self.min:
+            self.min = rtt_ms
+        if self.max is None or rtt_ms > self.max:
+            self.max = rtt_ms
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        導出統計結果
+        
+        Returns:
+            統計數據（毫秒），例如 {"last": 12.3, "min": 10.1, "avg": 12.0, "p50": 11.8, "p99": 20.5, ...}
+        """
+        ordered = sorted(self.samples)
+        
+        def percentile(q: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+        
+        return {
+            "last": round(self.last, 3) if self.last is not None else None,
+            "min": round(self.min, 3) if self.min is not None else None,
+            "max": round(self.max, 3) if self.max is not None else None,
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "p50": percentile(0.5),
+            "p99": percentile(0.99),
+            "count": self.count,
+            "missed": self.missed
+        }
+
+
+class _WireMeter:
+    """
+    包裝連接底層的WebSocket幀解析器，統計線上收到的字節數和解析耗時（啟用壓縮時包含解壓）
+    """
+    
+    def __init__(self, parser: Any, owner: "WebSocketBase"):
+        self._parser = parser
+        self._owner = owner
+    
+    def feed_data(self, data: Any) -> Any:
+        start = time.perf_counter_ns()
+        try:
+            return self._parser.feed_data(data)
+        finally:
+            self._owner.wire_parse_ns += time.perf_counter_ns() - start
+            self._owner.wire_bytes += len(data)
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._parser, name)
+
+
 class WebSocketBase(ABC):
     """
     WebSocket基礎類，定義了所有交易所WebSocket客戶端的共同接口和基礎功能。
     """
     
+    # 交易所以文本消息回覆心跳時的回覆內容（例如OKX的 "pong"），None表示使用標準的ping/pong幀
+    HEARTBEAT_REPLY: Optional[str] = None
+    
     def __init__(self, 
                  exchange_name: str,
                  ws_url: str,
                  ping_interval: int = 30,
                  reconnect_delay: int = 5,
-                 max_reconnect_attempts: int = 10):
+                 max_reconnect_attempts: int = 10,
+                 max_reconnect_delay: float = 60,
+                 fallback_urls: Optional[List[str]] = None,
+                 queue_size: int = 10000,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 batch_size: int = 100,
+                 trade_buffer_size: int = 10000,
+                 compress: bool = False,
+                 measure_wire: bool = False,
+                 record_dir: Optional[str] = None,
+                 track_latency: bool = True):
         """
         初始化WebSocket基礎類
         
         Args:
             exchange_name: 交易所名稱
-            ws_url: WebSocket連接URL
+            ws_url: WebSocket連接URL（默認端點）
             ping_interval: 心跳間隔（秒）
-            reconnect_delay: 重連延遲（秒）
-            max_reconnect_attempts: 最大重連嘗試次數
+            reconnect_delay: 重連退避的基礎延遲（秒）
+            max_reconnect_attempts: 連續重連失敗多少次後打開熔斷器暫停重連（不會永久放棄）
+            max_reconnect_delay: 重連退避的延遲上限（秒）
+            fallback_urls: 備用端點URL列表，與默認端點一起按握手延遲排序
+            queue_size: 待處理消息隊列的容量
+            overflow_policy: 隊列已滿時的處理策略
+            batch_size: 處理任務每批處理的消息數量
+            trade_buffer_size: 每個交易對保留的成交筆數
+            compress: 是否在握手時協商 permessage-deflate 壓縮
+            measure_wire: 是否統計線上字節數和幀解析（解壓）耗時，用於評估壓縮的收益和成本
+            record_dir: 錄製目錄，設置時將收到的所有原始數據消息錄製到該目錄下的新文件，用於離線回放
+            track_latency: 是否統計每個tick從交易所事件時間到收到消息、再到價格回調完成的延遲
         """
         self.exchange_name = exchange_name
         self.ws_url = ws_url
         self.ping_interval = ping_interval
         self.reconnect_delay = reconnect_delay
         self.max_reconnect_attempts = max_reconnect_attempts
+        self.max_reconnect_delay = max_reconnect_delay
+        
+        # 端點池（同一交易所市場的連接共享），ws_url 記錄當前連接的端點
+        self.endpoints: EndpointPool = get_endpoint_pool(
+            exchange_name, [ws_url] + list(fallback_urls or []), failure_threshold=max_reconnect_attempts
+        )
+        
+        # 重連任務，獨立於 tasks 之外，避免取消消息任務時把自己一起取消
+        self._reconnect_task: Optional[asyncio.Task] = None
         
         self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
         self.ws_session: Optional[aiohttp.ClientSession] = None
         self.state = WebSocketState.DISCONNECTED
         self.last_ping_time = 0
+        self.last_pong_time = 0
         self.reconnect_attempts = 0
         
+        # 心跳RTT統計，_ping_sent_at 為最近一次未回應心跳的發送時間
+        self.rtt = RttStats()
+        self._ping_sent_at: Optional[float] = None
+        
+        # 壓縮及線上流量統計
+        self.compress = compress
+        self.measure_wire = measure_wire
+        self.wire_bytes = 0
+        self.wire_parse_ns = 0
+        self.payload_bytes = 0
+        
+        # 行情延遲統計，_frame_received_ns 為正在處理的消息的接收時間（time.time_ns()）
+        self.latency: Optional[LatencyTracker] = LatencyTracker() if track_latency else None
+        self._frame_received_ns = 0
+        
+        # 原始消息錄製器
+        self.recorder: Optional[FrameRecorder] = None
+        if record_dir:
+            self.start_recording(capture_path(record_dir, exchange_name))
+        
         # 訂閱的交易對集合
         self.subscribed_symbols: Set[str] = set()
         
+        # 各交易對最近一次價格更新的時間（time.monotonic()），以及最近一次連接成功的時間，用於檢測停止更新的交易對
+        self.last_update: Dict[str, float] = {}
+        self.connected_at = 0.0
+        
+        # 訂閱了訂單簿的交易對集合
+        self.depth_symbols: Set[str] = set()
+        
+        # 訂閱了成交數據的交易對集合，以及各交易對的成交記錄緩衝區
+        self.trade_symbols: Set[str] = set()
+        self.trade_buffer_size = trade_buffer_size
+        self.trade_buffers: Dict[str, TradeRingBuffer] = {}
+        
         # 價格更新回調函數
         self.price_callbacks: List[Callable[[str, float], None]] = []
         
         # 任務管理
         self.tasks: List[asyncio.Task] = []
+        
+        # 待處理消息隊列：讀取任務只負責放入原始消息，處理任務分批取出處理
+        self.queue_size = queue_size
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        self.batch_size = batch_size
+        self._frame_queue: deque = deque()
+        self._frame_event = asyncio.Event()
+        
+        # 隊列統計
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
     
     async def connect(self) -> bool:
         """
@@ -80,17 +255,74 @@ class WebSocketBase(ABC):
             logger.info(f"{self.exchange_name} WebSocket已連接或正在連接中")
             return True
         
+        if self.state == WebSocketState.RECONNECTING:
+            logger.warning(f"{self.exchange_name} WebSocket正在重連中")
+            return False
+        
+        if not self.endpoints.breaker.try_acquire():
+            logger.warning(f"{self.exchange_name}重連熔斷器已打開，"
+                           f"{self.endpoints.breaker.retry_after():.0f}秒後才能連接")
+            return False
+        
         self.state = WebSocketState.CONNECTING
         logger.info(f"正在連接{self.exchange_name} WebSocket...")
         
         try:
-            if self.ws_session is None or self.ws_session.closed:
-                self.ws_session = aiohttp.ClientSession()
+            if await self._open_connection():
+                return True
+        except asyncio.CancelledError:
+            self.endpoints.breaker.release()
+            self.state = WebSocketState.DISCONNECTED
+            raise
+        
+        # 所有端點都連接失敗，釋放會話
+        if self.ws_session and not self.ws_session.closed:
+            await self.ws_session.close()
+        self.ws_session = None
+        self.state = WebSocketState.DISCONNECTED
+        return False
+    
+    async def _open_connection(self) -> bool:
+        """
+        按端點排序依次嘗試握手，成功後啟動消息任務並重新訂閱
+        
+        Returns:
+            是否連接成功，結果會記錄到熔斷器
+        """
+        if self.ws_session is None or self.ws_session.closed:
+            self.ws_session = aiohttp.ClientSession()
+        
+        if self.endpoints.needs_probe():
+            await self.endpoints.probe(self.ws_session)
+        
+        for url in self.endpoints.ranked():
+            start = time.perf_counter()
+            try:
+                # 關閉 autoping，由消息讀取任務自行回覆ping並記錄pong
+                ws = await asyncio.wait_for(
+                    self.ws_session.ws_connect(url, autoping=False, compress=15 if self.compress else 0),
+                    self.endpoints.CONNECT_TIMEOUT
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.exchange_name} WebSocket連接失敗: {url}, 錯誤: {e}")
+                self.endpoints.record_failure(url)
+                continue
             
-            self.ws = await self.ws_session.ws_connect(self.ws_url)
+            self.endpoints.record_success(url, (time.perf_counter() - start) * 1000)
+            self.endpoints.breaker.record_success()
+            
+            self.ws = ws
+            self.ws_url = url
+            self._ping_sent_at = None
+            if self.measure_wire:
+                self._install_wire_meter()
             self.state = WebSocketState.CONNECTED
+            self.connected_at = time.monotonic()
             self.reconnect_attempts = 0
-            logger.info(f"{self.exchange_name} WebSocket連接成功")
+            logger.info(f"{self.exchange_name} WebSocket連接成功: {url}"
+                        f"{'（已啟用permessage-deflate）' if ws.compress else ''}")
             
             # 啟動消息處理任務
             self._start_tasks()
@@ -99,10 +331,9 @@ class WebSocketBase(ABC):
             await self._resubscribe()
             
             return True
-        except Exception as e:
-            logger.error(f"{self.exchange_name} WebSocket連接失敗: {e}")
-            self.state = WebSocketState.DISCONNECTED
-            return False
+        
+        self.endpoints.breaker.record_failure()
+        return False
     
     async def disconnect(self) -> None:
         """關閉WebSocket連接"""
@@ -113,6 +344,10 @@ class WebSocketBase(ABC):
         logger.info(f"正在關閉{self.exchange_name} WebSocket連接...")
         
         # 取消所有任務
+        if self._reconnect_task and not self._reconnect_task.done() \
+                and self._reconnect_task is not asyncio.current_task():
+            self._reconnect_task.cancel()
+        self._reconnect_task = None
         for task in self.tasks:
             if not task.done():
                 task.cancel()
@@ -126,6 +361,8 @@ class WebSocketBase(ABC):
         if self.ws_session and not self.ws_session.closed:
             await self.ws_session.close()
         
+        self.stop_recording()
+        
         self.ws = None
         self.ws_session = None
         self.state = WebSocketState.DISCONNECTED
@@ -141,6 +378,7 @@ class WebSocketBase(ABC):
         
         # 創建新任務
         self.tasks.append(asyncio.create_task(self._message_handler()))
+        self.tasks.append(asyncio.create_task(self._frame_processor()))
         self.tasks.append(asyncio.create_task(self._heartbeat()))
     
     async def _heartbeat(self) -> None:
@@ -155,18 +393,127 @@ class WebSocketBase(ABC):
             except Exception as e:
                 logger.error(f"{self.exchange_name}心跳發送失敗: {e}")
                 await self._handle_connection_issue()
+                return
+    
+    def _install_wire_meter(self) -> None:
+        """
+        在連接的幀解析器外包裝統計層
+        
+        aiohttp沒有公開線上字節數和幀解析耗時，這裡依賴其內部結構（ResponseHandler._payload_parser），
+        requirements.txt 因此限制了aiohttp的版本上限；結構不符時只記錄警告，不影響連接。
+        """
+        try:
+            protocol = self.ws._conn.protocol
+            parser = protocol._payload_parser
+            if not callable(getattr(parser, "feed_data", None)):
+                raise TypeError(f"不支持的幀解析器: {type(parser).__name__}")
+            protocol._payload_parser = _WireMeter(parser, self)
+        except Exception as e:
+            logger.warning(f"{self.exchange_name}無法啟用線上流量統計（aiohttp {aiohttp.__version__}）: {e}")
+    
+    def _mark_ping_sent(self) -> None:
+        """記錄心跳發送時間，上一次心跳仍未收到回應時計為丟失"""
+        if self._ping_sent_at is not None:
+            self.rtt.missed += 1
+        self._ping_sent_at = time.perf_counter()
+    
+    def _record_pong(self) -> None:
+        """收到心跳回應，記錄RTT"""
+        self.last_pong_time = time.time()
+        if self._ping_sent_at is not None:
+            self.rtt.add((time.perf_counter() - self._ping_sent_at) * 1000)
+            self._ping_sent_at = None
+    
+    def get_wire_stats(self) -> Dict[str, Any]:
+        """
+        獲取心跳RTT和線上流量統計
+        
+        Returns:
+            統計數據，例如 {"compress": True, "rtt": {...}, "wire_bytes": 1024, "payload_bytes": 4096, ...}
+        """
+        stats: Dict[str, Any] = {
+            "compress": bool(self.ws.compress) if self.ws is not None else self.compress,
+            "url": self.ws_url,
+            "reconnect_attempts": self.reconnect_attempts,
+            "rtt": self.rtt.to_dict()
+        }
+        if self.measure_wire:
+            stats.update({
+                "wire_bytes": self.wire_bytes,
+                "payload_bytes": self.payload_bytes,
+                "compression_ratio": round(self.payload_bytes / self.wire_bytes, 3) if self.wire_bytes else None,
+                "parse_ms": round(self.wire_parse_ns / 1e6, 3),
+                # 每KB解碼後消息的解析耗時，啟用與不啟用壓縮時可直接比較
+                "parse_us_per_kb": round(self.wire_parse_ns / 1e3 / (self.payload_bytes / 1024), 3)
+                                   if self.payload_bytes else None
+            })
+        return stats
+    
+    def start_recording(self, path: str) -> None:
+        """
+        開始將收到的原始數據消息錄製到文件（心跳回覆除外），已在錄製時先結束之前的錄製
+        
+        Args:
+            path: 錄製文件路徑，文件已存在時在末尾追加
+        """
+        self.stop_recording()
+        self.recorder = FrameRecorder(path, {"exchange": self.exchange_name, "url": self.ws_url})
+        logger.info(f"{self.exchange_name}開始錄製原始消息: {path}")
+    
+    def stop_recording(self) -> None:
+        """結束錄製並關閉錄製文件"""
+        if self.recorder is None:
+            return
+        recorder = self.recorder
+        self.recorder = None
+        recorder.close()
+        logger.info(f"{self.exchange_name}錄製結束: {recorder.path}，共{recorder.frames}條消息")
+    
+    def _enqueue_frame(self, msg_type: aiohttp.WSMsgType, data: Any, received_ns: int = 0) -> None:
+        """
+        將原始消息放入待處理隊列，隊列已滿時按溢出策略丟棄消息
+        
+        Args:
+            msg_type: 消息類型（TEXT 或 BINARY）
+            data: 消息內容
+            received_ns: 收到消息的時間（time.time_ns()）
+        """
+        self.frames_received += 1
+        
+        if len(self._frame_queue) >= self.queue_size:
+            self.frames_dropped += 1
+            if self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                return
+            self._frame_queue.popleft()
+        
+        self._frame_queue.append((msg_type, data, received_ns))
+        depth = len(self._frame_queue)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        self._frame_event.set()
     
     async def _message_handler(self) -> None:
-        """消息處理任務"""
+        """消息讀取任務，只負責將收到的消息放入待處理隊列"""
         if not self.ws:
             return
             
         try:
+            heartbeat_reply = self.HEARTBEAT_REPLY
             async for msg in self.ws:
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    await self._process_message(msg.data)
-                elif msg.type == aiohttp.WSMsgType.BINARY:
-                    await self._process_binary_message(msg.data)
+                if msg.type == aiohttp.WSMsgType.TEXT or msg.type == aiohttp.WSMsgType.BINARY:
+                    if self.measure_wire:
+                        self.payload_bytes += len(msg.data)
+                    # 心跳回應直接在讀取任務中處理，RTT不包含排隊時間
+                    if msg.data == heartbeat_reply:
+                        self._record_pong()
+                        continue
+                    if self.recorder is not None:
+                        self.recorder.write(msg.type == aiohttp.WSMsgType.BINARY, msg.data)
+                    self._enqueue_frame(msg.type, msg.data, time.time_ns())
+                elif msg.type == aiohttp.WSMsgType.PING:
+                    await self.ws.pong(msg.data)
+                elif msg.type == aiohttp.WSMsgType.PONG:
+                    self._record_pong()
                 elif msg.type == aiohttp.WSMsgType.ERROR:
                     logger.error(f"{self.exchange_name} WebSocket錯誤: {msg.data}")
                     await self._handle_connection_issue()
@@ -175,6 +522,11 @@ class WebSocketBase(ABC):
                     logger.warning(f"{self.exchange_name} WebSocket連接關閉")
                     await self._handle_connection_issue()
                     break
+            else:
+                # 伺服器正常關閉連接時迭代直接結束
+                if self.state == WebSocketState.CONNECTED:
+                    logger.warning(f"{self.exchange_name} WebSocket連接被伺服器關閉")
+                    await self._handle_connection_issue()
         except asyncio.CancelledError:
             # 任務被取消，屬於正常情況
             pass
@@ -182,41 +534,101 @@ class WebSocketBase(ABC):
             logger.error(f"{self.exchange_name} WebSocket消息處理錯誤: {e}")
             await self._handle_connection_issue()
     
+    async def _frame_processor(self) -> None:
+        """消息處理任務，分批從待處理隊列取出消息並處理"""
+        queue = self._frame_queue
+        
+        while True:
+            if not queue:
+                self._frame_event.clear()
+                await self._frame_event.wait()
+                continue
+            
+            for _ in range(min(self.batch_size, len(queue))):
+                msg_type, data, self._frame_received_ns = queue.popleft()
+                try:
+                    if msg_type == aiohttp.WSMsgType.TEXT:
+                        await self._process_message(data)
+                    else:
+                        await self._process_binary_message(data)
+                except Exception as e:
+                    logger.error(f"{self.exchange_name}處理消息時發生錯誤: {e}")
+                self.frames_processed += 1
+            
+            # 每批處理完後讓出事件循環，避免阻塞消息讀取
+            await asyncio.sleep(0)
+    
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """
+        獲取待處理消息隊列的統計信息
+        
+        Returns:
+            隊列統計，例如 {"depth": 0, "capacity": 10000, "dropped": 0, ...}
+        """
+        return {
+            "depth": len(self._frame_queue),
+            "max_depth": self.max_queue_depth,
+            "capacity": self.queue_size,
+            "received": self.frames_received,
+            "processed": self.frames_processed,
+            "dropped": self.frames_dropped,
+            "overflow_policy": self.overflow_policy.value
+        }
+    
     async def _handle_connection_issue(self) -> None:
-        """處理連接問題並嘗試重連"""
-        if self.state in [WebSocketState.RECONNECTING, WebSocketState.CLOSING, WebSocketState.CLOSED]:
+        """
+        處理連接問題：停止消息任務並在獨立的重連任務中重連
+        
+        可以在消息讀取或心跳任務內調用，調用者所在的任務不會被取消，調用後應直接退出。
+        """
+        if self.state in [WebSocketState.RECONNECTING, WebSocketState.CLOSING,
+                          WebSocketState.CLOSED, WebSocketState.DISCONNECTED]:
             return
-            
+        
         self.state = WebSocketState.RECONNECTING
         logger.warning(f"{self.exchange_name} WebSocket連接中斷，嘗試重連...")
         
-        # 取消現有任務
+        # 取消其他任務，調用者自身的任務由調用者結束
+        current = asyncio.current_task()
         for task in self.tasks:
-            if not task.done():
+            if task is not current and not task.done():
                 task.cancel()
         self.tasks.clear()
         
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+    
+    async def _reconnect(self) -> None:
+        """重連任務：指數退避加隨機抖動，受熔斷器限制，直到連接成功或被主動關閉"""
         # 關閉現有連接
         if self.ws and not self.ws.closed:
-            await self.ws.close()
-        
+            try:
+                await self.ws.close()
+            except Exception as e:
+                logger.debug(f"關閉{self.exchange_name}舊連接失敗: {e}")
         self.ws = None
         
-        # 嘗試重連
-        while (self.reconnect_attempts < self.max_reconnect_attempts and 
-               self.state != WebSocketState.CONNECTED):
+        breaker = self.endpoints.breaker
+        while self.state == WebSocketState.RECONNECTING:
             self.reconnect_attempts += 1
-            logger.info(f"正在進行第{self.reconnect_attempts}次重連...")
+            delay = max(backoff_delay(self.reconnect_attempts, self.reconnect_delay, self.max_reconnect_delay),
+                        breaker.retry_after())
+            logger.info(f"{self.exchange_name}將在{delay:.1f}秒後進行第{self.reconnect_attempts}次重連")
+            await asyncio.sleep(delay)
             
-            # 等待重連延遲
-            await asyncio.sleep(self.reconnect_delay * min(self.reconnect_attempts, 5))
+            if self.state != WebSocketState.RECONNECTING:
+                return
+            if not breaker.try_acquire():
+                continue
             
-            # 嘗試連接
-            if await self.connect():
-                break
-        
-        if self.state != WebSocketState.CONNECTED:
-            logger.error(f"{self.exchange_name} WebSocket重連失敗，已達最大重試次數")
+            try:
+                if await self._open_connection():
+                    return
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                logger.error(f"{self.exchange_name}重連時發生錯誤: {e}")
+                breaker.record_failure()
     
     async def _resubscribe(self) -> None:
         """重新訂閱之前訂閱的交易對"""
@@ -250,19 +662,131 @@ class WebSocketBase(ABC):
         if callback in self.price_callbacks:
             self.price_callbacks.remove(callback)
     
-    def _notify_price_update(self, symbol: str, price: float) -> None:
+    def _notify_price_update(self, symbol: str, price: float, event_time: int = 0) -> None:
         """
-        通知所有回調函數價格更新
+        通知所有回調函數價格更新，並記錄從交易所事件時間到回調完成的延遲
         
         Args:
             symbol: 交易對
             price: 更新的價格
+            event_time: 交易所事件時間（Unix毫秒），0表示沒有
         """
+        self.last_update[symbol] = time.monotonic()
         for callback in self.price_callbacks:
             try:
                 callback(symbol, price)
             except Exception as e:
                 logger.error(f"執行價格回調函數時出錯: {e}")
+        
+        if self.latency is not None and self._frame_received_ns:
+            self.latency.record(event_time, self._frame_received_ns, time.time_ns())
+    
+    async def subscribe_depth(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對的訂單簿數據，支持的交易所需要覆蓋此方法
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            訂閱是否成功
+        """
+        logger.warning(f"{self.exchange_name}不支持訂單簿訂閱")
+        return False
+    
+    async def unsubscribe_depth(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對的訂單簿數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            取消訂閱是否成功
+        """
+        return not (set(symbols) & self.depth_symbols)
+    
+    def get_order_book(self, symbol: str) -> Optional[Any]:
+        """
+        獲取交易對的本地訂單簿
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            訂單簿，如果沒有則返回None
+        """
+        return None
+    
+    async def subscribe_trades(self, symbols: List[str]) -> bool:
+        """
+        訂閱交易對的成交數據，支持的交易所需要覆蓋此方法
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            訂閱是否成功
+        """
+        logger.warning(f"{self.exchange_name}不支持成交數據訂閱")
+        return False
+    
+    async def unsubscribe_trades(self, symbols: List[str]) -> bool:
+        """
+        取消訂閱交易對的成交數據
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+            
+        Returns:
+            取消訂閱是否成功
+        """
+        return not (set(symbols) & self.trade_symbols)
+    
+    def get_trade_buffer(self, symbol: str) -> Optional[TradeRingBuffer]:
+        """
+        獲取交易對的成交記錄緩衝區
+        
+        Args:
+            symbol: 交易對，例如 "BTC/USDT"
+            
+        Returns:
+            成交記錄緩衝區，如果沒有訂閱則返回None
+        """
+        return self.trade_buffers.get(symbol)
+    
+    async def resubscribe_symbols(self, symbols: List[str]) -> bool:
+        """
+        重新訂閱已停止更新的交易對（先取消訂閱再訂閱），不影響同一連接上的其他交易對
+        
+        Args:
+            symbols: 交易對列表，例如 ["BTC/USDT", "ETH/USDT"]
+        
+        Returns:
+            重新訂閱是否成功
+        """
+        if not await self.unsubscribe_symbols(symbols):
+            return False
+        return await self.subscribe_symbols(symbols)
+    
+    async def recycle(self) -> None:
+        """主動斷開並重建連接，重連後會重新訂閱所有數據"""
+        if self.state != WebSocketState.CONNECTED:
+            return
+        logger.warning(f"{self.exchange_name} WebSocket連接將被回收重建")
+        await self._handle_connection_issue()
+    
+    def _add_trade_buffers(self, symbols: List[str]) -> None:
+        """在發送訂閱請求前分配成交記錄緩衝區，確保訂閱確認後立即到達的成交不會被丟棄"""
+        for symbol in symbols:
+            if symbol not in self.trade_buffers:
+                self.trade_buffers[symbol] = TradeRingBuffer(self.trade_buffer_size)
+    
+    def _remove_trade_symbols(self, symbols: List[str]) -> None:
+        """移除交易對的成交數據訂閱及其緩衝區"""
+        for symbol in symbols:
+            self.trade_symbols.discard(symbol)
+            self.trade_buffers.pop(symbol, None)
     
     # 抽象方法，子類必須實現
     @abstractmethod
@@ -293,7 +817,7 @@ class WebSocketBase(ABC):
     
     @abstractmethod
     async def _send_ping(self) -> None:
-        """發送心跳包"""
+        """發送心跳包，實現需要在實際發送時調用 _mark_ping_sent 以統計RTT"""
         pass
     
     @abstractmethod
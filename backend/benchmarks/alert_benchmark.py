@@ -0,0 +1,82 @@
+"""
+價格警報基準測試
+
+在同一個(交易所, 交易對)上設置10到100000個警報（閾值在當前價格 ±20% 內均勻分佈，一半為重複警報），
+以隨機遊走的價格逐tick檢查，比較 AlertEngine 與逐個檢查所有警報的每tick耗時。
+
+用法:
+    python -m benchmarks.alert_benchmark [--ticks 200000] [--volatility 0.00005]
+"""
+
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+from app.services.price_service.alerts import ABOVE, BELOW, AlertEngine
+
+COUNTS = (10, 100, 1000, 10000, 100000)
+
+
+def make_prices(count: int, volatility: float, start: float = 100.0) -> List[float]:
+    """生成隨機遊走價格，每tick的相對波動為 volatility"""
+    prices = []
+    price = start
+    for _ in range(count):
+        price *= 1 + random.gauss(0, volatility)
+        prices.append(price)
+    return prices
+
+
+def make_alerts(count: int, start: float = 100.0) -> List[Tuple[str, float, str]]:
+    """生成(方向, 閾值, 模式)"""
+    return [(random.choice((ABOVE, BELOW)), start * random.uniform(0.8, 1.2), random.choice(("once", "repeat")))
+            for _ in range(count)]
+
+
+def measure_engine(alerts: List[Tuple[str, float, str]], prices: List[float]) -> Tuple[float, int]:
+    """返回 AlertEngine 每tick耗時（納秒）和觸發次數"""
+    engine = AlertEngine()
+    for direction, threshold, mode in alerts:
+        engine.add("binance", "BTC/USDT", direction, threshold, mode=mode, last_price=100.0)
+
+    check = engine.check
+    fired = 0
+    start = time.perf_counter_ns()
+    for price in prices:
+        fired += len(check("binance", "BTC/USDT", price))
+    return (time.perf_counter_ns() - start) / len(prices), fired
+
+
+def measure_scan(alerts: List[Tuple[str, float, str]], prices: List[float]) -> float:
+    """返回逐個檢查所有警報（只比較閾值，不處理狀態）的每tick耗時（納秒）"""
+    levels = [(direction == ABOVE, threshold) for direction, threshold, _ in alerts]
+    start = time.perf_counter_ns()
+    for price in prices:
+        for above, threshold in levels:
+            if (price >= threshold) if above else (price <= threshold):
+                pass
+    return (time.perf_counter_ns() - start) / len(prices)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="價格警報基準測試")
+    parser.add_argument("--ticks", type=int, default=200000, help="每輪檢查的tick數量")
+    parser.add_argument("--volatility", type=float, default=0.00005, help="每tick的相對價格波動")
+    parser.add_argument("--seed", type=int, default=42, help="隨機種子")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    prices = make_prices(args.ticks, args.volatility)
+    print(f"{args.ticks:,} ticks，價格範圍 {min(prices):.2f} ~ {max(prices):.2f}")
+    print(f"  {'警報數':>8} {'引擎 ns/tick':>14} {'觸發次數':>10} {'逐個檢查 ns/tick':>18}")
+    for count in COUNTS:
+        alerts = make_alerts(count)
+        per_tick, fired = measure_engine(alerts, prices)
+        # 逐個檢查的總工作量限制在約二千萬次比較
+        scan = measure_scan(alerts, prices[:max(100, 20000000 // count)])
+        print(f"  {count:>8,} {per_tick:>14,.0f} {fired:>10,} {scan:>18,.0f}")
+
+
+if __name__ == "__main__":
+    main()
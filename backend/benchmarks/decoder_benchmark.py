@@ -0,0 +1,138 @@
+"""
+行情解碼器基準測試
+
+比較原有的 json.loads + 字典檢查路徑與各個解碼後端的解碼速度（消息/秒），
+包括ticker消息和深度等非ticker消息。
+
+用法:
+    python -m benchmarks.decoder_benchmark [--frames 200000]
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Callable, List
+
+from app.services.price_service.decoders import available_backends, create_ticker_decoder
+
+
+def make_binance_frames(count: int) -> List[str]:
+    """生成幣安24hrTicker消息"""
+    frames = []
+    for i in range(count):
+        price = 50000 + random.random() * 100
+        frames.append(json.dumps({
+            "e": "24hrTicker", "E": 1700000000000 + i, "s": f"SYM{i % 300}USDT",
+            "p": "12.30", "P": "0.025", "w": "50010.12", "x": "49990.00",
+            "c": f"{price:.2f}", "Q": "0.012", "b": f"{price - 0.01:.2f}", "B": "1.5",
+            "a": f"{price + 0.01:.2f}", "A": "2.1", "o": "49900.00", "h": "50500.00",
+            "l": "49500.00", "v": "12345.678", "q": "617283900.12", "O": 1699913600000,
+            "C": 1700000000000, "F": 100, "L": 200000, "n": 199901
+        }))
+    return frames
+
+
+def make_okx_frames(count: int) -> List[str]:
+    """生成OKX tickers頻道消息"""
+    frames = []
+    for i in range(count):
+        price = 50000 + random.random() * 100
+        inst_id = f"SYM{i % 300}-USDT"
+        frames.append(json.dumps({
+            "arg": {"channel": "tickers", "instId": inst_id},
+            "data": [{
+                "instType": "SPOT", "instId": inst_id, "last": f"{price:.2f}", "lastSz": "0.01",
+                "askPx": f"{price + 0.1:.2f}", "askSz": "1.2", "bidPx": f"{price - 0.1:.2f}", "bidSz": "0.8",
+                "open24h": "49900", "high24h": "50500", "low24h": "49500", "volCcy24h": "617283900",
+                "vol24h": "12345", "sodUtc0": "49950", "sodUtc8": "49920", "ts": str(1700000000000 + i)
+            }]
+        }))
+    return frames
+
+
+def make_binance_depth_frames(count: int) -> List[str]:
+    """生成幣安40檔depthUpdate消息（非ticker消息，解碼器應只解析一次）"""
+    frames = []
+    for i in range(count):
+        price = 50000 + random.random() * 100
+        frames.append(json.dumps({
+            "e": "depthUpdate", "E": 1700000000000 + i, "s": f"SYM{i % 300}USDT",
+            "U": 1000 * i, "u": 1000 * i + 39,
+            "b": [[f"{price - level * 0.01:.2f}", "0.500"] for level in range(40)],
+            "a": [[f"{price + level * 0.01:.2f}", "0.500"] for level in range(40)]
+        }))
+    return frames
+
+
+def make_okx_book_frames(count: int) -> List[str]:
+    """生成OKX books頻道消息（非ticker消息，解碼器應只解析一次）"""
+    frames = []
+    for i in range(count):
+        price = 50000 + random.random() * 100
+        inst_id = f"SYM{i % 300}-USDT"
+        frames.append(json.dumps({
+            "arg": {"channel": "books", "instId": inst_id},
+            "action": "update",
+            "data": [{
+                "asks": [[f"{price + level * 0.1:.1f}", "0.5", "0", "2"] for level in range(20)],
+                "bids": [[f"{price - level * 0.1:.1f}", "0.5", "0", "2"] for level in range(20)],
+                "ts": str(1700000000000 + i), "checksum": -1200119424, "seqId": i, "prevSeqId": i - 1
+            }]
+        }))
+    return frames
+
+
+def legacy_binance(message: str):
+    """原有的幣安消息處理路徑"""
+    data = json.loads(message)
+    if "result" in data and data.get("id") == 0:
+        return None
+    if "error" in data:
+        return None
+    if "e" in data and data["e"] == "24hrTicker":
+        return data["s"], float(data["c"])
+    return None
+
+
+def legacy_okx(message: str):
+    """原有的OKX消息處理路徑"""
+    data = json.loads(message)
+    if "event" in data and data["event"] in ("subscribe", "unsubscribe", "error"):
+        return None
+    if "data" in data and "arg" in data and data["arg"].get("channel") == "tickers":
+        return [(t["instId"], float(t["last"])) for t in data["data"] if "instId" in t]
+    return None
+
+
+def measure(func: Callable[[str], object], frames: List[str]) -> float:
+    """執行一輪解碼並返回每秒處理的消息數"""
+    start = time.perf_counter()
+    for frame in frames:
+        func(frame)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="行情解碼器基準測試")
+    parser.add_argument("--frames", type=int, default=200000, help="每輪解碼的消息數量")
+    args = parser.parse_args()
+
+    for name, frames, legacy in (
+        ("binance", make_binance_frames(args.frames), legacy_binance),
+        ("okx", make_okx_frames(args.frames), legacy_okx),
+        ("binance depth", make_binance_depth_frames(args.frames // 10), legacy_binance),
+        ("okx books", make_okx_book_frames(args.frames // 10), legacy_okx),
+    ):
+        exchange = name.split()[0]
+        print(f"{name} ({len(frames)} 條消息)")
+        baseline = measure(legacy, frames)
+        print(f"  {'legacy':<10} {baseline:>12,.0f} 消息/秒")
+        for backend in available_backends():
+            decoder = create_ticker_decoder(exchange, backend)
+            rate = measure(decoder.decode, frames)
+            print(f"  {backend:<10} {rate:>12,.0f} 消息/秒  {rate / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+端到端行情接入基準測試
+
+在子進程中啟動本地模擬交易所（benchmarks.mock_exchange），將 BinanceWebSocket.SPOT_WS_URL /
+OkxWebSocket.WS_URL 指向它，通過 PriceManager 訂閱指定數量的交易對，測量:
+- 持續吞吐量（ticks/秒）
+- 從模擬伺服器發送到原始價格回調的延遲百分位數，以及其中本地處理（收到消息到回調完成）的部分
+- 每1000個tick消耗的CPU時間（只統計本進程，不含模擬伺服器）
+
+用法:
+    python -m benchmarks.ingest_benchmark [--symbols 500] [--rate 10] [--duration 10]
+    python -m benchmarks.ingest_benchmark --exchange okx --symbols 1000 --rate 20
+"""
+
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services.price_service.binance_websocket import BinanceWebSocket
+from app.services.price_service.okx_websocket import OkxWebSocket
+from app.services.price_service.price_manager import PriceManager
+from app.services.price_service.symbol_registry import symbol_registry
+
+
+def free_port() -> int:
+    """獲取一個空閒端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    """等待模擬伺服器開始監聽"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError("模擬交易所伺服器啟動超時")
+            await asyncio.sleep(0.1)
+
+
+def point_clients_at(port: int) -> None:
+    """將WebSocket客戶端的端點指向模擬伺服器"""
+    BinanceWebSocket.SPOT_WS_URL = f"ws://127.0.0.1:{port}/ws"
+    BinanceWebSocket.SPOT_FALLBACK_WS_URLS = []
+    # 模擬伺服器沒有控制消息頻率限制
+    BinanceWebSocket.SPOT_CONTROL_MESSAGE_RATE = 1000
+    OkxWebSocket.WS_URL = f"ws://127.0.0.1:{port}/ws/v5/public"
+    OkxWebSocket.FALLBACK_WS_URLS = []
+
+
+def load_symbols(count: int) -> List[str]:
+    """生成測試交易對並載入交易對映射表，避免向真實交易所查詢"""
+    symbol_registry.load_binance("spot", [
+        {"symbol": f"SYM{i}USDT", "baseAsset": f"SYM{i}", "quoteAsset": "USDT"} for i in range(count)
+    ])
+    symbol_registry.load_okx("spot", [
+        {"instId": f"SYM{i}-USDT", "baseCcy": f"SYM{i}", "quoteCcy": "USDT"} for i in range(count)
+    ])
+    return [f"SYM{i}/USDT" for i in range(count)]
+
+
+async def run(exchange: str, symbols: List[str], warmup: float, duration: float) -> Dict[str, Any]:
+    """訂閱交易對，預熱後在測量窗口內統計吞吐量、延遲和CPU時間"""
+    manager = PriceManager()
+    # 不讀寫熱重啟快照，避免模擬交易對被正式服務恢復訂閱
+    manager.snapshot_path = None
+    latencies: List[float] = []
+    measuring = False
+
+    def on_tick(exchange_id: str, symbol: str, price: float) -> None:
+        # 模擬伺服器以發送時間（微秒）作為價格
+        if measuring:
+            latencies.append(time.time() * 1e6 - price)
+
+    manager.add_price_callback(on_tick, raw=True)
+    try:
+        for symbol in symbols:
+            await manager.subscribe_symbol(symbol, [exchange])
+        await asyncio.sleep(warmup)
+
+        measuring = True
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        await asyncio.sleep(duration)
+        measuring = False
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        shards = len(manager.exchange_connections[f"{exchange}_spot"].shards)
+        processing = manager.get_latency_stats()[exchange]["processing"]
+    finally:
+        await manager.close_all()
+
+    ticks = len(latencies)
+    result: Dict[str, Any] = {
+        "ticks": ticks,
+        "ticks_per_sec": ticks / elapsed,
+        "cpu_percent": cpu / elapsed * 100,
+        "cpu_ms_per_1k": cpu * 1000 / ticks * 1000 if ticks else None,
+        "shards": shards,
+        "processing": processing
+    }
+    if ticks:
+        values = np.array(latencies) / 1000
+        for name, q in (("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9)):
+            result[name] = float(np.percentile(values, q))
+        result["max"] = float(values.max())
+    return result
+
+
+def report(exchange: str, symbols: int, rate: float, result: Dict[str, Any]) -> None:
+    print(f"{exchange}: {symbols} 個交易對 × {rate:g}/秒 (預期 {symbols * rate:,.0f} ticks/秒, {result['shards']} 個連接)")
+    print(f"  吞吐量   {result['ticks_per_sec']:>12,.0f} ticks/秒")
+    if result["ticks"]:
+        print(f"  延遲     p50 {result['p50']:.2f}ms  p90 {result['p90']:.2f}ms  p99 {result['p99']:.2f}ms"
+              f"  p999 {result['p999']:.2f}ms  max {result['max']:.2f}ms")
+        processing = result["processing"]
+        print(f"  本地處理 p50 {processing['p50']:.2f}ms  p99 {processing['p99']:.2f}ms  p999 {processing['p999']:.2f}ms"
+              f"  (收到消息 → 回調完成)")
+        print(f"  CPU      {result['cpu_ms_per_1k']:>12.2f} ms/1k ticks  (佔用 {result['cpu_percent']:.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="端到端行情接入基準測試")
+    parser.add_argument("--exchange", choices=["binance", "okx"], help="只測試指定交易所，默認兩個都測試")
+    parser.add_argument("--symbols", type=int, default=500, help="訂閱的交易對數量")
+    parser.add_argument("--rate", type=float, default=10.0, help="每個交易對每秒推送的ticker數量")
+    parser.add_argument("--warmup", type=float, default=2.0, help="預熱時間（秒）")
+    parser.add_argument("--duration", type=float, default=10.0, help="測量時間（秒）")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_exchange",
+                               "--port", str(port), "--rate", str(args.rate)],
+                              stdout=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_for_port(port))
+        point_clients_at(port)
+        symbols = load_symbols(args.symbols)
+        for exchange in ([args.exchange] if args.exchange else ["binance", "okx"]):
+            result = asyncio.run(run(exchange, symbols, args.warmup, args.duration))
+            report(exchange, args.symbols, args.rate, result)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
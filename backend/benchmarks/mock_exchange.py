@@ -0,0 +1,205 @@
+"""
+本地模擬交易所WebSocket伺服器
+
+實現幣安和OKX公共WebSocket協議中價格服務用到的部分，用於在沒有真實交易所連接時進行壓力測試:
+- 幣安 (/ws): SUBSCRIBE / UNSUBSCRIBE / LIST_SUBSCRIPTIONS 請求及 {"result": null, "id": ...} 確認，
+  標準ping/pong幀，訂閱 <symbol>@ticker 後推送 24hrTicker 消息
+- OKX (/ws/v5/public): subscribe / unsubscribe 請求及逐個頻道的事件確認，文本 "ping"/"pong" 心跳，
+  訂閱 tickers 頻道後推送 tickers 消息
+
+每個訂閱的交易對按 --rate 的頻率推送ticker，最新價（幣安 "c"、OKX "last"）為發送時間的Unix微秒數，
+基準測試可以直接從價格回調計算端到端延遲。訂單簿、成交等其他頻道只確認訂閱，不推送數據。
+
+用法:
+    python -m benchmarks.mock_exchange [--port 8765] [--rate 10]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Callable, Dict, List
+
+from aiohttp import WSMsgType, web
+
+# 推送任務的步進間隔（秒）
+STEP = 0.01
+
+
+def binance_ticker(stream_symbol: str) -> str:
+    """生成幣安24hrTicker消息，最新價為發送時間（微秒）"""
+    now_us = time.time_ns() // 1000
+    return json.dumps({
+        "e": "24hrTicker", "E": now_us // 1000, "s": stream_symbol.upper(),
+        "p": "12.30", "P": "0.025", "w": "50010.12", "x": "49990.00",
+        "c": str(now_us), "Q": "0.012", "b": "49999.99", "B": "1.5",
+        "a": "50000.01", "A": "2.1", "o": "49900.00", "h": "50500.00",
+        "l": "49500.00", "v": "12345.678", "q": "617283900.12", "O": now_us // 1000 - 86400000,
+        "C": now_us // 1000, "F": 100, "L": 200000, "n": 199901
+    })
+
+
+def okx_ticker(inst_id: str) -> str:
+    """生成OKX tickers頻道消息，最新價為發送時間（微秒）"""
+    now_us = time.time_ns() // 1000
+    return json.dumps({
+        "arg": {"channel": "tickers", "instId": inst_id},
+        "data": [{
+            "instType": "SPOT", "instId": inst_id, "last": str(now_us), "lastSz": "0.01",
+            "askPx": "50000.1", "askSz": "1.2", "bidPx": "49999.9", "bidSz": "0.8",
+            "open24h": "49900", "high24h": "50500", "low24h": "49500", "volCcy24h": "617283900",
+            "vol24h": "12345", "sodUtc0": "49950", "sodUtc8": "49920", "ts": str(now_us // 1000)
+        }]
+    })
+
+
+class MockExchange:
+    """模擬交易所伺服器"""
+
+    def __init__(self, rate: float = 10.0, ping_interval: float = 20.0):
+        """
+        初始化模擬伺服器
+
+        Args:
+            rate: 每個交易對每秒推送的ticker數量
+            ping_interval: 幣安連接發送ping幀的間隔（秒）
+        """
+        self.rate = rate
+        self.ping_interval = ping_interval
+        self.frames_sent = 0
+        self.connections = 0
+
+    def app(self) -> web.Application:
+        """創建aiohttp應用"""
+        app = web.Application()
+        app.router.add_get("/ws", self.binance_handler)
+        app.router.add_get("/ws/v5/public", self.okx_handler)
+        return app
+
+    async def _pump(self, ws: web.WebSocketResponse, symbols: Dict[str, None],
+                    make_frame: Callable[[str], str]) -> None:
+        """按頻率為所有已訂閱的交易對輪流推送ticker"""
+        budget = 0.0
+        cursor = 0
+        last = time.monotonic()
+        while not ws.closed:
+            await asyncio.sleep(STEP)
+            now = time.monotonic()
+            budget += len(symbols) * self.rate * (now - last)
+            last = now
+            if not symbols:
+                budget = 0.0
+                continue
+
+            names: List[str] = list(symbols)
+            count = int(budget)
+            budget -= count
+            for _ in range(count):
+                cursor = (cursor + 1) % len(names)
+                await ws.send_str(make_frame(names[cursor]))
+                self.frames_sent += 1
+
+    async def _ping(self, ws: web.WebSocketResponse) -> None:
+        """定期發送ping幀"""
+        while not ws.closed:
+            await asyncio.sleep(self.ping_interval)
+            await ws.ping()
+
+    async def binance_handler(self, request: web.Request) -> web.WebSocketResponse:
+        """幣安原始stream連接"""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+
+        streams: Dict[str, None] = {}
+        tickers: Dict[str, None] = {}
+        tasks = [asyncio.create_task(self._pump(ws, tickers, binance_ticker)),
+                 asyncio.create_task(self._ping(ws))]
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    request_data = json.loads(msg.data)
+                    method = request_data["method"]
+                    request_id = request_data["id"]
+                except (ValueError, KeyError, TypeError):
+                    await ws.send_str(json.dumps({"error": {"code": 2, "msg": "Invalid request"}, "id": None}))
+                    continue
+
+                params = request_data.get("params", [])
+                if method == "SUBSCRIBE":
+                    for stream in params:
+                        streams[stream] = None
+                        if stream.endswith("@ticker"):
+                            tickers[stream[:-len("@ticker")]] = None
+                    await ws.send_str(json.dumps({"result": None, "id": request_id}))
+                elif method == "UNSUBSCRIBE":
+                    for stream in params:
+                        streams.pop(stream, None)
+                        if stream.endswith("@ticker"):
+                            tickers.pop(stream[:-len("@ticker")], None)
+                    await ws.send_str(json.dumps({"result": None, "id": request_id}))
+                elif method == "LIST_SUBSCRIPTIONS":
+                    await ws.send_str(json.dumps({"result": list(streams), "id": request_id}))
+                else:
+                    await ws.send_str(json.dumps({"error": {"code": 1, "msg": f"Unknown method: {method}"},
+                                                  "id": request_id}))
+        finally:
+            for task in tasks:
+                task.cancel()
+        return ws
+
+    async def okx_handler(self, request: web.Request) -> web.WebSocketResponse:
+        """OKX公共頻道連接"""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+
+        tickers: Dict[str, None] = {}
+        task = asyncio.create_task(self._pump(ws, tickers, okx_ticker))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                if msg.data == "ping":
+                    await ws.send_str("pong")
+                    continue
+                try:
+                    request_data = json.loads(msg.data)
+                    op = request_data["op"]
+                    args = request_data["args"]
+                except (ValueError, KeyError, TypeError):
+                    await ws.send_str(json.dumps({"event": "error", "code": "60012", "msg": "Invalid request"}))
+                    continue
+
+                if op not in ("subscribe", "unsubscribe"):
+                    await ws.send_str(json.dumps({"event": "error", "code": "60012", "msg": f"Invalid op: {op}"}))
+                    continue
+
+                for arg in args:
+                    if arg.get("channel") == "tickers":
+                        if op == "subscribe":
+                            tickers[arg["instId"]] = None
+                        else:
+                            tickers.pop(arg["instId"], None)
+                    await ws.send_str(json.dumps({"event": op, "arg": arg, "connId": "mock"}))
+        finally:
+            task.cancel()
+        return ws
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地模擬交易所WebSocket伺服器")
+    parser.add_argument("--host", default="127.0.0.1", help="監聽地址")
+    parser.add_argument("--port", type=int, default=8765, help="監聽端口")
+    parser.add_argument("--rate", type=float, default=10.0, help="每個交易對每秒推送的ticker數量")
+    args = parser.parse_args()
+
+    server = MockExchange(rate=args.rate)
+    print(f"幣安: ws://{args.host}:{args.port}/ws  OKX: ws://{args.host}:{args.port}/ws/v5/public", flush=True)
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
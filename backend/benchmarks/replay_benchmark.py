@@ -0,0 +1,76 @@
+"""
+消息回放基準測試
+
+以最快速度將錄製的原始消息回放到 BinanceWebSocket / OkxWebSocket 的消息處理流程，
+測量不含網絡的消息處理吞吐量（消息/秒、ticks/秒）。沒有指定錄製文件時使用合成的ticker消息。
+
+錄製線上消息: 設置環境變量 PRICE_RECORD_DIR 後啟動服務，每個連接會生成一個 .frames 文件。
+
+用法:
+    python -m benchmarks.replay_benchmark [--capture captures/binance_xxx.frames] [--speed 0]
+    python -m benchmarks.replay_benchmark --exchange okx --frames 200000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+
+from app.services.price_service.binance_websocket import BinanceWebSocket
+from app.services.price_service.frame_capture import FrameReader, FrameRecorder, replay_capture
+from app.services.price_service.okx_websocket import OkxWebSocket
+from benchmarks.decoder_benchmark import make_binance_frames, make_okx_frames
+
+CLIENTS = {"binance": BinanceWebSocket, "okx": OkxWebSocket}
+
+
+def make_capture(exchange: str, count: int, path: str) -> None:
+    """將合成的ticker消息寫入錄製文件，消息間隔1毫秒"""
+    frames = make_binance_frames(count) if exchange == "binance" else make_okx_frames(count)
+    recorder = FrameRecorder(path, {"exchange": exchange, "synthetic": True})
+    start_ns = 1700000000000000000
+    for i, frame in enumerate(frames):
+        recorder.write(False, frame, start_ns + i * 1000000)
+    recorder.close()
+
+
+async def run(path: str, exchange: str, speed: float) -> None:
+    client = CLIENTS[exchange]()
+    stats = await replay_capture(client, path, speed=speed)
+    print(f"{exchange} 回放 {path} (速度: {'最快' if speed <= 0 else f'{speed:g}x'})")
+    print(f"  消息數     {stats['frames']:>12,}")
+    print(f"  ticks      {stats['ticks']:>12,}")
+    print(f"  錯誤       {stats['errors']:>12,}")
+    print(f"  耗時       {stats['elapsed']:>12.3f} 秒")
+    if stats["frames_per_sec"]:
+        print(f"  吞吐量     {stats['frames_per_sec']:>12,.0f} 消息/秒  {stats['ticks_per_sec']:>12,.0f} ticks/秒")
+        print(f"             {stats['bytes'] / stats['elapsed'] / 1048576:>12.1f} MB/秒")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="消息回放基準測試")
+    parser.add_argument("--capture", help="錄製文件路徑，不指定時使用合成消息")
+    parser.add_argument("--exchange", choices=sorted(CLIENTS), help="交易所，默認從錄製文件的元數據讀取")
+    parser.add_argument("--frames", type=int, default=200000, help="合成消息數量")
+    parser.add_argument("--speed", type=float, default=0, help="回放速度，1為原速，N為N倍速，0為最快速度")
+    args = parser.parse_args()
+
+    if args.capture:
+        exchange = args.exchange
+        if exchange is None:
+            with FrameReader(args.capture) as reader:
+                exchange = str(reader.metadata.get("exchange", "")).lower()
+        if exchange not in CLIENTS:
+            parser.error("無法從錄製文件判斷交易所，請指定 --exchange")
+        asyncio.run(run(args.capture, exchange, args.speed))
+        return
+
+    for exchange in ([args.exchange] if args.exchange else sorted(CLIENTS)):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f"{exchange}.frames")
+            make_capture(exchange, args.frames, path)
+            asyncio.run(run(path, exchange, args.speed))
+
+
+if __name__ == "__main__":
+    main()
@@ -49,6 +49,21 @@ import { Combobox } from "@/components/ui/combobox";
 const API_BASE_URL =
   import.meta.env.VITE_API_BASE_URL || "http://localhost:8000";
 
+// 本分頁的訂閱使用者ID，存於 sessionStorage（重新整理後不變，每個分頁各自獨立）
+// 後端在所有分頁都取消後才向交易所取消訂閱，一個分頁取消不會影響其他分頁
+const CONSUMER_STORAGE_KEY = "priceMonitorConsumer";
+const getConsumerId = () => {
+  let consumer = sessionStorage.getItem(CONSUMER_STORAGE_KEY);
+  if (!consumer) {
+    // crypto.randomUUID 只在安全上下文（HTTPS / localhost）中可用
+    consumer = window.crypto?.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    sessionStorage.setItem(CONSUMER_STORAGE_KEY, consumer);
+  }
+  return consumer;
+};
+
 // 訂閱表單驗證架構
 const subscribeFormSchema = z.object({
   symbols: z.array(z.string()).min(1, "必須選擇至少一個交易對"),
@@ -328,6 +343,7 @@ const PriceMonitorPage = () => {
           symbol: symbol,
           exchanges: SUPPORTED_EXCHANGES, // 使用所有支持的交易所
           marketType: data.marketType,
+          consumer: getConsumerId(),
         }),
       );
 
@@ -374,6 +390,7 @@ const PriceMonitorPage = () => {
       // 準備請求參數
       const requestData = {
         symbol,
+        consumer: getConsumerId(),
       };
 
       // 如果指定了交易所，則添加到請求中